@@ -0,0 +1,588 @@
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import sqlite3
+
+from app.explanations import PENDING_FACTORS
+from app.store import upsert_latest
+from src.utils import logger
+
+# linha gravada: (ts, student_id, payload_json, risk_score, risk_class, model_version, top_factors_json)
+# linha lida:    (ts, risk_score, risk_class, model_version, top_factors, payload, rowid)
+HISTORY_COLUMNS = ("ts", "risk_score", "risk_class", "model_version", "top_factors", "payload", "rowid")
+# última predição por aluno: (student_id, ts, risk_score, risk_class, model_version, top_factors, rowid)
+LATEST_COLUMNS = ("student_id", "ts", "risk_score", "risk_class", "model_version", "top_factors", "rowid")
+BACKENDS = ("sqlite", "segmented", "memory")
+
+
+class PredictionBackend:
+    """
+    Armazenamento do log de predições. As implementações precisam garantir:
+
+    - `append` atribui ids (rowid) crescentes e retorna o primeiro id do lote;
+    - `history` devolve as linhas de um aluno em ordem (ts, rowid) decrescente,
+      estritamente antes do cursor `before=(ts, rowid)` quando informado;
+    - `count` é o número de linhas hoje disponíveis para leitura;
+    - `latest`/`high_risk` leem a última predição de cada aluno sem varrer o histórico.
+
+    O padrão de `latest`/`high_risk` usa `_latest` (aluno -> última linha) e `_risk_index`,
+    lista ordenada de (-risk_score, student_id) dos alunos com última predição de risco
+    alto: uma página custa O(log alunos + página). Subclasses que usam esse padrão
+    chamam `_reset_latest` no __init__ e só alteram `_latest` pelos helpers abaixo,
+    sempre sob `_lock`.
+    """
+
+    kind = ""
+    _lock: threading.Lock
+    _latest: Dict[str, tuple]
+    _risk_index: List[Tuple[float, str]]
+
+    def append(self, rows: Sequence[tuple]) -> int:
+        raise NotImplementedError
+
+    def history(self, student_id: str, limit: int, before: Optional[Tuple[int, int]] = None) -> List[tuple]:
+        raise NotImplementedError
+
+    def history_many(
+        self, student_ids: Sequence[str], limit: int, payload: bool = True
+    ) -> Dict[str, List[tuple]]:
+        """Até `limit` linhas mais recentes de cada aluno; `payload=False` devolve payload None."""
+        out = {}
+        for sid in student_ids:
+            rows = self.history(sid, limit)
+            out[sid] = rows if payload else [(*r[:5], None, r[6]) for r in rows]
+        return out
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def set_top_factors(self, updates: Sequence[Tuple[int, Optional[str], str]]) -> None:
+        """Grava os top_factors calculados depois (explicação adiada): [(rowid, student_id, json)]."""
+        raise NotImplementedError
+
+    def resolve_pending(self, fallback: Callable[[], str], before_ts: int) -> int:
+        """
+        Troca por `fallback()` os top_factors que ficaram PENDING_FACTORS em linhas com
+        ts < `before_ts` (explicação adiada perdida numa queda do processo) e devolve quantas
+        linhas mudaram. O corte deixa de fora linhas recentes que outro worker vivo ainda tem
+        na fila; `fallback` só é chamado se houver linha pendente. Backends só em memória não
+        sobrevivem ao processo e não têm o que resolver.
+        """
+        return 0
+
+    def latest(self, student_id: str) -> Optional[tuple]:
+        return self._latest.get(student_id)
+
+    def high_risk(
+        self, limit: int, min_score: float = 0.0, after: Optional[Tuple[float, str]] = None
+    ) -> List[tuple]:
+        """
+        Alunos cuja última predição é risk_class=1 e risk_score >= min_score, em ordem
+        (risk_score desc, student_id); `after=(risk_score, student_id)` é o cursor.
+        """
+        out: List[tuple] = []
+        with self._lock:
+            index = self._risk_index
+            i = 0 if after is None else bisect.bisect_right(index, (-float(after[0]), after[1]))
+            while i < len(index) and len(out) < int(limit):
+                neg_score, sid = index[i]
+                if -neg_score < min_score:
+                    break
+                out.append(self._latest[sid])
+                i += 1
+        return out
+
+    def _reset_latest(self) -> None:
+        self._latest = {}
+        self._risk_index = []
+
+    def _set_latest(self, sid: str, item: tuple) -> None:
+        self._forget_latest(sid)
+        self._latest[sid] = item
+        if sid is not None and int(item[3]) == 1:
+            bisect.insort(self._risk_index, (-float(item[2]), sid))
+
+    def _forget_latest(self, sid: str) -> None:
+        current = self._latest.pop(sid, None)
+        if current is not None and sid is not None and int(current[3]) == 1:
+            key = (-float(current[2]), sid)
+            i = bisect.bisect_left(self._risk_index, key)
+            if i < len(self._risk_index) and self._risk_index[i] == key:
+                del self._risk_index[i]
+
+    def _remember_latest(self, sid: str, ts: int, score, cls, ver, top, rowid: int) -> None:
+        current = self._latest.get(sid)
+        if current is None or (int(ts), rowid) > (current[1], current[6]):
+            self._set_latest(sid, (sid, int(ts), score, cls, ver, top, rowid))
+
+    def _amend_latest(self, sid: Optional[str], rowid: int, top: str) -> None:
+        current = self._latest.get(sid)
+        if current is not None and current[6] == rowid:
+            # mesmo score/classe: a posição em _risk_index não muda
+            self._latest[sid] = (*current[:5], top, rowid)
+
+    def close(self) -> None:
+        pass
+
+
+def _before_key(ts: int, rowid: int, before: Optional[Tuple[int, int]]) -> bool:
+    return before is None or (int(ts), int(rowid)) < (int(before[0]), int(before[1]))
+
+
+class SQLiteBackend(PredictionBackend):
+    """
+    A tabela `predictions` (app/store.py). `connect` devolve a conexão da thread atual;
+    `transaction` + `insert` permitem gravar outras tabelas (features tipadas,
+    histogramas de drift) na mesma transação do INSERT.
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection]):
+        self.connect = connect
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self.connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+
+    @staticmethod
+    def insert(conn: sqlite3.Connection, rows: Sequence[tuple]) -> int:
+        conn.executemany(
+            """INSERT INTO predictions(ts, student_id, payload, risk_score, risk_class, model_version, top_factors)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [r[:7] for r in rows],
+        )
+        # dentro de BEGIN IMMEDIATE ninguém mais insere: os rowids do lote são contíguos
+        last = conn.execute("SELECT MAX(rowid) FROM predictions").fetchone()[0]
+        first = int(last) - len(rows) + 1
+        upsert_latest(conn, first, rows)
+        return first
+
+    def append(self, rows: Sequence[tuple]) -> int:
+        with self.transaction() as conn:
+            return self.insert(conn, rows)
+
+    def history(self, student_id: str, limit: int, before: Optional[Tuple[int, int]] = None) -> List[tuple]:
+        if before is None:
+            where, params = "student_id = ?", (student_id,)
+        else:
+            where = "student_id = ? AND (ts < ? OR (ts = ? AND rowid < ?))"
+            params = (student_id, before[0], before[0], before[1])
+        return self.connect().execute(
+            f"""SELECT ts, risk_score, risk_class, model_version, top_factors, payload, rowid
+               FROM predictions
+               WHERE {where}
+               ORDER BY ts DESC, rowid DESC
+               LIMIT ?""",
+            (*params, int(limit)),
+        ).fetchall()
+
+    def history_many(
+        self, student_ids: Sequence[str], limit: int, payload: bool = True, chunk: int = 500
+    ) -> Dict[str, List[tuple]]:
+        """
+        Uma consulta por bloco de ids: ROW_NUMBER() por aluno sobre o índice
+        (student_id, ts), sem ler a coluna payload quando ela não foi pedida.
+        """
+        conn = self.connect()
+        payload_col = "payload" if payload else "NULL"
+        out: Dict[str, List[tuple]] = {sid: [] for sid in student_ids}
+        ids = list(out)
+        for i in range(0, len(ids), int(chunk)):
+            part = ids[i : i + int(chunk)]
+            rows = conn.execute(
+                f"""SELECT student_id, ts, risk_score, risk_class, model_version, top_factors, payload, rowid
+                   FROM (
+                       SELECT student_id, ts, risk_score, risk_class, model_version, top_factors,
+                              {payload_col} AS payload, rowid,
+                              ROW_NUMBER() OVER (PARTITION BY student_id ORDER BY ts DESC, rowid DESC) AS rn
+                       FROM predictions
+                       WHERE student_id IN ({", ".join("?" * len(part))})
+                   )
+                   WHERE rn <= ?
+                   ORDER BY student_id, ts DESC, rowid DESC""",
+                (*part, int(limit)),
+            ).fetchall()
+            for sid, *rest in rows:
+                out[sid].append(tuple(rest))
+        return out
+
+    def count(self) -> int:
+        return int(self.connect().execute("SELECT COUNT(*) FROM predictions").fetchone()[0])
+
+    def set_top_factors(self, updates: Sequence[Tuple[int, Optional[str], str]]) -> None:
+        with self.transaction() as conn:
+            conn.executemany(
+                "UPDATE predictions SET top_factors = ? WHERE rowid = ?",
+                [(top, int(rowid)) for rowid, _, top in updates],
+            )
+            conn.executemany(
+                "UPDATE student_latest SET top_factors = ? WHERE student_id = ? AND pred_rowid = ?",
+                [(top, sid, int(rowid)) for rowid, sid, top in updates if sid is not None],
+            )
+
+    def resolve_pending(self, fallback: Callable[[], str], before_ts: int) -> int:
+        # literal (não parâmetro) para o planner usar o índice parcial idx_predictions_pending
+        select = f"SELECT rowid, student_id FROM predictions WHERE top_factors = '{PENDING_FACTORS}' AND ts < ?"
+        if self.connect().execute(select + " LIMIT 1", (int(before_ts),)).fetchone() is None:
+            return 0
+        top = fallback()  # pode carregar o modelo: fora do lock de escrita
+        with self.transaction() as conn:
+            # relido sob o lock: um write-back que chegou antes não é sobrescrito
+            pending = conn.execute(select, (int(before_ts),)).fetchall()
+            conn.executemany("UPDATE predictions SET top_factors = ? WHERE rowid = ?", [(top, r) for r, _ in pending])
+            conn.executemany(
+                "UPDATE student_latest SET top_factors = ? WHERE student_id = ? AND pred_rowid = ?",
+                [(top, sid, r) for r, sid in pending if sid is not None],
+            )
+        return len(pending)
+
+    def latest(self, student_id: str) -> Optional[tuple]:
+        return self.connect().execute(
+            """SELECT student_id, ts, risk_score, risk_class, model_version, top_factors, pred_rowid
+               FROM student_latest WHERE student_id = ?""",
+            (student_id,),
+        ).fetchone()
+
+    def high_risk(
+        self, limit: int, min_score: float = 0.0, after: Optional[Tuple[float, str]] = None
+    ) -> List[tuple]:
+        where, params = "risk_class = 1 AND risk_score >= ?", [float(min_score)]
+        if after is not None:
+            where += " AND (risk_score < ? OR (risk_score = ? AND student_id > ?))"
+            params += [float(after[0]), float(after[0]), after[1]]
+        return self.connect().execute(
+            f"""SELECT student_id, ts, risk_score, risk_class, model_version, top_factors, pred_rowid
+               FROM student_latest
+               WHERE {where}
+               ORDER BY risk_score DESC, student_id
+               LIMIT ?""",
+            (*params, int(limit)),
+        ).fetchall()
+
+
+class _Entry(NamedTuple):
+    ts: int
+    rowid: int
+    segment: int
+    offset: int
+
+
+class SegmentedLogBackend(PredictionBackend):
+    """
+    Log append-only em segmentos NDJSON (`segment-<primeiro rowid>.ndjson`) com índice
+    em memória student_id -> [(ts, rowid, segmento, offset)]. O índice é reconstruído
+    lendo os segmentos na abertura; uma última linha incompleta (queda no meio da
+    escrita) é descartada e o arquivo truncado. Segmentos fecham ao passar de
+    `segment_bytes`; `fsync=True` força o disco a cada lote. Com `max_segments` > 0,
+    os segmentos mais antigos são apagados na rotação, junto com as entradas do índice
+    e os top_factors adiados (`_amended`) das linhas que estavam neles.
+    """
+
+    kind = "segmented"
+
+    def __init__(
+        self,
+        directory: Path,
+        segment_bytes: int = 64 * 1024 * 1024,
+        fsync: bool = False,
+        max_segments: int = 0,
+    ):
+        self.directory = Path(directory)
+        self.segment_bytes = max(1024, int(segment_bytes))
+        self.fsync = bool(fsync)
+        self.max_segments = max(0, int(max_segments))
+        self._lock = threading.Lock()
+        self._index: Dict[str, List[_Entry]] = {}
+        self._reset_latest()
+        # top_factors gravados depois (explicação adiada): registros {"amend": rowid, ...} no log
+        self._amended: Dict[int, str] = {}
+        # linhas gravadas com PENDING_FACTORS e ainda sem amend: rowid -> (student_id, ts)
+        self._pending: Dict[int, Tuple[Optional[str], int]] = {}
+        self._segments: List[Path] = []
+        # _Entry.segment é absoluto: segmento i está em _segments[i - _dropped]
+        self._dropped = 0
+        self._min_rowid = 1
+        self._count = 0
+        self._next_rowid = 1
+        self._active = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _segment_path(self, first_rowid: int) -> Path:
+        return self.directory / f"segment-{first_rowid:012d}.ndjson"
+
+    @staticmethod
+    def _first_rowid(path: Path) -> int:
+        return int(path.stem.split("-", 1)[1])
+
+    def _load(self) -> None:
+        paths = sorted(self.directory.glob("segment-*.ndjson"))
+        if paths:
+            self._min_rowid = self._first_rowid(paths[0])
+        for path in paths:
+            seg = len(self._segments)
+            self._segments.append(path)
+            good = 0
+            with open(path, "rb") as f:
+                for line in iter(f.readline, b""):
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break
+                    if "amend" in rec:
+                        self._amend_record(rec)
+                    else:
+                        self._index_record(rec, seg, good)
+                    good += len(line)
+            if good < path.stat().st_size:
+                logger.warning("segment_truncated", extra={"segment": str(path), "offset": good})
+                with open(path, "r+b") as f:
+                    f.truncate(good)
+        self._drop_old_segments()
+
+    def _index_record(self, rec: dict, seg: int, offset: int) -> None:
+        rowid = int(rec["rowid"])
+        self._index.setdefault(rec["student_id"], []).append(_Entry(int(rec["ts"]), rowid, seg, offset))
+        self._remember_latest(
+            rec["student_id"], rec["ts"], rec["risk_score"], rec["risk_class"],
+            rec["model_version"], rec["top_factors"], rowid,
+        )
+        if rec["top_factors"] == PENDING_FACTORS:
+            self._pending[rowid] = (rec["student_id"], int(rec["ts"]))
+        self._count += 1
+        self._next_rowid = max(self._next_rowid, rowid + 1)
+
+    def _amend_record(self, rec: dict) -> None:
+        rowid = int(rec["amend"])
+        if rowid < self._min_rowid:
+            return  # linha de um segmento já apagado
+        self._amended[rowid] = rec["top_factors"]
+        self._pending.pop(rowid, None)
+        self._amend_latest(rec.get("student_id"), rowid, rec["top_factors"])
+
+    def _open_active(self):
+        if self._active is None or self._active.tell() >= self.segment_bytes:
+            if self._active is not None:
+                self._active.close()
+            if self._segments and self._segments[-1].stat().st_size < self.segment_bytes:
+                path = self._segments[-1]
+            else:
+                path = self._segment_path(self._next_rowid)
+                self._segments.append(path)
+                self._drop_old_segments()
+            self._active = open(path, "ab")
+        return self._active
+
+    def _drop_old_segments(self) -> None:
+        """Apaga os segmentos além de `max_segments` e tudo que o índice guardava deles."""
+        if not self.max_segments or len(self._segments) <= self.max_segments:
+            return
+        while len(self._segments) > self.max_segments:
+            self._segments.pop(0).unlink(missing_ok=True)
+            self._dropped += 1
+        self._min_rowid = self._first_rowid(self._segments[0])
+        for sid in list(self._index):
+            entries = self._index[sid]
+            # entradas de cada aluno em ordem de rowid (ordem de escrita)
+            k = 0
+            while k < len(entries) and entries[k].rowid < self._min_rowid:
+                k += 1
+            if k:
+                del entries[:k]
+                self._count -= k
+            if not entries:
+                del self._index[sid]
+                self._forget_latest(sid)
+        self._amended = {rowid: top for rowid, top in self._amended.items() if rowid >= self._min_rowid}
+        self._pending = {rowid: p for rowid, p in self._pending.items() if rowid >= self._min_rowid}
+
+    def append(self, rows: Sequence[tuple]) -> int:
+        with self._lock:
+            f = self._open_active()
+            seg = self._dropped + len(self._segments) - 1
+            first = self._next_rowid
+            offset = f.tell()
+            lines = []
+            for i, r in enumerate(rows):
+                ts, sid, payload, score, cls, ver, top = r[:7]
+                rec = {
+                    "rowid": first + i, "ts": int(ts), "student_id": sid, "payload": payload,
+                    "risk_score": score, "risk_class": cls, "model_version": ver, "top_factors": top,
+                }
+                line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+                lines.append(line)
+                self._index_record(rec, seg, offset)
+                offset += len(line)
+            f.write(b"".join(lines))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            return first
+
+    def set_top_factors(self, updates: Sequence[Tuple[int, Optional[str], str]]) -> None:
+        with self._lock:
+            self._write_amends(updates)
+
+    def resolve_pending(self, fallback: Callable[[], str], before_ts: int) -> int:
+        with self._lock:
+            rows = [(rowid, sid) for rowid, (sid, ts) in sorted(self._pending.items()) if ts < int(before_ts)]
+        if not rows:
+            return 0
+        top = fallback()
+        with self._lock:
+            # só as que continuam pendentes: um write-back que chegou antes não é sobrescrito
+            updates = [(rowid, sid, top) for rowid, sid in rows if rowid in self._pending]
+            if updates:
+                self._write_amends(updates)
+        return len(updates)
+
+    def _write_amends(self, updates: Sequence[Tuple[int, Optional[str], str]]) -> None:
+        f = self._open_active()
+        lines = []
+        for rowid, sid, top in updates:
+            rec = {"amend": int(rowid), "student_id": sid, "top_factors": top}
+            lines.append((json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8"))
+            self._amend_record(rec)
+        f.write(b"".join(lines))
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def history(self, student_id: str, limit: int, before: Optional[Tuple[int, int]] = None) -> List[tuple]:
+        with self._lock:
+            entries = [e for e in self._index.get(student_id, ()) if _before_key(e.ts, e.rowid, before)]
+            entries.sort(key=lambda e: (e.ts, e.rowid), reverse=True)
+            entries = entries[: int(limit)]
+            amended = {e.rowid: self._amended[e.rowid] for e in entries if e.rowid in self._amended}
+            paths = {e.segment: self._segments[e.segment - self._dropped] for e in entries}
+            if self._active is not None:
+                self._active.flush()
+        out = []
+        handles: Dict[int, object] = {}
+        try:
+            for e in entries:
+                if e.segment not in handles:
+                    try:
+                        handles[e.segment] = open(paths[e.segment], "rb")
+                    except FileNotFoundError:
+                        handles[e.segment] = None  # apagado pela rotação depois da leitura do índice
+                f = handles[e.segment]
+                if f is None:
+                    continue
+                f.seek(e.offset)
+                rec = json.loads(f.readline())
+                if e.rowid in amended:
+                    rec["top_factors"] = amended[e.rowid]
+                out.append(tuple(rec[c] for c in HISTORY_COLUMNS))
+        finally:
+            for f in handles.values():
+                if f is not None:
+                    f.close()
+        return out
+
+    def count(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+
+
+class RingBufferBackend(PredictionBackend):
+    """
+    Só em memória, com as últimas `capacity` predições (as mais antigas saem primeiro).
+    Para deploys stateless de alto volume: nada é gravado em disco e o histórico some
+    no restart.
+    """
+
+    kind = "memory"
+
+    def __init__(self, capacity: int = 100_000):
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._rows: Deque[tuple] = deque()
+        self._by_student: Dict[str, Deque[tuple]] = {}
+        self._reset_latest()
+        self._amended: Dict[int, str] = {}
+        self._next_rowid = 1
+
+    def append(self, rows: Sequence[tuple]) -> int:
+        with self._lock:
+            first = self._next_rowid
+            for r in rows:
+                ts, sid, payload, score, cls, ver, top = r[:7]
+                item = (int(ts), score, cls, ver, top, payload, self._next_rowid, sid)
+                self._next_rowid += 1
+                self._rows.append(item)
+                self._by_student.setdefault(sid, deque()).append(item)
+                self._remember_latest(sid, ts, score, cls, ver, top, item[6])
+                if len(self._rows) > self.capacity:
+                    old = self._rows.popleft()
+                    self._amended.pop(old[6], None)
+                    # mesma ordem de inserção: o mais antigo do aluno é o que saiu do anel
+                    per_student = self._by_student[old[7]]
+                    per_student.popleft()
+                    if not per_student:
+                        del self._by_student[old[7]]
+                        self._forget_latest(old[7])
+            return first
+
+    def history(self, student_id: str, limit: int, before: Optional[Tuple[int, int]] = None) -> List[tuple]:
+        with self._lock:
+            items = [
+                (*it[:4], self._amended.get(it[6], it[4]), *it[5:7])
+                for it in self._by_student.get(student_id, ())
+                if _before_key(it[0], it[6], before)
+            ]
+        items.sort(key=lambda it: (it[0], it[6]), reverse=True)
+        return items[: int(limit)]
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def set_top_factors(self, updates: Sequence[Tuple[int, Optional[str], str]]) -> None:
+        with self._lock:
+            oldest = self._rows[0][6] if self._rows else self._next_rowid
+            for rowid, sid, top in updates:
+                if int(rowid) >= oldest:
+                    self._amended[int(rowid)] = top
+                    self._amend_latest(sid, int(rowid), top)
+
+
+def open_backend(
+    kind: str,
+    connect: Optional[Callable[[], sqlite3.Connection]] = None,
+    directory: Optional[Path] = None,
+    capacity: int = 100_000,
+    segment_bytes: int = 64 * 1024 * 1024,
+    max_segments: int = 0,
+) -> PredictionBackend:
+    """Cria o backend pelo nome (PREDICTION_STORE_BACKEND)."""
+    kind = (kind or "sqlite").lower()
+    if kind == "sqlite":
+        if connect is None:
+            raise ValueError("backend sqlite precisa de `connect`")
+        return SQLiteBackend(connect)
+    if kind == "segmented":
+        if directory is None:
+            raise ValueError("backend segmented precisa de `directory`")
+        return SegmentedLogBackend(directory, segment_bytes=segment_bytes, max_segments=max_segments)
+    if kind == "memory":
+        return RingBufferBackend(capacity)
+    raise ValueError(f"PREDICTION_STORE_BACKEND deve ser um de {BACKENDS}, recebido: {kind!r}")
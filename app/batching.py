@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+from prometheus_client import Histogram
+
+from src.utils import logger
+
+COALESCE_BATCH_SIZE = Histogram(
+    "predict_coalesce_batch_size",
+    "Quantidade de requisições agrupadas por chamada ao modelo",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+COALESCE_QUEUE_WAIT = Histogram(
+    "predict_coalesce_queue_wait_seconds",
+    "Tempo que uma requisição espera na fila até o lote ser executado",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+
+class MicroBatcher:
+    """
+    Agrupa chamadas concorrentes de uma linha em um único lote.
+
+    Cada chamador fica bloqueado em `submit` até o lote em que caiu ser
+    processado. O lote fecha quando atinge `max_batch` itens ou quando a
+    janela `window_ms` (contada a partir do primeiro item) expira.
+    `fn` recebe a lista de itens e devolve uma lista de resultados na mesma ordem;
+    um resultado que é uma exceção é levantado só para aquele chamador. Se `fn`
+    levantar, cada item é reexecutado sozinho: um `fn` com efeitos colaterais (ex:
+    gravar o log) deve devolver exceções por item em vez de levantar depois de
+    já ter gravado parte do lote.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch: int = 64, window_ms: float = 2.0):
+        self.fn = fn
+        self.max_batch = max(1, int(max_batch))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._closed = False
+        # `submit` e `close` checam/enfileiram sob o mesmo lock: nada entra depois do sentinela
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="predict-coalescer", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> Any:
+        fut: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher encerrado.")
+            self._queue.put((item, fut, time.perf_counter()))
+        return fut.result(timeout=timeout)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout=5)
+        # worker preso em `fn` além do timeout: quem ainda está na fila recebe erro em vez de esperar para sempre
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is not None:
+                pending[1].set_exception(RuntimeError("MicroBatcher encerrado."))
+
+    def _collect(self) -> List[tuple]:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = first[2] + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                break
+            batch.append(nxt)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            started = time.perf_counter()
+            for _, _, t_enq in batch:
+                COALESCE_QUEUE_WAIT.observe(started - t_enq)
+            COALESCE_BATCH_SIZE.observe(len(batch))
+            self._dispatch(batch)
+            if self._closed and self._queue.empty():
+                return
+
+    def _dispatch(self, batch: List[tuple]) -> None:
+        items = [b[0] for b in batch]
+        try:
+            results = self.fn(items)
+        except Exception:
+            logger.exception("coalesced_batch_failed")
+            # isola o item problemático: os demais chamadores ainda recebem resultado
+            for item, fut, _ in batch:
+                try:
+                    fut.set_result(self.fn([item])[0])
+                except Exception as e:
+                    fut.set_exception(e)
+            return
+        if len(results) != len(items):
+            logger.error("coalesced_batch_size_mismatch", extra={"items": len(items), "results": len(results)})
+            err = RuntimeError(f"lote devolveu {len(results)} resultados para {len(items)} itens")
+            for _, fut, _ in batch:
+                fut.set_exception(err)
+            return
+        for (_, fut, _), res in zip(batch, results):
+            if isinstance(res, BaseException):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from prometheus_client import Counter, Gauge
+
+CACHE_HITS = Counter("app_cache_hits_total", "Acertos de cache em memória", ["cache"])
+CACHE_MISSES = Counter("app_cache_misses_total", "Faltas de cache em memória", ["cache"])
+CACHE_ENTRIES = Gauge("app_cache_entries", "Entradas atualmente no cache", ["cache"])
+
+
+def canonical_hash(payload: Any) -> str:
+    """SHA-256 estável do payload canônico (chaves ordenadas), igual entre processos e reinícios."""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    Cache LRU limitado com expiração por TTL (thread-safe).
+
+    `generation` amarra as entradas a um estado externo (ex: os artefatos carregados):
+    quando `ensure_generation` recebe outro valor, o cache é esvaziado.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300.0):
+        self.name = name
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation: Any = None
+        CACHE_ENTRIES.labels(cache=name).set_function(lambda: len(self._data))
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def ensure_generation(self, generation: Any) -> None:
+        with self._lock:
+            if self._generation != generation:
+                self._data.clear()
+                self._generation = generation
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (self.ttl <= 0 or item[0] > now):
+                self._data.move_to_end(key)
+                CACHE_HITS.labels(cache=self.name).inc()
+                return item[1]
+            if item is not None:
+                del self._data[key]
+        CACHE_MISSES.labels(cache=self.name).inc()
+        return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.utils import logger
+
+# top_factors gravado enquanto o SHAP adiado não terminou
+PENDING_FACTORS = '"__pending__"'
+
+EXPLAIN_QUEUE_DEPTH = Gauge("explain_queue_depth", "Explicações adiadas aguardando um worker")
+EXPLAIN_JOBS = Counter("explain_jobs_total", "Explicações adiadas por resultado", ["status"])
+EXPLAIN_BATCH_SECONDS = Histogram(
+    "explain_batch_seconds",
+    "Duração de um lote de explicações adiadas (SHAP + write-back)",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# job: (rowid, student_id, linha de features do FeaturePlan)
+Job = Tuple[int, Optional[str], List[Any]]
+
+
+class ExplanationPool:
+    """
+    Workers que calculam as explicações adiadas (explain=deferred) fora do request.
+
+    - `submit` nunca bloqueia: com a fila cheia devolve os jobs recusados, para o
+      chamador gravar um fallback em vez de deixar a linha pendente para sempre;
+    - cada worker junta até `batch_size` jobs e chama `explain` (uma chamada SHAP
+      por lote) e depois `write_back([(rowid, student_id, top_factors_json)])`;
+    - se o lote falhar, ou se o `close` expirar com jobs ainda na fila, as linhas
+      recebem `fallback()` (as importâncias globais). Linhas de jobs perdidos numa
+      queda do processo ficam para o `resolve_pending` do backend no próximo startup.
+    """
+
+    def __init__(
+        self,
+        explain: Callable[[Sequence[List[Any]]], List[str]],
+        write_back: Callable[[List[Tuple[int, Optional[str], str]]], None],
+        workers: int = 2,
+        maxsize: int = 1000,
+        batch_size: int = 64,
+        fallback: Optional[Callable[[], str]] = None,
+    ):
+        self.explain = explain
+        self.write_back = write_back
+        self.fallback = fallback
+        self.batch_size = max(1, int(batch_size))
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._closed = False
+        EXPLAIN_QUEUE_DEPTH.set_function(self._queue.qsize)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"explain-worker-{i}", daemon=True)
+            for i in range(max(1, int(workers)))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, jobs: Sequence[Job]) -> List[Job]:
+        rejected = []
+        for job in jobs:
+            if self._closed:
+                rejected.append(job)
+                continue
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                rejected.append(job)
+        if rejected:
+            EXPLAIN_JOBS.labels(status="rejected").inc(len(rejected))
+        return rejected
+
+    def flush(self) -> None:
+        """Bloqueia até todos os jobs enfileirados terem sido gravados."""
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout=30)
+        # workers presos no SHAP: o que ainda está na fila recebe o fallback
+        leftover: List[Job] = []
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                leftover.append(job)
+            self._queue.task_done()
+        if leftover:
+            logger.warning("deferred_explain_abandoned", extra={"rows": len(leftover)})
+            self._write_fallback(leftover)
+
+    def _write_fallback(self, batch: List[Job]) -> None:
+        if self.fallback is None:
+            return
+        try:
+            top = self.fallback()
+            self.write_back([(job[0], job[1], top) for job in batch])
+            EXPLAIN_JOBS.labels(status="fallback").inc(len(batch))
+        except Exception as e:
+            logger.exception("deferred_explain_fallback_failed", extra={"error": str(e), "rows": len(batch)})
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            batch: List[Job] = []
+            taken = 1
+            if first is None:
+                stop = True
+            else:
+                batch.append(first)
+            while batch and len(batch) < self.batch_size:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+
+            if batch:
+                t0 = time.perf_counter()
+                try:
+                    tops = self.explain([job[2] for job in batch])
+                    self.write_back([(job[0], job[1], top) for job, top in zip(batch, tops)])
+                    EXPLAIN_JOBS.labels(status="done").inc(len(batch))
+                except Exception as e:
+                    EXPLAIN_JOBS.labels(status="failed").inc(len(batch))
+                    logger.exception("deferred_explain_failed", extra={"error": str(e), "rows": len(batch)})
+                    self._write_fallback(batch)
+                EXPLAIN_BATCH_SECONDS.observe(time.perf_counter() - t0)
+            for _ in range(taken):
+                self._queue.task_done()
@@ -1,12 +1,62 @@
 from __future__ import annotations
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from prometheus_client import make_asgi_app
-from app.routes import router
+from app.routes import (
+    STORE,
+    router,
+    shutdown_coalescer,
+    shutdown_drift_pool,
+    shutdown_drift_scheduler,
+    shutdown_explanation_pool,
+    shutdown_log_writer,
+    shutdown_prediction_backend,
+    shutdown_multivariate_scheduler,
+    shutdown_pending_explanations_sweep,
+    shutdown_retention_worker,
+    shutdown_warmup,
+    start_drift_scheduler,
+    start_multivariate_scheduler,
+    start_pending_explanations_sweep,
+    start_retention_worker,
+    start_warmup,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # migrações do SQLite rodam uma vez, antes do primeiro request
+    STORE.ensure_schema()
+    # explicações adiadas que um processo anterior deixou pendentes
+    start_pending_explanations_sweep()
+    # artefatos + explainer + predições sintéticas; o /ready só responde 200 depois disso
+    start_warmup()
+    # drift recalculado em background (gauges drift_psi no /metrics)
+    start_drift_scheduler()
+    # drift multivariado: classificador de domínio em processo separado
+    start_multivariate_scheduler()
+    # retenção opcional: arquiva predições antigas fora do SQLite
+    start_retention_worker()
+    yield
+    shutdown_pending_explanations_sweep()
+    shutdown_warmup()
+    shutdown_retention_worker()
+    shutdown_multivariate_scheduler()
+    shutdown_drift_scheduler()
+    shutdown_drift_pool()
+    shutdown_coalescer()
+    # grava o que ainda estiver na fila do log antes de sair
+    shutdown_log_writer()
+    # explicações adiadas das últimas linhas gravadas
+    shutdown_explanation_pool()
+    shutdown_prediction_backend()
+    STORE.close()
 
 
 def create_app() -> FastAPI:
     """PEDE Passos Mágicos - Defasagem Risk API."""
-    app = FastAPI(title="PEDE Passos Mágicos - Defasagem Risk API", version="1.0.0")
+    app = FastAPI(title="PEDE Passos Mágicos - Defasagem Risk API", version="1.0.0", lifespan=lifespan)
 
     app.include_router(router)
 
@@ -0,0 +1,477 @@
+from __future__ import annotations
+
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from prometheus_client import Gauge, Histogram
+
+from app.cache import canonical_hash
+from app.store import feature_columns
+from src.feature_engineering import FeaturePlan
+from src.utils import (
+    OTHER_BUCKET,
+    RISK_SCORE_BINS,
+    UNSEEN_BUCKET,
+    build_category_vocab,
+    category_hash,
+    histogram_counts,
+    logger,
+)
+
+DRIFT_PSI = Gauge("drift_psi", "PSI por feature (referência de treino vs produção)", ["feature", "kind"])
+DRIFT_SAMPLES = Gauge("drift_production_samples", "Predições consideradas no último cálculo de drift")
+DRIFT_LAST_RUN = Gauge("drift_last_run_timestamp_seconds", "Unix time do último cálculo de drift", ["job"])
+DRIFT_COMPUTE_SECONDS = Histogram(
+    "drift_compute_seconds",
+    "Duração de cada cálculo de drift em background",
+    ["job"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0),
+)
+DRIFT_DOMAIN_AUC = Gauge("drift_domain_classifier_auc", "AUC do classificador treino vs produção (drift multivariado)")
+DRIFT_DOMAIN_IMPORTANCE = Gauge(
+    "drift_domain_feature_importance", "Importância das features que mais separam treino e produção", ["feature"]
+)
+
+# granularidades dos rollups por janela (segundos; janelas alinhadas em UTC)
+WINDOWS = {"hour": 3600, "day": 86400}
+
+# a distribuição do risk_score predito é monitorada como mais uma "feature" numérica
+SCORE_FEATURE = "risk_score"
+
+
+class ReservoirSample:
+    """
+    Amostra de tamanho fixo dos vetores de features de produção, com decaimento
+    temporal e persistida no SQLite (tabela drift_reservoir).
+
+    Usa amostragem ponderada (Efraimidis-Spirakis) com peso exp(decay * ts): em
+    escala log, a prioridade é decay * ts + ruído Gumbel e ficam as `size` maiores.
+    Uma linha com `half_life` segundos a mais pesa o dobro, então a amostra
+    acompanha o tráfego recente sem crescer.
+    """
+
+    def __init__(self, signature: str, columns: Sequence[str], size: int = 5000, half_life: float = 86400.0):
+        self.signature = signature
+        self.columns = list(columns)
+        self.size = int(size)
+        self.decay = math.log(2) / half_life if half_life > 0 else 0.0
+        self._rng = np.random.default_rng()
+
+    def offer(self, conn: sqlite3.Connection, items: Sequence[Tuple[int, Dict[str, Any]]]) -> None:
+        """Considera um lote (ts, features) para a amostra. Roda dentro da transação do lote."""
+        if self.size <= 0 or not items:
+            return
+        u = np.clip(self._rng.random(len(items)), 1e-12, 1 - 1e-12)
+        ts = np.asarray([int(t) for t, _ in items], dtype=float)
+        priority = self.decay * ts - np.log(-np.log(u))
+
+        count, lowest = conn.execute(
+            "SELECT COUNT(*), MIN(priority) FROM drift_reservoir WHERE signature = ?", (self.signature,)
+        ).fetchone()
+        threshold = lowest if count >= self.size else -np.inf
+        picked = np.nonzero(priority > threshold)[0]
+        if picked.size == 0:
+            return
+
+        rows = []
+        for i in picked:
+            t, feats = items[i]
+            vec = [feats.get(col) for col in self.columns]
+            vec = [None if v is None or (isinstance(v, float) and math.isnan(v)) else float(v) for v in vec]
+            rows.append((self.signature, float(priority[i]), int(t), json.dumps(vec)))
+        conn.executemany("INSERT INTO drift_reservoir(signature, priority, ts, vec) VALUES (?, ?, ?, ?)", rows)
+
+        if count + len(rows) > self.size:
+            conn.execute(
+                """DELETE FROM drift_reservoir WHERE signature = ? AND priority < (
+                       SELECT priority FROM drift_reservoir WHERE signature = ?
+                       ORDER BY priority DESC LIMIT 1 OFFSET ?)""",
+                (self.signature, self.signature, self.size - 1),
+            )
+
+    def load(self, conn: sqlite3.Connection) -> Tuple[int, Dict[str, np.ndarray]]:
+        """(n, {coluna: valores}) com NaN onde o valor faltava."""
+        vecs = [json.loads(v) for (v,) in conn.execute(
+            "SELECT vec FROM drift_reservoir WHERE signature = ?", (self.signature,)
+        )]
+        if not vecs:
+            return 0, {col: np.empty(0) for col in self.columns}
+        matrix = np.array(vecs, dtype=float)
+        return len(vecs), {col: matrix[:, j] for j, col in enumerate(self.columns)}
+
+
+class DriftAggregator:
+    """
+    Histogramas de drift incrementais sobre os `drift_bins` do metadata.json.
+
+    As contagens por (feature, bin) ficam na tabela drift_hist e são atualizadas na
+    mesma transação que grava cada lote de predições, usando os vetores de features
+    já calculados no request (sem json.loads). Linhas gravadas por fora do log
+    (ex: bancos antigos) são contabilizadas uma única vez a partir de um watermark
+    de rowid. O /drift só lê O(features x bins) contagens, mantidas em memória
+    enquanto o watermark não muda. As mesmas contagens também são acumuladas por
+    janela de hora/dia (drift_window_hist) para o histórico de drift.
+
+    Colunas categóricas usam o vocabulário limitado de `drift_reference.categorical`
+    (top-K + __other__ + __unseen__): o "bin" é o índice do bucket, então as tabelas
+    têm no máximo K+2 linhas por feature, qualquer que seja a cardinalidade.
+    O risk_score de cada predição é contado em RISK_SCORE_BINS como SCORE_FEATURE.
+    Cada lote também alimenta um ReservoirSample das features numéricas.
+    """
+
+    def __init__(
+        self,
+        meta: Dict[str, Any],
+        plan: FeaturePlan,
+        reservoir_size: int = 5000,
+        reservoir_half_life: float = 86400.0,
+    ):
+        bins_map = {k: v for k, v in (meta.get("drift_bins", {}) or {}).items() if k != SCORE_FEATURE}
+        self.bins = {col: np.asarray(b, dtype=float) for col, b in bins_map.items()}
+        self.bins[SCORE_FEATURE] = RISK_SCORE_BINS
+        self.plan = plan
+
+        self.categorical: Dict[str, Dict[str, Any]] = {}
+        reference = (meta.get("drift_reference") or {}).get("categorical") or {}
+        for col, vocab in reference.items():
+            if col not in plan.feature_order or col in self.bins:
+                continue
+            if "categories" not in vocab:
+                # metadata antigo: tabela de frequência completa
+                vocab = build_category_vocab(vocab)
+            self.categorical[col] = vocab
+        self._cat_lookup = {
+            col: (
+                {c: i for i, c in enumerate(v["categories"])},
+                frozenset(v["tail_hashes"]),
+                int(v["hash_buckets"]),
+            )
+            for col, v in self.categorical.items()
+        }
+
+        self.signature = canonical_hash(
+            {"bins": bins_map, "score_bins": RISK_SCORE_BINS.tolist(), "categorical": {c: [v["categories"], v["tail_hashes"]] for c, v in self.categorical.items()}}
+        )[:16]
+        monitored = list(self.bins) + list(self.categorical)
+        self._index = {col: plan.feature_order.index(col) for col in monitored if col in plan.feature_order}
+        self.reservoir = ReservoirSample(self.signature, list(self.bins), reservoir_size, reservoir_half_life)
+        self._lock = threading.Lock()
+        self._cached: Optional[Tuple[Any, int, Dict[str, np.ndarray]]] = None
+        self._sample_cached: Optional[Tuple[Any, int, Dict[str, np.ndarray]]] = None
+
+    def features(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Valores (já tipados) das features monitoradas (numéricas e categóricas), a partir do FeaturePlan."""
+        return self.features_from_row(self.plan.row(payload))
+
+    def features_from_row(self, row: Sequence[Any]) -> Dict[str, Any]:
+        """Mesmo que features(), a partir de uma linha já calculada por FeaturePlan.row."""
+        return {col: row[i] for col, i in self._index.items()}
+
+    def _state(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        r = conn.execute("SELECT n_rows, last_rowid FROM drift_state WHERE signature = ?", (self.signature,)).fetchone()
+        return (int(r[0]), int(r[1])) if r else (0, 0)
+
+    def bucket_labels(self, col: str) -> List[str]:
+        return list(self.categorical[col]["categories"]) + [OTHER_BUCKET, UNSEEN_BUCKET]
+
+    @staticmethod
+    def reference_score(meta: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Contagens do risk_score na validação do treino (None em modelos antigos)."""
+        counts = (meta.get("drift_reference") or {}).get(SCORE_FEATURE)
+        return np.asarray(counts, dtype=float) if counts else None
+
+    def reference_categorical(self) -> Dict[str, np.ndarray]:
+        """Contagens de treino por bucket, na mesma ordem de bucket_labels."""
+        return {col: np.asarray(v["counts"], dtype=float) for col, v in self.categorical.items()}
+
+    def _bucket(self, col: str, value: Any) -> int:
+        index, tail, n_hash = self._cat_lookup[col]
+        key = str(value)
+        if key in index:
+            return index[key]
+        return len(index) if category_hash(key, n_hash) in tail else len(index) + 1
+
+    def _empty_counts(self) -> Dict[str, np.ndarray]:
+        counts = {col: np.zeros(len(b) - 1, dtype=np.int64) for col, b in self.bins.items()}
+        counts.update({col: np.zeros(len(v["categories"]) + 2, dtype=np.int64) for col, v in self.categorical.items()})
+        return counts
+
+    def _histograms(self, feature_rows: Sequence[Dict[str, Any]]):
+        for col, bins in self.bins.items():
+            counts = histogram_counts([f.get(col, np.nan) for f in feature_rows], bins)
+            for i in np.nonzero(counts)[0]:
+                yield col, int(i), int(counts[i])
+        for col, vocab in self.categorical.items():
+            buckets = [self._bucket(col, f[col]) for f in feature_rows if col in f]
+            counts = np.bincount(buckets, minlength=len(vocab["categories"]) + 2)
+            for i in np.nonzero(counts)[0]:
+                yield col, int(i), int(counts[i])
+
+    def _accumulate(self, conn: sqlite3.Connection, items: Sequence[Tuple[int, Dict[str, Any]]], last_rowid: int) -> None:
+        """`items` = (ts, features) por linha; atualiza totais, janelas e watermark."""
+        feature_rows = [f for _, f in items]
+        conn.executemany(
+            """INSERT INTO drift_hist(signature, feature, bin, count) VALUES (?, ?, ?, ?)
+               ON CONFLICT(signature, feature, bin) DO UPDATE SET count = count + excluded.count""",
+            [(self.signature, col, b, c) for col, b, c in self._histograms(feature_rows)],
+        )
+
+        for granularity, size in WINDOWS.items():
+            groups: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+            for ts, f in items:
+                groups[int(ts) - int(ts) % size].append(f)
+            for start, rows in groups.items():
+                conn.executemany(
+                    """INSERT INTO drift_window_hist(signature, granularity, window_start, feature, bin, count)
+                       VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(signature, granularity, window_start, feature, bin)
+                       DO UPDATE SET count = count + excluded.count""",
+                    [(self.signature, granularity, start, col, b, c) for col, b, c in self._histograms(rows)],
+                )
+                conn.execute(
+                    """INSERT INTO drift_window_rows(signature, granularity, window_start, n_rows) VALUES (?, ?, ?, ?)
+                       ON CONFLICT(signature, granularity, window_start) DO UPDATE SET n_rows = n_rows + excluded.n_rows""",
+                    (self.signature, granularity, start, len(rows)),
+                )
+
+        conn.execute(
+            """INSERT INTO drift_state(signature, n_rows, last_rowid) VALUES (?, ?, ?)
+               ON CONFLICT(signature) DO UPDATE SET n_rows = n_rows + excluded.n_rows,
+                                                    last_rowid = excluded.last_rowid""",
+            (self.signature, len(items), int(last_rowid)),
+        )
+        self.reservoir.offer(conn, items)
+
+    def catch_up(self, conn: sqlite3.Connection, chunk: int = 5000, max_chunks: Optional[int] = None) -> int:
+        """
+        Contabiliza linhas de predictions além do watermark (até `max_chunks` blocos de `chunk`
+        linhas). Deve rodar dentro de uma transação de escrita.
+        """
+        _, last = self._state(conn)
+        processed = 0
+        chunks = 0
+        # com prediction_features completo, lê as colunas tipadas e só cai no JSON sem a linha tipada
+        monitored = list(self._index)
+        typed = monitored if set(monitored) <= set(feature_columns(conn)) else []
+        select = "".join(f', f."{c}"' for c in typed)
+        categorical = set(self.categorical)
+        while max_chunks is None or chunks < max_chunks:
+            chunks += 1
+            rows = conn.execute(
+                f"""SELECT p.rowid, p.ts, p.payload, p.risk_score, f.pred_rowid{select}
+                    FROM predictions p LEFT JOIN prediction_features f ON f.pred_rowid = p.rowid
+                    WHERE p.rowid > ? ORDER BY p.rowid LIMIT ?""",
+                (last, int(chunk)),
+            ).fetchall()
+            if not rows:
+                return processed
+            items = []
+            for _, ts, payload, score, typed_rowid, *values in rows:
+                if typed and typed_rowid is not None:
+                    feats = {
+                        c: (np.nan if v is None else v if c in categorical else float(v))
+                        for c, v in zip(typed, values)
+                    }
+                else:
+                    try:
+                        feats = self.features(json.loads(payload))
+                    except Exception:
+                        feats = {}
+                feats[SCORE_FEATURE] = score
+                items.append((ts, feats))
+            last = int(rows[-1][0])
+            self._accumulate(conn, items, last)
+            processed += len(rows)
+        return processed
+
+    def observe_logged(self, conn: sqlite3.Connection, rows: Sequence[tuple]) -> None:
+        """
+        Soma um lote recém inserido. `rows` segue o formato do log de predições:
+        (ts, student_id, payload_json, ..., [features]); sem o 8º elemento, usa o payload.
+        """
+        items: List[Tuple[int, Dict[str, Any]]] = []
+        for r in rows:
+            if len(r) > 7 and isinstance(r[7], dict):
+                feats = dict(r[7])
+            else:
+                try:
+                    feats = self.features(json.loads(r[2]))
+                except Exception:
+                    feats = {}
+            feats[SCORE_FEATURE] = r[3]
+            items.append((r[0], feats))
+        last = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM predictions").fetchone()[0]
+        self._accumulate(conn, items, last)
+
+    def ensure_caught_up(self, conn: sqlite3.Connection, chunk: int = 5000) -> None:
+        """
+        Catch-up fora de uma transação: cada bloco roda e comita na sua própria transação.
+        Um replay longo (signature nova, ex: modelo retreinado) não segura o lock de escrita
+        do SQLite por inteiro, e o log writer e os outros workers gravam entre os blocos.
+        """
+        _, last = self._state(conn)
+        max_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM predictions").fetchone()[0]
+        while max_rowid > last:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if not self.catch_up(conn, chunk=chunk, max_chunks=1):
+                    return
+                _, last = self._state(conn)
+
+    def history(self, conn: sqlite3.Connection, granularity: str, since: int) -> List[Tuple[int, int, Dict[str, np.ndarray]]]:
+        """[(window_start, n_rows, contagens por feature)] das janelas >= since, em ordem cronológica."""
+        if granularity not in WINDOWS:
+            raise ValueError(f"granularity deve ser um de {sorted(WINDOWS)}")
+        self.ensure_caught_up(conn)
+
+        windows: Dict[int, Tuple[int, Dict[str, np.ndarray]]] = {}
+        for start, n in conn.execute(
+            """SELECT window_start, n_rows FROM drift_window_rows
+               WHERE signature = ? AND granularity = ? AND window_start >= ? ORDER BY window_start""",
+            (self.signature, granularity, int(since)),
+        ):
+            windows[start] = (n, self._empty_counts())
+        for start, col, b, c in conn.execute(
+            """SELECT window_start, feature, bin, count FROM drift_window_hist
+               WHERE signature = ? AND granularity = ? AND window_start >= ?""",
+            (self.signature, granularity, int(since)),
+        ):
+            counts = windows.get(start, (0, {}))[1].get(col)
+            if counts is not None and 0 <= b < counts.shape[0]:
+                counts[b] = c
+        return [(start, n, counts) for start, (n, counts) in sorted(windows.items())]
+
+    def watermark(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        """(n_rows, last_rowid) já contabilizados: muda sempre que entram novas predições."""
+        return self._state(conn)
+
+    def reservoir_sample(self, conn: sqlite3.Connection, generation: Any = None) -> Tuple[int, Dict[str, np.ndarray]]:
+        """Amostra atual do reservoir; relida do SQLite só quando o watermark muda."""
+        self.ensure_caught_up(conn)
+        key = (generation, self._state(conn))
+        with self._lock:
+            if self._sample_cached is not None and self._sample_cached[0] == key:
+                return self._sample_cached[1], self._sample_cached[2]
+        n, sample = self.reservoir.load(conn)
+        with self._lock:
+            self._sample_cached = (key, n, sample)
+        return n, sample
+
+    def snapshot(self, conn: sqlite3.Connection, generation: Any = None) -> Tuple[int, Dict[str, np.ndarray]]:
+        """(n_rows, contagens por feature) — O(features x bins)."""
+        self.ensure_caught_up(conn)
+        n_rows, last = self._state(conn)
+        key = (generation, last, n_rows)
+        with self._lock:
+            if self._cached is not None and self._cached[0] == key:
+                return self._cached[1], self._cached[2]
+
+        counts = self._empty_counts()
+        for col, b, c in conn.execute(
+            "SELECT feature, bin, count FROM drift_hist WHERE signature = ?", (self.signature,)
+        ):
+            if col in counts and 0 <= b < counts[col].shape[0]:
+                counts[col][b] = c
+
+        with self._lock:
+            self._cached = (key, n_rows, counts)
+        return n_rows, counts
+
+
+def publish_drift_gauges(result: Dict[str, Any]) -> None:
+    """Exporta o resultado do /drift como gauges `drift_psi{feature, kind}`."""
+    if "n_production_samples" not in result:
+        return
+    DRIFT_SAMPLES.set(result["n_production_samples"])
+    for col, value in (result.get("psi") or {}).items():
+        if value is not None:
+            DRIFT_PSI.labels(feature=col, kind="numeric").set(value)
+    for col, detail in (result.get("categorical") or {}).items():
+        if detail is not None and detail.get("psi") is not None:
+            DRIFT_PSI.labels(feature=col, kind="categorical").set(detail["psi"])
+    if result.get("risk_score_psi") is not None:
+        DRIFT_PSI.labels(feature=SCORE_FEATURE, kind="prediction").set(result["risk_score_psi"])
+
+
+def publish_multivariate_gauges(result: Dict[str, Any]) -> None:
+    """Exporta o resultado do drift multivariado (AUC e importâncias)."""
+    if result.get("auc") is None:
+        return
+    DRIFT_DOMAIN_AUC.set(result["auc"])
+    DRIFT_DOMAIN_IMPORTANCE.clear()
+    for item in result.get("top_features", []):
+        DRIFT_DOMAIN_IMPORTANCE.labels(feature=item["feature"]).set(item["importance"])
+
+
+class DriftScheduler:
+    """
+    Recalcula o drift a cada `interval` segundos numa thread daemon e guarda o último
+    resultado, para o /drift responder sem calcular no request e o Prometheus/Grafana
+    enxergarem o drift mesmo sem ninguém chamar o endpoint. `publish` exporta cada
+    resultado (gauges); `initial_delay` adia a primeira execução e `ready`, se informado,
+    segura a primeira execução até o evento (ex: fim do warm-up, para não carregar o
+    modelo em paralelo com ele).
+    """
+
+    def __init__(
+        self,
+        compute: Callable[[], Dict[str, Any]],
+        interval: float = 60.0,
+        publish: Callable[[Dict[str, Any]], None] = publish_drift_gauges,
+        name: str = "drift",
+        initial_delay: float = 0.0,
+        ready: Optional[threading.Event] = None,
+    ):
+        self.compute = compute
+        self.interval = max(0.05, float(interval))
+        self.publish = publish
+        self.name = name
+        self.initial_delay = max(0.0, float(initial_delay))
+        self.ready = ready
+        self._latest: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{name}-scheduler", daemon=True)
+        self._thread.start()
+
+    @property
+    def latest(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._latest
+
+    def run_once(self) -> Optional[Dict[str, Any]]:
+        t0 = time.perf_counter()
+        try:
+            result = self.compute()
+        except Exception as e:
+            logger.warning("drift_scheduler_failed", extra={"job": self.name, "error": str(e)})
+            return None
+        DRIFT_COMPUTE_SECONDS.labels(job=self.name).observe(time.perf_counter() - t0)
+        now = time.time()
+        result = {**result, "computed_at": int(now)}
+        self.publish(result)
+        DRIFT_LAST_RUN.labels(job=self.name).set(now)
+        with self._lock:
+            self._latest = result
+        return result
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=10)
+
+    def _run(self) -> None:
+        if self.ready is not None:
+            while not self.ready.wait(0.5):
+                if self._stop.is_set():
+                    return
+        if self._stop.wait(self.initial_delay):
+            return
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.utils import logger
+
+LOG_QUEUE_DEPTH = Gauge("prediction_log_queue_depth", "Predições aguardando gravação no SQLite")
+LOG_FLUSH_LATENCY = Histogram(
+    "prediction_log_flush_seconds",
+    "Latência de cada flush em lote do log de predições",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+LOG_FLUSH_ROWS = Histogram(
+    "prediction_log_flush_rows",
+    "Linhas gravadas por flush",
+    buckets=(1, 5, 10, 50, 100, 250, 500, 1000),
+)
+LOG_DROPPED = Counter("prediction_log_dropped_total", "Predições não gravadas", ["reason"])
+LOG_SPILLED = Counter("prediction_log_spilled_total", "Predições desviadas para o arquivo de spill")
+
+OVERFLOW_POLICIES = ("block", "drop", "spill")
+
+
+class PredictionLogWriter:
+    """
+    Log de predições write-behind: o request só enfileira, uma thread grava em lote.
+
+    `sink(rows)` recebe até `batch_size` linhas e deve gravá-las numa única transação.
+    Quando a fila (limitada a `maxsize`) enche, `overflow` decide:
+      - block: o request espera espaço na fila;
+      - drop:  a linha é descartada (contador prediction_log_dropped_total);
+      - spill: a linha vai para um NDJSON em disco, reprocessado quando a fila esvazia.
+
+    Um `sqlite3.OperationalError` no sink (ex: `database is locked`) é repetido até
+    `retries` vezes com backoff exponencial; se ainda falhar, o lote vai para o spill
+    (quando há `spill_path`, qualquer que seja `overflow`) em vez de ser descartado.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[List[tuple]], None],
+        maxsize: int = 10000,
+        batch_size: int = 500,
+        overflow: str = "block",
+        spill_path: Optional[Path] = None,
+        retries: int = 3,
+        retry_backoff: float = 0.05,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow deve ser um de {OVERFLOW_POLICIES}, recebido: {overflow!r}")
+        if overflow == "spill" and spill_path is None:
+            raise ValueError("overflow='spill' exige spill_path.")
+
+        self.sink = sink
+        self.batch_size = max(1, int(batch_size))
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.retries = max(0, int(retries))
+        self.retry_backoff = max(0.0, float(retry_backoff))
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._spill_lock = threading.Lock()
+        self._closed = False
+        LOG_QUEUE_DEPTH.set_function(self._queue.qsize)
+
+        self._thread = threading.Thread(target=self._run, name="prediction-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, rows: Sequence[tuple]) -> None:
+        if self._closed:
+            raise RuntimeError("PredictionLogWriter encerrado.")
+        for row in rows:
+            if self.overflow == "block":
+                self._queue.put(row)
+                continue
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                if self.overflow == "drop":
+                    LOG_DROPPED.labels(reason="overflow").inc()
+                else:
+                    self._spill([row])
+
+    def flush(self) -> None:
+        """Bloqueia até todas as linhas enfileiradas (e o spill pendente) serem gravadas."""
+        self._queue.join()
+        self._replay_spill()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        self._replay_spill()
+
+    def _spill(self, rows: List[tuple]) -> None:
+        with self._spill_lock:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.spill_path.open("a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(list(row), ensure_ascii=False) + "\n")
+        LOG_SPILLED.inc(len(rows))
+
+    def _replay_spill(self) -> None:
+        if self.spill_path is None:
+            return
+        with self._spill_lock:
+            if not self.spill_path.exists():
+                return
+            lines = self.spill_path.read_text(encoding="utf-8").splitlines()
+            self.spill_path.unlink()
+        rows = [tuple(json.loads(line)) for line in lines if line.strip()]
+        for i in range(0, len(rows), self.batch_size):
+            self._write(rows[i:i + self.batch_size])
+
+    def _write(self, rows: List[tuple]) -> None:
+        t0 = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                self.sink(rows)
+                break
+            except sqlite3.OperationalError as e:
+                if attempt < self.retries:
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+                    attempt += 1
+                    continue
+                if self.spill_path is not None:
+                    # transitório: o replay do spill tenta de novo quando a fila esvaziar
+                    logger.warning("prediction_log_flush_spilled", extra={"error": str(e), "rows": len(rows)})
+                    self._spill(rows)
+                    return
+                LOG_DROPPED.labels(reason="error").inc(len(rows))
+                logger.exception("prediction_log_flush_failed", extra={"error": str(e), "rows": len(rows)})
+                return
+            except Exception as e:
+                LOG_DROPPED.labels(reason="error").inc(len(rows))
+                logger.exception("prediction_log_flush_failed", extra={"error": str(e), "rows": len(rows)})
+                return
+        LOG_FLUSH_LATENCY.observe(time.perf_counter() - t0)
+        LOG_FLUSH_ROWS.observe(len(rows))
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            try:
+                first = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                self._replay_spill()
+                continue
+
+            batch: List[tuple] = []
+            taken = 1
+            if first is None:
+                stop = True
+            else:
+                batch.append(first)
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if row is None:
+                    stop = True
+                    continue
+                batch.append(row)
+
+            if batch:
+                self._write(batch)
+            for _ in range(taken):
+                self._queue.task_done()
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from app.store import SQLiteStore, load_features
+from src.utils import DATA_DIR, logger
+
+RETENTION_ARCHIVED = Counter("retention_archived_rows_total", "Predições movidas do SQLite para o arquivo")
+RETENTION_SECONDS = Histogram(
+    "retention_run_seconds",
+    "Duração de cada rodada de retenção/arquivamento",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0),
+)
+
+ARCHIVE_FORMATS = ("ndjson", "parquet")
+ARCHIVE_COLUMNS = ("ts", "student_id", "payload", "risk_score", "risk_class", "model_version", "top_factors", "rowid")
+DEFAULT_ARCHIVE_DIR = DATA_DIR / "archive"
+
+
+def _day(ts: int) -> str:
+    return datetime.fromtimestamp(int(ts), tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _write_partition(path: Path, records: List[Dict[str, Any]], fmt: str) -> None:
+    """Escreve num arquivo temporário e renomeia: uma partição nunca fica pela metade."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    if fmt == "parquet":
+        import pandas as pd
+
+        pd.DataFrame.from_records(records, columns=list(ARCHIVE_COLUMNS)).to_parquet(tmp, index=False)
+    else:
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def _resolve_format(fmt: str) -> str:
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"format deve ser um de {ARCHIVE_FORMATS}, recebido: {fmt!r}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.warning("pyarrow não instalado; arquivando em NDJSON comprimido")
+            return "ndjson"
+    return fmt
+
+
+def ensure_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """
+    Liga auto_vacuum=INCREMENTAL. Bancos criados antes disso precisam de um VACUUM
+    completo (uma única vez) para a mudança valer; retorna True quando isso acontece.
+
+    O VACUUM segura o lock de escrita durante toda a cópia do banco: rode só com a API
+    parada (CLI `python -m app.retention`), nunca da thread de retenção.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def archive_old_predictions(
+    conn: sqlite3.Connection,
+    archive_dir: Path,
+    max_age_days: float,
+    fmt: str = "ndjson",
+    chunk: int = 50_000,
+    now: Optional[float] = None,
+    convert_vacuum: bool = False,
+) -> Dict[str, Any]:
+    """
+    Move as predições com ts < agora - max_age_days para partições diárias
+    (`date=YYYY-MM-DD/part-<rowid inicial>-<rowid final>.ndjson.gz|.parquet`), apaga do
+    SQLite (predictions e prediction_features) em lotes curtos e roda incremental vacuum.
+
+    O arquivo é gravado antes do DELETE; se o processo cair no meio, a próxima rodada
+    regrava a mesma partição (mesmo nome) e conclui a remoção. Os histogramas de drift
+    não são afetados: eles já contabilizaram essas linhas.
+
+    Em bancos antigos (sem auto_vacuum=INCREMENTAL) o espaço só é devolvido depois da
+    conversão única, feita apenas com `convert_vacuum=True` (CLI, fora do tráfego).
+    """
+    fmt = _resolve_format(fmt)
+    archive_dir = Path(archive_dir)
+    cutoff = int((time.time() if now is None else now) - float(max_age_days) * 86400)
+    t0 = time.perf_counter()
+    archived, files = 0, 0
+
+    while True:
+        rows = conn.execute(
+            f"""SELECT {', '.join(ARCHIVE_COLUMNS[:-1])}, rowid FROM predictions
+               WHERE ts < ? ORDER BY rowid LIMIT ?""",
+            (cutoff, int(chunk)),
+        ).fetchall()
+        if not rows:
+            break
+
+        typed = load_features(conn, [r[7] for r in rows if not r[2]])
+        partitions: Dict[str, List[Dict[str, Any]]] = {}
+        for r in rows:
+            rec = dict(zip(ARCHIVE_COLUMNS, r))
+            if not rec["payload"]:
+                rec["payload"] = json.dumps(typed.get(rec["rowid"], {}), ensure_ascii=False)
+            partitions.setdefault(_day(rec["ts"]), []).append(rec)
+
+        suffix = "parquet" if fmt == "parquet" else "ndjson.gz"
+        for day, records in partitions.items():
+            name = f"part-{records[0]['rowid']}-{records[-1]['rowid']}.{suffix}"
+            _write_partition(archive_dir / f"date={day}" / name, records, fmt)
+            files += 1
+
+        ids = [(r[7],) for r in rows]
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM prediction_features WHERE pred_rowid = ?", ids)
+            conn.executemany("DELETE FROM predictions WHERE rowid = ?", ids)
+        archived += len(rows)
+        RETENTION_ARCHIVED.inc(len(rows))
+
+    vacuumed, converted = 0, False
+    incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    if not incremental and convert_vacuum:
+        converted = ensure_incremental_vacuum(conn)
+    elif incremental and archived:
+        vacuumed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute("PRAGMA incremental_vacuum")
+    elif archived:
+        logger.warning("retention_vacuum_conversion_pending", extra={"hint": "rode python -m app.retention com a API parada"})
+
+    elapsed = time.perf_counter() - t0
+    RETENTION_SECONDS.observe(elapsed)
+    stats = {
+        "cutoff": cutoff,
+        "archived_rows": archived,
+        "files": files,
+        "freed_pages": vacuumed,
+        "vacuum_converted": converted,
+        "format": fmt,
+    }
+    logger.info("retention_run", extra=stats)
+    return stats
+
+
+def _partition_day(path: Path) -> Optional[str]:
+    name = path.parent.name
+    return name[len("date="):] if name.startswith("date=") else None
+
+
+def _read_partition(path: Path) -> Iterator[Dict[str, Any]]:
+    if path.suffix == ".parquet":
+        import pandas as pd
+
+        yield from pd.read_parquet(path).to_dict("records")
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _partitions(
+    archive_dir: Path, since: Optional[int] = None, until: Optional[int] = None
+) -> Iterator[Tuple[str, Path]]:
+    """(dia, arquivo) das partições, da mais recente para a mais antiga; `since`/`until` pulam dias inteiros."""
+    archive_dir = Path(archive_dir)
+    if not archive_dir.exists():
+        return
+    first_day = _day(since) if since is not None else None
+    last_day = _day(until) if until is not None else None
+    parts = [p for p in archive_dir.glob("date=*/part-*") if not p.name.endswith(".tmp")]
+    for path in sorted(parts, key=lambda p: (_partition_day(p) or "", p.name), reverse=True):
+        day = _partition_day(path)
+        if day is None or (first_day and day < first_day) or (last_day and day > last_day):
+            continue
+        yield day, path
+
+
+def iter_archived(
+    archive_dir: Path,
+    student_id: Optional[str] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Linhas arquivadas (mesmas colunas de predictions + rowid), partição a partição,
+    da mais recente para a mais antiga. `since`/`until` (ts) pulam partições inteiras.
+    """
+    for _, path in _partitions(archive_dir, since, until):
+        for rec in _read_partition(path):
+            if student_id is not None and rec.get("student_id") != student_id:
+                continue
+            ts = int(rec["ts"])
+            if (since is not None and ts < since) or (until is not None and ts > until):
+                continue
+            yield rec
+
+
+def _history_key(rec: Dict[str, Any]) -> Tuple[int, int]:
+    return int(rec["ts"]), int(rec["rowid"])
+
+
+def archived_history(
+    archive_dir: Path,
+    student_id: str,
+    limit: int,
+    before: Optional[Tuple[int, int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Histórico arquivado de um aluno em ordem (ts, rowid) decrescente, antes do cursor `before`.
+    Para de ler partições assim que tem `limit` linhas e a próxima partição é de um dia
+    anterior ao da linha mais antiga já selecionada.
+    """
+    limit = int(limit)
+    if limit <= 0:
+        return []
+    until = before[0] if before is not None else None
+    rows: List[Dict[str, Any]] = []
+    for day, path in _partitions(archive_dir, until=until):
+        if len(rows) >= limit:
+            rows.sort(key=_history_key, reverse=True)
+            del rows[limit:]
+            if day < _day(rows[-1]["ts"]):
+                break
+        rows.extend(
+            rec for rec in _read_partition(path)
+            if rec.get("student_id") == student_id and (before is None or _history_key(rec) < before)
+        )
+    rows.sort(key=_history_key, reverse=True)
+    return rows[:limit]
+
+
+class RetentionWorker:
+    """Roda `archive_old_predictions` a cada `interval` segundos numa thread daemon."""
+
+    def __init__(self, run, interval: float = 3600.0):
+        self.run = run
+        self.interval = max(1.0, float(interval))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="retention-worker", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=30)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run()
+            except Exception as e:
+                logger.warning("retention_failed", extra={"error": str(e)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquiva e remove do SQLite as predições antigas.")
+    parser.add_argument("--days", type=float, default=float(os.getenv("RETENTION_DAYS", "90")),
+                        help="Idade máxima (dias) das linhas mantidas no SQLite")
+    parser.add_argument("--db", type=str, default=str(DATA_DIR / "predictions.sqlite"))
+    parser.add_argument("--archive-dir", type=str, default=os.getenv("PREDICTION_ARCHIVE_DIR", str(DEFAULT_ARCHIVE_DIR)))
+    parser.add_argument("--format", choices=ARCHIVE_FORMATS, default=os.getenv("PREDICTION_ARCHIVE_FORMAT", "ndjson"))
+    args = parser.parse_args()
+
+    store = SQLiteStore(Path(args.db))
+    try:
+        # CLI roda fora do tráfego: pode fazer a conversão única para auto_vacuum=INCREMENTAL
+        stats = archive_old_predictions(
+            store.connection(), Path(args.archive_dir), args.days, args.format, convert_vacuum=True
+        )
+    finally:
+        store.close()
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
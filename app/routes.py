@@ -1,62 +1,168 @@
 from __future__ import annotations
 
+import atexit
+import hashlib
 import json
-import sqlite3
+import os
+import threading
 import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
 from functools import lru_cache
+from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 import joblib
 import numpy as np
 import pandas as pd
 from fastapi import APIRouter, HTTPException, Response
-from pydantic import BaseModel, ConfigDict, Field
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from prometheus_client import Counter, Gauge, Histogram
 from huggingface_hub import hf_hub_download
 
-from src.feature_engineering import add_derived_features
-from src.preprocessing import enforce_types
-from src.utils import ARTIFACT_DIR, DATA_DIR, compute_psi, load_json, logger
+from app.backends import PredictionBackend, SQLiteBackend, open_backend
+from app.batching import MicroBatcher
+from app.cache import TTLCache, canonical_hash
+from app.explanations import EXPLAIN_JOBS, PENDING_FACTORS, ExplanationPool
+from app.monitoring import (
+    SCORE_FEATURE,
+    WINDOWS,
+    DriftAggregator,
+    DriftScheduler,
+    publish_multivariate_gauges,
+)
+from app.prediction_log import PredictionLogWriter
+from app.retention import DEFAULT_ARCHIVE_DIR, RetentionWorker, archive_old_predictions, archived_history
+from app.store import (
+    COHORT_BUCKETS,
+    COHORT_DIMENSIONS,
+    SQLiteStore,
+    category_counts,
+    cohort_rollups,
+    cohort_values,
+    ensure_feature_columns,
+    feature_histogram,
+    feature_summary,
+    insert_features,
+    load_features,
+    update_cohorts,
+)
+from src.feature_engineering import FeaturePlan
+from src.inference import NativeForestPipeline
+from src.multivariate_drift import domain_classifier_drift, run_with_budget
+from src.utils import (
+    ARTIFACT_DIR,
+    DATA_DIR,
+    chi_square_from_counts,
+    distribution_tests,
+    histogram_counts,
+    load_json,
+    logger,
+    psi_from_counts,
+)
 
 router = APIRouter()
 
 REQUESTS = Counter("api_requests_total", "Total de requisições da API", ["endpoint", "status"])
 LATENCY = Histogram("api_request_latency_seconds", "Latência das requisições", ["endpoint"])
+STARTUP_STAGE_SECONDS = Gauge(
+    "startup_stage_seconds",
+    "Duração de cada etapa do startup (download, load, native_export, explainer, warmup, total)",
+    ["stage"],
+)
+APP_READY = Gauge("app_ready", "1 depois que artefatos, explainer e warm-up terminaram (ver /ready)")
 
 DB_PATH = DATA_DIR / "predictions.sqlite"
 
+# PREDICTION_CACHE_SIZE=0 desliga o cache de respostas do /predict
+PREDICTION_CACHE = TTLCache(
+    "prediction",
+    maxsize=int(os.getenv("PREDICTION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("PREDICTION_CACHE_TTL", "300")),
+)
+
+
+# top factors do SHAP por vetor transformado (+ model_version); SHAP_CACHE_SIZE=0 desliga
+SHAP_CACHE = TTLCache(
+    "shap",
+    maxsize=int(os.getenv("SHAP_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("SHAP_CACHE_TTL", "0")),
+)
+
+
+STORE = SQLiteStore(DB_PATH, busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")))
+
 
 def _db():
-    """SQLite connection + best-effort migrations."""
-    DATA_DIR.mkdir(exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-
-    # Base table (newest schema)
-    conn.execute(
-        """CREATE TABLE IF NOT EXISTS predictions (
-            ts INTEGER NOT NULL,
-            student_id TEXT,
-            payload TEXT NOT NULL,
-            risk_score REAL NOT NULL,
-            risk_class INTEGER NOT NULL,
-            model_version TEXT NOT NULL,
-            top_factors TEXT
-        )"""
-    )
+    """Persistent per-thread SQLite connection (WAL, migrations applied once)."""
+    return STORE.connection()
 
-    # Backward compatible migrations (if table was created with older schema)
-    cols = {r[1] for r in conn.execute("PRAGMA table_info(predictions)").fetchall()}
-    if "student_id" not in cols:
-        conn.execute("ALTER TABLE predictions ADD COLUMN student_id TEXT")
-    if "top_factors" not in cols:
-        conn.execute("ALTER TABLE predictions ADD COLUMN top_factors TEXT")
 
-    conn.commit()
-    return conn
+_backend: Optional[PredictionBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _prediction_backend() -> PredictionBackend:
+    """
+    PREDICTION_STORE_BACKEND=sqlite (padrão) | segmented | memory. Os agregados de
+    drift continuam no SQLite em qualquer caso (tamanho limitado); features tipadas,
+    /analytics/features e retenção dependem da tabela predictions do backend sqlite.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = open_backend(
+                os.getenv("PREDICTION_STORE_BACKEND", "sqlite"),
+                connect=lambda: _db(),
+                directory=Path(os.getenv("PREDICTION_SEGMENT_DIR", str(DATA_DIR / "prediction_log"))),
+                capacity=int(os.getenv("PREDICTION_RING_CAPACITY", "100000")),
+                segment_bytes=int(float(os.getenv("PREDICTION_SEGMENT_MB", "64")) * 1024 * 1024),
+                max_segments=int(os.getenv("PREDICTION_SEGMENT_MAX", "0")),
+            )
+        return _backend
+
+
+def shutdown_prediction_backend() -> None:
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
+
+
+@contextmanager
+def _startup_stage(stage: str):
+    """Mede uma etapa do carregamento em startup_stage_seconds{stage} (vale também no carregamento lazy)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STARTUP_STAGE_SECONDS.labels(stage=stage).set(elapsed)
+        logger.info("startup_stage", extra={"stage": stage, "seconds": round(elapsed, 4)})
+
+
+_artifacts_lock = threading.Lock()
 
 
-@lru_cache(maxsize=1)
 def load_artifacts():
+    """
+    (model, meta) carregados uma vez. O lru_cache sozinho não deduplica misses
+    simultâneos (warm-up e schedulers no startup baixariam e carregariam o modelo
+    duas vezes): o lock faz a segunda thread esperar o carregamento da primeira.
+    """
+    with _artifacts_lock:
+        return _load_artifacts()
+
+
+@lru_cache(maxsize=1)
+def _load_artifacts():
+    """
+    Carrega (model, meta). INFERENCE_BACKEND=native troca o pipeline sklearn por
+    NativeForestPipeline (árvores achatadas em NumPy); se a exportação falhar,
+    mantém o sklearn.
+    """
     model_path = ARTIFACT_DIR / "model.joblib"
     meta_path = ARTIFACT_DIR / "metadata.json"
     # Se os arquivos não existirem, fazemos o pull do Model Registry
@@ -68,16 +174,28 @@ def load_artifacts():
         REPO_ID = "tiagoparibeiro/passos-magicos-model"
 
         try:
-            hf_hub_download(repo_id=REPO_ID, filename="model.joblib", local_dir=ARTIFACT_DIR)
-            hf_hub_download(repo_id=REPO_ID, filename="metadata.json", local_dir=ARTIFACT_DIR)
+            with _startup_stage("download"):
+                hf_hub_download(repo_id=REPO_ID, filename="model.joblib", local_dir=ARTIFACT_DIR)
+                hf_hub_download(repo_id=REPO_ID, filename="metadata.json", local_dir=ARTIFACT_DIR)
         except Exception as e:
             raise RuntimeError(f"Falha ao baixar modelo do Hugging Face: {e}")
 
-    model = joblib.load(model_path)
-    meta = load_json(meta_path)
+    with _startup_stage("load"):
+        model = joblib.load(model_path)
+        meta = load_json(meta_path)
+
+    if os.getenv("INFERENCE_BACKEND", "sklearn").lower() == "native":
+        try:
+            with _startup_stage("native_export"):
+                model = NativeForestPipeline.from_pipeline(model)
+        except Exception as e:
+            logger.warning("native_backend_unavailable", extra={"error": str(e)})
     return model, meta
 
 
+load_artifacts.cache_clear = _load_artifacts.cache_clear
+
+
 @lru_cache(maxsize=1)
 def load_shap_explainer():
     """Returns SHAP TreeExplainer or None if unavailable."""
@@ -91,7 +209,8 @@ def load_shap_explainer():
         tree_model = model.named_steps["model"]
         import shap
 
-        return shap.TreeExplainer(tree_model)
+        with _startup_stage("explainer"):
+            return shap.TreeExplainer(tree_model)
     except Exception:
         return None
 
@@ -108,6 +227,22 @@ class PredictRequest(BaseModel):
     FASE_TURMA: Optional[str] = Field(None, description="Ex: 5G")
     INDE: Optional[float] = Field(None, description="Indicador de Desenvolvimento Educacional")
 
+
+class PredictBatchRequest(BaseModel):
+    """Lote de alunos para scoring vetorizado (ex: uma turma ou escola inteira)."""
+    # List[Any]: um item que não é objeto vira erro só naquele índice, não 422 no lote inteiro
+    items: List[Any] = Field(..., description="Lista de payloads no mesmo formato de /predict")
+
+
+class ExplainBatchRequest(BaseModel):
+    """Histórico de vários alunos (ex: uma turma) numa única consulta."""
+    student_ids: List[str] = Field(..., description="Alunos a consultar (duplicados são ignorados)")
+    limit: int = Field(10, ge=1, le=1000, description="Máximo de predições por aluno")
+    fields: Optional[List[str]] = Field(
+        None, description="Campos de cada item do histórico (padrão: todos). Sem 'payload', o JSON bruto nem é lido."
+    )
+
+
 def _extract_student_id(payload: Dict[str, Any]) -> str:
     """Best-effort student identifier for history/explain."""
     for k in ("student_id", "STUDENT_ID", "id", "ID", "NOME", "Nome"):
@@ -117,8 +252,8 @@ def _extract_student_id(payload: Dict[str, Any]) -> str:
         s = str(v).strip()
         if s:
             return s
-    # fallback deterministic-ish hash of the payload
-    return f"anon:{abs(hash(json.dumps(payload, sort_keys=True, ensure_ascii=False))) % 10**10}"
+    # fallback: stable hash of the canonical payload (same id across processes/restarts)
+    return f"anon:{int(canonical_hash(payload)[:16], 16) % 10**10}"
 
 
 def _json_safe_number(x: Any):
@@ -149,7 +284,61 @@ def _ensure_expected_columns(X: pd.DataFrame, meta: Dict[str, Any]) -> pd.DataFr
     return X.reindex(columns=feature_order, fill_value=np.nan)
 
 
+EXPLAIN_MODES = ("none", "global", "shap", "deferred")
+
+_feature_names_cache: tuple = (None, None)
+_global_factors_cache: tuple = (None, None)
+
+
+def _feature_names(pre, n_features: int) -> List[str]:
+    """get_feature_names_out() resolvido uma vez por preprocessor carregado."""
+    global _feature_names_cache
+    cached_pre, names = _feature_names_cache
+    if cached_pre is not pre or names is None or len(names) != n_features:
+        try:
+            names = [str(n) for n in pre.get_feature_names_out()]
+        except Exception:
+            names = []
+        if len(names) != n_features:
+            names = [f"f{i}" for i in range(n_features)]
+        _feature_names_cache = (pre, names)
+    return names
+
+
+def _explain_mode(mode: Optional[str]) -> str:
+    """none | global | shap | deferred; sem valor, usa PREDICT_EXPLAIN_DEFAULT (padrão shap)."""
+    mode = (mode or os.getenv("PREDICT_EXPLAIN_DEFAULT", "shap")).lower()
+    if mode not in EXPLAIN_MODES:
+        raise HTTPException(status_code=400, detail=f"explain deve ser um de {list(EXPLAIN_MODES)}")
+    return mode
+
+
 def _top_factors_shap(model_pipeline, X: pd.DataFrame, top_k: int = 5) -> Optional[List[Dict[str, Any]]]:
+    tops = _top_factors_shap_batch(model_pipeline, X, top_k=top_k)
+    return tops[0] if tops else None
+
+
+def _shap_cache_keys(Xt: np.ndarray, model_version: Any, top_k: int) -> List[tuple]:
+    """
+    Chave por linha: model_version, top_k e hash do vetor transformado. SHAP_CACHE_DECIMALS
+    arredonda o vetor antes do hash, para perfis quase idênticos dividirem a explicação.
+    """
+    decimals = os.getenv("SHAP_CACHE_DECIMALS")
+    if decimals not in (None, ""):
+        Xt = np.round(Xt, int(decimals))
+    # + 0.0 normaliza -0.0; float64 contíguo para o hash não depender do layout
+    Xt = np.ascontiguousarray(Xt + 0.0, dtype=np.float64)
+    return [(model_version, top_k, hashlib.blake2b(row.tobytes(), digest_size=16).digest()) for row in Xt]
+
+
+def _top_factors_shap_batch(
+    model_pipeline, X: pd.DataFrame, top_k: int = 5, model_version: Optional[str] = None
+) -> Optional[List[List[Dict[str, Any]]]]:
+    """
+    SHAP top factors for every row of X with a single transform + shap_values call.
+    With `model_version`, rows already in SHAP_CACHE skip the explainer; only the
+    misses go through shap_values.
+    """
     explainer = load_shap_explainer()
     if explainer is None:
         return None
@@ -161,51 +350,67 @@ def _top_factors_shap(model_pipeline, X: pd.DataFrame, top_k: int = 5) -> Option
         if hasattr(Xt, "toarray"):
             Xt = Xt.toarray()
 
-        Xt = Xt.astype(float)
-
-        try:
-            feature_names = list(pre.get_feature_names_out())
-        except Exception:
-            feature_names = [f"f{i}" for i in range(Xt.shape[1])]
-
-        sv = explainer.shap_values(Xt)
+        Xt = np.asarray(Xt, dtype=float)
+        feature_names = _feature_names(pre, Xt.shape[1])
+
+        out: List[Optional[List[Dict[str, Any]]]] = [None] * len(Xt)
+        keys: List[Any] = []
+        if model_version is not None and SHAP_CACHE.enabled:
+            SHAP_CACHE.ensure_generation((model_version, explainer))
+            keys = _shap_cache_keys(Xt, model_version, top_k)
+            for i, key in enumerate(keys):
+                cached = SHAP_CACHE.get(key)
+                if cached is not None:
+                    out[i] = [dict(f) for f in cached]
+        missing = [i for i, o in enumerate(out) if o is None]
+        if not missing:
+            return out
+
+        sv = explainer.shap_values(Xt[missing])
         if isinstance(sv, list):
-            contrib = sv[1][0] if len(sv) > 1 else sv[0][0]
+            contrib = sv[1] if len(sv) > 1 else sv[0]
         else:
             if len(sv.shape) == 3:
-                contrib = sv[0, :, 1]
+                contrib = sv[:, :, 1]
             elif len(sv.shape) == 2:
-                contrib = sv[0]
+                contrib = sv
             else:
-                contrib = sv.flatten()
+                contrib = sv.reshape(1, -1)
 
-        contrib = np.array(contrib).flatten()
+        contrib = np.asarray(contrib, dtype=float).reshape(len(missing), -1)
 
-        pairs = sorted(zip(feature_names, contrib), key=lambda x: abs(float(x[1])), reverse=True)[:top_k]
-        return [{"feature": f, "impact": float(v)} for f, v in pairs]
+        # top-k de todas as linhas de uma vez (estável: empates mantêm a ordem das features)
+        order = np.argsort(-np.abs(contrib), axis=1, kind="stable")[:, :top_k]
+        for i, row, idx in zip(missing, contrib, order):
+            out[i] = [{"feature": feature_names[j], "impact": float(row[j])} for j in idx]
+            if keys:
+                SHAP_CACHE.set(keys[i], [dict(f) for f in out[i]])
+        return out
     except Exception as e:
         logger.exception("shap_failed", extra={"error": str(e)})
         return None
 
 
 def _top_factors_fallback(model_pipeline, top_k: int = 5) -> List[Dict[str, Any]]:
-    """Always-available fallback: top global feature importances from RF."""
+    """Always-available fallback: top global feature importances from RF (computed once per model)."""
+    global _global_factors_cache
+    cached_model, factors = _global_factors_cache
+    if cached_model is model_pipeline and factors is not None:
+        return list(factors[:top_k])
     try:
         pre = model_pipeline.named_steps["preprocessor"]
         tree = model_pipeline.named_steps["model"]
 
-        try:
-            feature_names = list(pre.get_feature_names_out())
-        except Exception:
-            n = getattr(tree, "feature_importances_", np.array([])).shape[0]
-            feature_names = [f"f{i}" for i in range(n)]
-
         importances = getattr(tree, "feature_importances_", None)
         if importances is None:
             return []
+        importances = np.asarray(importances, dtype=float)
+        feature_names = _feature_names(pre, importances.shape[0])
 
-        idx = np.argsort(np.abs(importances))[::-1][:top_k]
-        return [{"feature": feature_names[i], "importance": float(importances[i])} for i in idx]
+        idx = np.argsort(np.abs(importances))[::-1]
+        factors = [{"feature": feature_names[i], "importance": float(importances[i])} for i in idx]
+        _global_factors_cache = (model_pipeline, factors)
+        return list(factors[:top_k])
     except Exception:
         return []
 
@@ -215,55 +420,531 @@ def health():
     return {"status": "ativo"}
 
 
-@router.post("/predict")
-def predict(body: PredictRequest):
-    t0 = time.time()
-    endpoint = "/predict"
-    try:
-        model, meta = load_artifacts()
-        payload = body.model_dump()
-        student_id = _extract_student_id(payload)
+_plan_cache: tuple = (None, None)
 
-        X = pd.DataFrame([payload])
-        X = add_derived_features(X)
-        X = enforce_types(X)
-        X = _ensure_expected_columns(X, meta)
 
-        proba = float(model.predict_proba(X)[:, 1][0])
-        threshold = float(meta.get("threshold", 0.35))
-        pred = int(proba >= threshold)
+def _feature_plan(meta: Dict[str, Any]) -> FeaturePlan:
+    """FeaturePlan compilado uma vez por metadata carregado."""
+    global _plan_cache
+    cached_meta, plan = _plan_cache
+    if cached_meta is not meta:
+        plan = FeaturePlan.from_metadata(meta)
+        _plan_cache = (meta, plan)
+    return plan
+
+
+_drift_cache: tuple = (None, None)
+
+
+def _drift_aggregator(meta: Dict[str, Any]) -> DriftAggregator:
+    """DriftAggregator (histogramas incrementais) do metadata carregado."""
+    global _drift_cache
+    cached_meta, agg = _drift_cache
+    if cached_meta is not meta:
+        agg = DriftAggregator(
+            meta,
+            _feature_plan(meta),
+            reservoir_size=int(os.getenv("DRIFT_RESERVOIR_SIZE", "5000")),
+            reservoir_half_life=float(os.getenv("DRIFT_RESERVOIR_HALF_LIFE_HOURS", "24")) * 3600,
+        )
+        _drift_cache = (meta, agg)
+    return agg
+
+
+def _prepare_features(payloads: List[Dict[str, Any]], meta: Dict[str, Any]) -> pd.DataFrame:
+    """Payloads -> model input frame (FeaturePlan por linha, um único DataFrame no final)."""
+    plan = _feature_plan(meta)
+    return pd.DataFrame(plan.rows(payloads), columns=plan.feature_order)
+
 
-        out: Dict[str, Any] = {
+def _score_payloads(
+    model, meta: Dict[str, Any], payloads: List[Dict[str, Any]], explain: str = "shap"
+) -> List[Dict[str, Any]]:
+    """
+    Vectorized scoring: one predict_proba for all payloads, plus the explanation mode
+    requested: none (no factors), global (cached RF importances), shap (one batch call)
+    or deferred (SHAP computed later by the explanation pool, see _schedule_explanations).
+    """
+    X = _prepare_features(payloads, meta)
+
+    probas = model.predict_proba(X)[:, 1]
+    threshold = float(meta.get("threshold", 0.35))
+
+    tops = None
+    if explain == "shap":
+        tops = _top_factors_shap_batch(model, X, top_k=5, model_version=meta.get("model_version"))
+    if tops is None:
+        fallback = _top_factors_fallback(model, top_k=5) if explain in ("global", "shap") else []
+        tops = [fallback] * len(payloads)
+
+    results = []
+    for payload, p, top in zip(payloads, probas, tops):
+        proba = float(p)
+        pred = int(proba >= threshold)
+        results.append({
             "risk_score": proba,
             "risk_class": pred,
             "risk_level": "alto" if pred == 1 else "baixo",
             "threshold": threshold,
             "model_version": meta.get("model_version"),
             "interpretation": "Alto risco de defasagem" if pred == 1 else "Baixo risco de defasagem",
-            "student_id": student_id,
-        }
+            "student_id": _extract_student_id(payload),
+            "explain": explain,
+            "explain_status": "pending" if explain == "deferred" else "ready",
+            "top_risk_factors": top,
+        })
+    return results
+
+
+def _feature_row(plan: FeaturePlan, r: tuple) -> List[Any]:
+    if len(r) > 8 and r[8] is not None:
+        return r[8]
+    try:
+        return plan.row(json.loads(r[2]))
+    except Exception:
+        return [np.nan] * len(plan.feature_order)
 
-        top = _top_factors_shap(model, X, top_k=5)
-        if top is None:
-            top = _top_factors_fallback(model, top_k=5)
-        out["top_risk_factors"] = top
 
+def _cohort_items(rows: List[tuple]) -> List[tuple]:
+    items = []
+    for r in rows:
+        if len(r) > 9 and r[9] is not None:
+            values = r[9]
+        else:
+            try:
+                values = cohort_values(json.loads(r[2]) if r[2] else {})
+            except ValueError:
+                values = cohort_values({})
+        items.append((r[0], r[3], r[4], values))
+    return items
+
+
+def _write_prediction_rows(rows: List[tuple]) -> None:
+    """
+    Grava um lote de linhas numa única transação (executemany + um commit) e, na
+    mesma transação, as features tipadas (prediction_features), os rollups por
+    coorte e os histogramas incrementais de drift.
+    """
+    try:
+        _, meta = load_artifacts()
+        agg = _drift_aggregator(meta)
+        plan = _feature_plan(meta)
+    except Exception:
+        agg = plan = None  # sem artefatos: o watermark fica para trás e o catch-up conta depois
+
+    backend = _prediction_backend()
+    if not isinstance(backend, SQLiteBackend):
+        # rollups no SQLite antes do append: se o lock expirar, o writer repete o lote sem duplicar o log
         conn = _db()
-        conn.execute(
-            """INSERT INTO predictions(ts, student_id, payload, risk_score, risk_class, model_version, top_factors)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            update_cohorts(conn, _cohort_items(rows))
+            if agg is not None:
+                agg.observe_logged(conn, rows)
+        first_rowid = backend.append(rows)
+        _schedule_explanations(rows, first_rowid)
+        return
+
+    if agg is not None:
+        # replay pendente (signature nova) em blocos comitados; na transação do INSERT sobra pouco
+        agg.ensure_caught_up(backend.connect())
+    with backend.transaction() as conn:
+        if agg is not None:
+            agg.catch_up(conn)
+        first_rowid = backend.insert(conn, rows)
+        update_cohorts(conn, _cohort_items(rows))
+        if plan is not None and plan.feature_order:
+            ensure_feature_columns(conn, plan.feature_order, plan.categorical)
+            insert_features(
+                conn,
+                first_rowid,
+                [r[0] for r in rows],
+                plan.feature_order,
+                [_feature_row(plan, r) for r in rows],
+            )
+        if agg is not None:
+            agg.observe_logged(conn, rows)
+    # depois do commit: o worker só atualiza linhas que já existem
+    _schedule_explanations(rows, first_rowid)
+
+
+def _explain_feature_rows(feature_rows: List[List[Any]]) -> List[str]:
+    """Top factors (JSON) de linhas do FeaturePlan: um SHAP por lote, importâncias globais se falhar."""
+    model, meta = load_artifacts()
+    plan = _feature_plan(meta)
+    X = pd.DataFrame([list(r) for r in feature_rows], columns=plan.feature_order)
+    tops = _top_factors_shap_batch(model, X, top_k=5, model_version=meta.get("model_version"))
+    if tops is None:
+        tops = [_top_factors_fallback(model, top_k=5)] * len(feature_rows)
+    return [json.dumps(t, ensure_ascii=False) for t in tops]
+
+
+def _fallback_factors_json() -> str:
+    """Importâncias globais (JSON) para linhas cujo SHAP adiado não vai mais acontecer."""
+    model, _ = load_artifacts()
+    return json.dumps(_top_factors_fallback(model, top_k=5), ensure_ascii=False)
+
+
+_explanation_pool: Optional[ExplanationPool] = None
+_explanation_pool_lock = threading.Lock()
+
+
+def _get_explanation_pool() -> ExplanationPool:
+    """EXPLAIN_WORKERS threads com fila limitada a EXPLAIN_QUEUE_SIZE jobs (criada no primeiro uso)."""
+    global _explanation_pool
+    with _explanation_pool_lock:
+        if _explanation_pool is None:
+            _explanation_pool = ExplanationPool(
+                _explain_feature_rows,
+                lambda updates: _prediction_backend().set_top_factors(updates),
+                workers=int(os.getenv("EXPLAIN_WORKERS", "2")),
+                maxsize=int(os.getenv("EXPLAIN_QUEUE_SIZE", "1000")),
+                batch_size=int(os.getenv("EXPLAIN_BATCH_SIZE", "64")),
+                fallback=_fallback_factors_json,
+            )
+    return _explanation_pool
+
+
+def _schedule_explanations(rows: List[tuple], first_rowid: int) -> None:
+    jobs = [(first_rowid + i, r[1], r[8]) for i, r in enumerate(rows) if len(r) > 10 and r[10]]
+    if not jobs:
+        return
+    rejected = _get_explanation_pool().submit(jobs)
+    if rejected:
+        # fila cheia: grava as importâncias globais para a linha não ficar pendente para sempre
+        fallback = _fallback_factors_json()
+        _prediction_backend().set_top_factors([(rowid, sid, fallback) for rowid, sid, _ in rejected])
+
+
+def resolve_pending_explanations(before_ts: int) -> None:
+    """Linhas `pending` gravadas antes de `before_ts` recebem as importâncias globais."""
+    try:
+        n = _prediction_backend().resolve_pending(_fallback_factors_json, before_ts)
+    except Exception as e:
+        logger.exception("pending_explanations_resolve_failed", extra={"error": str(e)})
+        return
+    if n:
+        EXPLAIN_JOBS.labels(status="fallback").inc(n)
+        logger.warning("pending_explanations_resolved", extra={"rows": n})
+
+
+_pending_sweep: Optional[threading.Timer] = None
+_pending_sweep_lock = threading.Lock()
+
+
+def start_pending_explanations_sweep() -> None:
+    """
+    Chamado no startup: linhas deixadas `pending` por um processo anterior (queda com jobs
+    na fila do pool) recebem as importâncias globais. Só as gravadas antes deste startup, e
+    só depois de EXPLAIN_PENDING_GRACE_SECONDS (padrão 300; 0 resolve na hora): com vários
+    workers, o que outro worker vivo tinha na fila já foi gravado até lá.
+    """
+    global _pending_sweep
+    cutoff = int(time.time())
+    grace = float(os.getenv("EXPLAIN_PENDING_GRACE_SECONDS", "300"))
+    if grace <= 0:
+        resolve_pending_explanations(cutoff)
+        return
+    with _pending_sweep_lock:
+        if _pending_sweep is None:
+            _pending_sweep = threading.Timer(grace, resolve_pending_explanations, args=(cutoff,))
+            _pending_sweep.name = "pending-explanations-sweep"
+            _pending_sweep.daemon = True
+            _pending_sweep.start()
+
+
+def shutdown_pending_explanations_sweep() -> None:
+    global _pending_sweep
+    with _pending_sweep_lock:
+        if _pending_sweep is not None:
+            _pending_sweep.cancel()
+            _pending_sweep = None
+
+
+def flush_explanations() -> None:
+    if _explanation_pool is not None:
+        _explanation_pool.flush()
+
+
+def shutdown_explanation_pool() -> None:
+    global _explanation_pool
+    with _explanation_pool_lock:
+        if _explanation_pool is not None:
+            _explanation_pool.close()
+            _explanation_pool = None
+
+
+_log_writer: Optional[PredictionLogWriter] = None
+_log_writer_lock = threading.Lock()
+
+
+def _get_log_writer() -> Optional[PredictionLogWriter]:
+    """
+    PREDICTION_LOG_MODE=async (padrão) tira a gravação do caminho do request;
+    sync mantém o INSERT dentro do request.
+    """
+    global _log_writer
+    if os.getenv("PREDICTION_LOG_MODE", "async").lower() != "async":
+        return None
+    with _log_writer_lock:
+        if _log_writer is None:
+            _log_writer = PredictionLogWriter(
+                _write_prediction_rows,
+                maxsize=int(os.getenv("PREDICTION_LOG_QUEUE_SIZE", "10000")),
+                batch_size=int(os.getenv("PREDICTION_LOG_BATCH_SIZE", "500")),
+                overflow=os.getenv("PREDICTION_LOG_OVERFLOW", "block").lower(),
+                spill_path=DATA_DIR / "predictions_spill.ndjson",
+            )
+            atexit.register(shutdown_log_writer)
+    return _log_writer
+
+
+def flush_prediction_log() -> None:
+    if _log_writer is not None:
+        _log_writer.flush()
+
+
+def shutdown_log_writer() -> None:
+    global _log_writer
+    with _log_writer_lock:
+        if _log_writer is not None:
+            _log_writer.close()
+            _log_writer = None
+
+
+def _log_predictions(payloads: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> None:
+    """
+    Enfileira (ou grava, em modo sync) as predições pontuadas. Cada linha leva junto
+    as features monitoradas de drift e a linha tipada do FeaturePlan, para o writer
+    não precisar reparsear o JSON. PREDICTION_PAYLOAD_JSON=0 deixa de gravar o JSON
+    bruto (o /explain reconstrói o payload a partir de prediction_features).
+    """
+    _, meta = load_artifacts()
+    agg = _drift_aggregator(meta)
+    plan = _feature_plan(meta)
+    # sem a tabela prediction_features (backends não-SQLite) o JSON é a única cópia do payload
+    keep_json = os.getenv("PREDICTION_PAYLOAD_JSON", "1") != "0" or _prediction_backend().kind != "sqlite"
+    ts = int(time.time())
+    rows = []
+    for payload, out in zip(payloads, results):
+        row = plan.row(payload)
+        deferred = out.get("explain") == "deferred"
+        rows.append(
             (
-                int(time.time()),
-                student_id,
-                json.dumps(payload, ensure_ascii=False),
-                proba,
-                pred,
+                ts,
+                out["student_id"],
+                json.dumps(payload, ensure_ascii=False) if keep_json else "",
+                out["risk_score"],
+                out["risk_class"],
                 out["model_version"],
-                json.dumps(top, ensure_ascii=False),
-            ),
+                PENDING_FACTORS if deferred else json.dumps(out["top_risk_factors"], ensure_ascii=False),
+                agg.features_from_row(row),
+                row,
+                cohort_values(payload),
+                deferred,
+            )
         )
-        conn.commit()
-        conn.close()
+    writer = _get_log_writer()
+    if writer is not None:
+        writer.submit(rows)
+    else:
+        _write_prediction_rows(rows)
+
+
+_coalescer: Optional[MicroBatcher] = None
+_coalescer_lock = threading.Lock()
+
+
+def _score_and_log(payloads: List[Dict[str, Any]], explain: str = "shap") -> List[Dict[str, Any]]:
+    model, meta = load_artifacts()
+    results = _score_payloads(model, meta, payloads, explain=explain)
+    _log_predictions(payloads, results)
+    return results
+
+
+def _score_and_log_coalesced(items: List[tuple]) -> List[Any]:
+    """
+    Lote do coalescer: itens (payload, explain), pontuados em um lote por modo. Nunca
+    levanta: um grupo que falha é isolado item a item e o item com erro volta como
+    exceção, sem o MicroBatcher repetir (e gravar de novo) os grupos já gravados.
+    """
+    results: List[Any] = [None] * len(items)
+    by_mode: Dict[str, List[int]] = {}
+    for i, (_, mode) in enumerate(items):
+        by_mode.setdefault(mode, []).append(i)
+    for mode, idx in by_mode.items():
+        try:
+            outs: List[Any] = _score_and_log([items[i][0] for i in idx], explain=mode)
+        except Exception:
+            logger.exception("coalesced_group_failed", extra={"explain": mode, "items": len(idx)})
+            outs = []
+            for i in idx:
+                try:
+                    outs.append(_score_and_log([items[i][0]], explain=mode)[0])
+                except Exception as e:
+                    outs.append(e)
+        for i, out in zip(idx, outs):
+            results[i] = out
+    return results
+
+
+def _get_coalescer() -> Optional[MicroBatcher]:
+    """
+    Opt-in: PREDICT_COALESCE_MS > 0 agrupa /predict concorrentes em um único
+    predict_proba (fecha o lote na janela ou em PREDICT_COALESCE_MAX itens).
+    """
+    global _coalescer
+    window_ms = float(os.getenv("PREDICT_COALESCE_MS", "0"))
+    if window_ms <= 0:
+        return None
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = MicroBatcher(
+                _score_and_log_coalesced,
+                max_batch=int(os.getenv("PREDICT_COALESCE_MAX", "64")),
+                window_ms=window_ms,
+            )
+    return _coalescer
+
+
+def shutdown_coalescer() -> None:
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is not None:
+            _coalescer.close()
+            _coalescer = None
+
+
+_ready = threading.Event()
+_warmup_error: Optional[str] = None
+_warmup_thread: Optional[threading.Thread] = None
+_warmup_lock = threading.Lock()
+
+
+def _warmup_payloads(meta: Dict[str, Any], n: int = 8) -> List[Dict[str, Any]]:
+    """Payloads sintéticos: um vazio (tudo imputado) + linhas da amostra de referência do metadata."""
+    sample = (meta.get("drift_reference") or {}).get("sample") or {}
+    cols = [c for c in _feature_plan(meta).feature_order if sample.get(c)]
+    payloads: List[Dict[str, Any]] = [{"student_id": "warmup-0"}]
+    for i in range(1, n):
+        p = {c: sample[c][i % len(sample[c])] for c in cols}
+        p.update(student_id=f"warmup-{i}", FASE_TURMA="1A")
+        payloads.append(p)
+    return payloads
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Carrega artefatos e explainer e passa payloads sintéticos por todos os caminhos de
+    scoring (cada modo de explain, unitário e em lote, e o SHAP do pool adiado) sem
+    gravar nada: chama _score_payloads direto, não o _log_predictions.
+    """
+    t0 = time.perf_counter()
+    model, meta = load_artifacts()
+    explainer = load_shap_explainer()
+    with _startup_stage("warmup"):
+        payloads = _warmup_payloads(meta)
+        for mode in EXPLAIN_MODES:
+            _score_payloads(model, meta, payloads[:1], explain=mode)
+            _score_payloads(model, meta, payloads, explain=mode)
+        _explain_feature_rows(_feature_plan(meta).rows(payloads))
+        _drift_aggregator(meta)
+        # entradas sintéticas não ficam no cache do SHAP
+        SHAP_CACHE.clear()
+    total = time.perf_counter() - t0
+    STARTUP_STAGE_SECONDS.labels(stage="total").set(total)
+    return {"model_version": meta.get("model_version"), "shap": explainer is not None, "seconds": total}
+
+
+def _run_warmup() -> None:
+    global _warmup_error
+    try:
+        info = warm_up()
+    except Exception as e:
+        _warmup_error = str(e)
+        logger.exception("warmup_failed", extra={"error": str(e)})
+        return
+    _warmup_error = None
+    _ready.set()
+    APP_READY.set(1)
+    logger.info("app_ready", extra=info)
+
+
+def start_warmup() -> None:
+    """
+    Chamado no startup. STARTUP_WARMUP=background (padrão) aquece numa thread, com o
+    /health respondendo e o /ready em 503 até terminar; sync bloqueia o startup;
+    off marca pronto sem carregar nada (o primeiro request paga o carregamento).
+    """
+    mode = os.getenv("STARTUP_WARMUP", "background").lower()
+    if mode == "off":
+        _ready.set()
+        APP_READY.set(1)
+    elif mode == "sync":
+        _run_warmup()
+    else:
+        _start_warmup_thread()
+
+
+def _start_warmup_thread() -> None:
+    global _warmup_thread
+    with _warmup_lock:
+        if _ready.is_set() or (_warmup_thread is not None and _warmup_thread.is_alive()):
+            return
+        _warmup_thread = threading.Thread(target=_run_warmup, name="startup-warmup", daemon=True)
+        _warmup_thread.start()
+
+
+def shutdown_warmup() -> None:
+    global _warmup_thread
+    with _warmup_lock:
+        thread, _warmup_thread = _warmup_thread, None
+    if thread is not None:
+        thread.join(timeout=60)
+    _ready.clear()
+    APP_READY.set(0)
+
+
+@router.get("/ready")
+def ready(response: Response):
+    """Readiness: 200 só depois do warm-up; 503 enquanto aquece (ou se falhou, tentando de novo)."""
+    if _ready.is_set():
+        return {"status": "pronto"}
+    response.status_code = 503
+    if _warmup_error is not None:
+        thread = _warmup_thread
+        if thread is None or not thread.is_alive():
+            # ex: Hugging Face fora do ar no boot; cada probe dispara uma nova tentativa
+            _start_warmup_thread()
+        return {"status": "falhou", "error": _warmup_error}
+    return {"status": "aquecendo"}
+
+
+@router.post("/predict")
+def predict(body: PredictRequest, explain: Optional[str] = None):
+    """`explain=none|global|shap` escolhe os top_risk_factors (padrão: PREDICT_EXPLAIN_DEFAULT)."""
+    t0 = time.time()
+    endpoint = "/predict"
+    mode = _explain_mode(explain)
+    try:
+        payload = body.model_dump()
+
+        model, meta = load_artifacts()
+        # entradas do cache valem apenas para os artefatos atualmente carregados
+        PREDICTION_CACHE.ensure_generation((meta.get("model_version"), model))
+        key = (canonical_hash(payload), meta.get("model_version"), mode)
+
+        out = PREDICTION_CACHE.get(key)
+        if out is not None:
+            out = dict(out)
+            _log_predictions([payload], [out])
+        else:
+            coalescer = _get_coalescer()
+            if coalescer is not None:
+                out = coalescer.submit((payload, mode))
+            else:
+                out = _score_and_log([payload], explain=mode)[0]
+            PREDICTION_CACHE.set(key, dict(out))
 
         REQUESTS.labels(endpoint=endpoint, status="200").inc()
         return out
@@ -276,101 +957,773 @@ def predict(body: PredictRequest):
         LATENCY.labels(endpoint=endpoint).observe(time.time() - t0)
 
 
-@router.get("/drift")
-def drift(limit: int = 1000):
-    _, meta = load_artifacts()
+@router.post("/predict/batch")
+def predict_batch(body: PredictBatchRequest, explain: Optional[str] = None):
+    """
+    Scoring em lote: feature engineering, predict_proba, top fatores e INSERT
+    rodam uma vez por lote. Resultados e erros voltam na mesma ordem da entrada.
+    `explain=none|global|shap` vale para o lote inteiro.
+    """
+    t0 = time.time()
+    endpoint = "/predict/batch"
+    mode = _explain_mode(explain)
+    max_items = int(os.getenv("PREDICT_BATCH_MAX", "5000"))
+    if len(body.items) > max_items:
+        REQUESTS.labels(endpoint=endpoint, status="413").inc()
+        raise HTTPException(status_code=413, detail=f"Lote excede o limite de {max_items} itens.")
+
+    try:
+        model, meta = load_artifacts()
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(body.items)
+        valid_idx: List[int] = []
+        payloads: List[Dict[str, Any]] = []
+        for i, item in enumerate(body.items):
+            if not isinstance(item, dict):
+                results[i] = {
+                    "index": i,
+                    "error": [{"type": "dict_type", "loc": [], "msg": "Input should be a valid dictionary", "input": item}],
+                }
+                continue
+            try:
+                payloads.append(PredictRequest.model_validate(item).model_dump())
+                valid_idx.append(i)
+            except ValidationError as e:
+                results[i] = {"index": i, "error": e.errors(include_url=False, include_context=False)}
+
+        if payloads:
+            try:
+                scored = _score_payloads(model, meta, payloads, explain=mode)
+            except Exception:
+                # um item problemático não derruba o lote: isola item a item
+                scored = []
+                for payload in payloads:
+                    try:
+                        scored.append(_score_payloads(model, meta, [payload], explain=mode)[0])
+                    except Exception as e:
+                        scored.append({"error": str(e)})
+
+            ok_payloads, ok_results = [], []
+            for i, payload, out in zip(valid_idx, payloads, scored):
+                results[i] = {"index": i, **out}
+                if "error" not in out:
+                    ok_payloads.append(payload)
+                    ok_results.append(out)
+
+            if ok_results:
+                _log_predictions(ok_payloads, ok_results)
+
+        n_errors = sum(1 for r in results if "error" in r)
+        REQUESTS.labels(endpoint=endpoint, status="200").inc()
+        return {"count": len(results), "n_errors": n_errors, "results": results}
+
+    except Exception as e:
+        REQUESTS.labels(endpoint=endpoint, status="500").inc()
+        logger.exception("predict_batch_error", extra={"error": str(e)})
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        LATENCY.labels(endpoint=endpoint).observe(time.time() - t0)
+
+
+_reference_cache: Dict[str, Any] = {}
+
+
+def _reference_counts(meta: Dict[str, Any]) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Contagens esperadas por bin. Usa `drift_reference` do metadata.json (gerado no
+    treino); modelos antigos sem esse campo caem no train_reference.csv, relido só
+    quando o arquivo muda.
+    """
     bins_map: Dict[str, Any] = meta.get("drift_bins", {})
+    reference = (meta.get("drift_reference") or {}).get("numeric")
+    if reference:
+        if _reference_cache.get("meta") is not meta:
+            _reference_cache.clear()
+            _reference_cache.update(
+                meta=meta,
+                counts={col: np.asarray(c, dtype=float) for col, c in reference.items() if col in bins_map},
+            )
+        return _reference_cache["counts"]
+
+    ref_path = DATA_DIR / "train_reference.csv"
+    if not ref_path.exists():
+        return None
+    st = ref_path.stat()
+    key = (st.st_mtime_ns, st.st_size, canonical_hash(bins_map))
+    if _reference_cache.get("key") != key:
+        ref = pd.read_csv(ref_path)
+        counts = {}
+        for col, bins in bins_map.items():
+            if col in ref.columns:
+                exp = pd.to_numeric(ref[col], errors="coerce").to_numpy()
+                counts[col] = histogram_counts(exp, np.array(bins, dtype=float))
+        _reference_cache.clear()
+        _reference_cache.update(key=key, counts=counts)
+    return _reference_cache["counts"]
+
+
+def _psi_by_feature(ref_counts: Dict[str, np.ndarray], prod_counts: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for col, act in prod_counts.items():
+        exp = ref_counts.get(col)
+        if exp is None:
+            continue
+        if exp.sum() == 0 or act.sum() == 0:
+            results[col] = None
+            continue
+        results[col] = _json_safe_number(psi_from_counts(exp, act))
+    return results
+
+
+def _categorical_drift(agg: DriftAggregator, prod_counts: Dict[str, np.ndarray], detail: bool = True) -> Dict[str, Any]:
+    """PSI (com bucket __unseen__) e qui-quadrado por feature categórica."""
+    results: Dict[str, Any] = {}
+    for col, exp in agg.reference_categorical().items():
+        act = prod_counts.get(col)
+        if act is None or exp.sum() == 0 or act.sum() == 0:
+            results[col] = None
+            continue
+        psi = _json_safe_number(psi_from_counts(exp, act))
+        if not detail:
+            results[col] = psi
+            continue
+        stat, p_value = chi_square_from_counts(exp, act)
+        labels = agg.bucket_labels(col)
+        results[col] = {
+            "psi": psi,
+            "chi2": _json_safe_number(stat),
+            "p_value": _json_safe_number(p_value) if p_value is not None else None,
+            "unseen_rate": float(act[-1] / act.sum()),
+            "production": {labels[i]: int(c) for i, c in enumerate(act) if c},
+        }
+    return results
+
+
+def _drift_window_days(days: Optional[int]) -> int:
+    return int(os.getenv("DRIFT_WINDOW_DAYS", "7")) if days is None else int(days)
+
+
+def compute_drift(days: Optional[int] = None) -> Dict[str, Any]:
+    """
+    PSI por feature (e do risk_score predito) entre a referência de treino e o tráfego
+    logado nos últimos `days` dias (padrão DRIFT_WINDOW_DAYS), somando as janelas diárias
+    de drift_window_hist; `days=0` usa os histogramas acumulados desde o início
+    (O(features x bins) nos dois casos).
+    """
+    _, meta = load_artifacts()
 
     if not DB_PATH.exists():
         return {"message": "Nenhum dado de produção registrado ainda."}
 
-    conn = _db()
-    rows = conn.execute(
-        "SELECT payload FROM predictions ORDER BY ts DESC LIMIT ?",
-        (int(limit),),
-    ).fetchall()
-    conn.close()
+    days = _drift_window_days(days)
+    agg = _drift_aggregator(meta)
+    since = None
+    if days > 0:
+        size = WINDOWS["day"]
+        now = int(time.time())
+        since = now - now % size - (days - 1) * size
+        n_rows, prod_counts = 0, None
+        for _, n, counts in agg.history(_db(), "day", since):
+            n_rows += n
+            prod_counts = counts if prod_counts is None else {k: v + counts[k] for k, v in prod_counts.items()}
+    else:
+        n_rows, prod_counts = agg.snapshot(_db(), STORE.generation)
+    if n_rows == 0:
+        return {"message": "Nenhum dado de produção registrado ainda."}
 
-    if not rows:
+    ref_counts = _reference_counts(meta)
+    if ref_counts is None:
+        return {"message": "Referência de treinamento não encontrada (data/train_reference.csv). Execute novamente o treinamento."}
+
+    results = _psi_by_feature(ref_counts, prod_counts)
+    categorical = _categorical_drift(agg, prod_counts)
+    ranked = [(k, v) for k, v in results.items() if v is not None]
+    ranked += [(k, v["psi"]) for k, v in categorical.items() if v is not None and v["psi"] is not None]
+    worst = sorted(ranked, key=lambda x: x[1], reverse=True)[:10]
+
+    score_ref = DriftAggregator.reference_score(meta)
+    score_act = prod_counts.get(SCORE_FEATURE)
+    score_psi = None
+    if score_ref is not None and score_act is not None and score_ref.sum() > 0 and score_act.sum() > 0:
+        score_psi = _json_safe_number(psi_from_counts(score_ref, score_act))
+
+    return {
+        "n_production_samples": int(n_rows),
+        "window_days": days,
+        "since": since,
+        "psi": results,
+        "categorical": categorical,
+        "risk_score_psi": score_psi,
+        "top_drift": [{"feature": k, "psi": v} for k, v in worst],
+        "guideline": {"no_drift": "<0.10", "moderate": "0.10-0.25", "significant": ">0.25"},
+    }
+
+
+_drift_scheduler: Optional[DriftScheduler] = None
+_drift_scheduler_lock = threading.Lock()
+
+
+def start_drift_scheduler() -> Optional[DriftScheduler]:
+    """
+    Chamado no startup: recalcula o drift a cada DRIFT_REFRESH_SECONDS (0 desliga)
+    e publica os gauges `drift_psi`.
+    """
+    global _drift_scheduler
+    interval = float(os.getenv("DRIFT_REFRESH_SECONDS", "60"))
+    if interval <= 0:
+        return None
+    with _drift_scheduler_lock:
+        if _drift_scheduler is None:
+            # primeira execução só depois do warm-up: ele já carrega os artefatos
+            _drift_scheduler = DriftScheduler(compute_drift, interval=interval, ready=_ready)
+    return _drift_scheduler
+
+
+def shutdown_drift_scheduler() -> None:
+    global _drift_scheduler
+    with _drift_scheduler_lock:
+        if _drift_scheduler is not None:
+            _drift_scheduler.close()
+            _drift_scheduler = None
+
+
+@router.get("/drift")
+def drift(days: Optional[int] = None):
+    """
+    Drift dos últimos `days` dias (padrão DRIFT_WINDOW_DAYS; 0 = todo o histórico).
+    Na janela padrão devolve o último resultado do scheduler (instantâneo); nas demais
+    ou sem scheduler, calcula na hora.
+    """
+    if days is not None and not 0 <= days <= DRIFT_HISTORY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days deve estar entre 0 e {DRIFT_HISTORY_MAX_DAYS}.")
+    scheduler = _drift_scheduler
+    if scheduler is not None and _drift_window_days(days) == _drift_window_days(None):
+        latest = scheduler.latest
+        if latest is not None:
+            return latest
+    return compute_drift(days)
+
+
+_sample_cache: Dict[str, Any] = {}
+
+
+def _reference_sample(meta: Dict[str, Any]) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Amostra de treino para KS/Wasserstein: `drift_reference.sample` do metadata.json;
+    modelos antigos caem nas colunas de drift do train_reference.csv.
+    """
+    sample = (meta.get("drift_reference") or {}).get("sample")
+    if sample:
+        if _sample_cache.get("meta") is not meta:
+            _sample_cache.clear()
+            _sample_cache.update(meta=meta, sample={col: np.asarray(v, dtype=float) for col, v in sample.items()})
+        return _sample_cache["sample"]
+
+    ref_path = DATA_DIR / "train_reference.csv"
+    if not ref_path.exists():
+        return None
+    st = ref_path.stat()
+    key = (st.st_mtime_ns, st.st_size)
+    if _sample_cache.get("key") != key:
+        ref = pd.read_csv(ref_path)
+        cols = [c for c in meta.get("drift_bins", {}) if c in ref.columns]
+        sample = {c: pd.to_numeric(ref[c], errors="coerce").to_numpy(dtype=float) for c in cols}
+        _sample_cache.clear()
+        _sample_cache.update(key=key, sample=sample)
+    return _sample_cache["sample"]
+
+
+_drift_pool: Optional[ProcessPoolExecutor] = None
+_drift_pool_lock = threading.Lock()
+
+
+def _get_drift_pool() -> Optional[ProcessPoolExecutor]:
+    """DRIFT_TESTS_EXECUTOR=process roda KS/Wasserstein num processo separado (fora do GIL da API)."""
+    global _drift_pool
+    if os.getenv("DRIFT_TESTS_EXECUTOR", "inline").lower() != "process":
+        return None
+    with _drift_pool_lock:
+        if _drift_pool is None:
+            _drift_pool = ProcessPoolExecutor(max_workers=int(os.getenv("DRIFT_TESTS_WORKERS", "1")))
+            atexit.register(shutdown_drift_pool)
+    return _drift_pool
+
+
+def shutdown_drift_pool() -> None:
+    global _drift_pool
+    with _drift_pool_lock:
+        if _drift_pool is not None:
+            _drift_pool.shutdown(cancel_futures=True)
+            _drift_pool = None
+
+
+@router.get("/drift/distribution")
+def drift_distribution():
+    """
+    KS, Wasserstein e deslocamento de média por feature entre a amostra de treino e
+    o reservoir de produção (tamanho fixo, com decaimento temporal).
+    """
+    _, meta = load_artifacts()
+
+    if not DB_PATH.exists():
         return {"message": "Nenhum dado de produção registrado ainda."}
 
-    payloads = [json.loads(r[0]) for r in rows]
-    prod = pd.DataFrame(payloads)
-    prod = add_derived_features(prod)
+    agg = _drift_aggregator(meta)
+    n, sample = agg.reservoir_sample(_db(), STORE.generation)
+    if n == 0:
+        return {"message": "Nenhum dado de produção registrado ainda."}
+
+    reference = _reference_sample(meta)
+    if reference is None:
+        return {"message": "Referência de treinamento não encontrada (data/train_reference.csv). Execute novamente o treinamento."}
+
+    pool = _get_drift_pool()
+    if pool is not None:
+        timeout = float(os.getenv("DRIFT_TESTS_TIMEOUT", "30"))
+        try:
+            tests = pool.submit(distribution_tests, reference, sample).result(timeout=timeout)
+        except FuturesTimeout:
+            raise HTTPException(status_code=503, detail="Testes de distribuição excederam o tempo limite.")
+    else:
+        tests = distribution_tests(reference, sample)
+
+    return {
+        "n_reservoir": n,
+        "reservoir_size": agg.reservoir.size,
+        "features": {
+            col: None if r is None else {k: _json_safe_number(v) for k, v in r.items()}
+            for col, r in tests.items()
+        },
+    }
+
+
+# resultado do drift multivariado por estado do log (sem scheduler, /drift/multivariate não refaz o job à toa)
+MULTIVARIATE_CACHE = TTLCache(
+    "drift_multivariate",
+    maxsize=4,
+    ttl=max(float(os.getenv("DRIFT_MV_INTERVAL_SECONDS", "900")), 60.0),
+)
+
+
+def compute_multivariate_drift() -> Dict[str, Any]:
+    """
+    Classificador de domínio (train_reference vs reservoir de produção) num processo
+    separado, com orçamento de CPU/tempo DRIFT_MV_TIME_BUDGET.
+    """
+    _, meta = load_artifacts()
+
+    if not DB_PATH.exists():
+        return {"message": "Nenhum dado de produção registrado ainda."}
 
     ref_path = DATA_DIR / "train_reference.csv"
     if not ref_path.exists():
         return {"message": "Referência de treinamento não encontrada (data/train_reference.csv). Execute novamente o treinamento."}
 
-    ref = pd.read_csv(ref_path)
+    conn = _db()
+    agg = _drift_aggregator(meta)
+    n, sample = agg.reservoir_sample(conn, STORE.generation)
+    min_rows = int(os.getenv("DRIFT_MV_MIN_ROWS", "50"))
+    if n < min_rows:
+        return {"message": f"Amostras de produção insuficientes para o drift multivariado ({n} < {min_rows})."}
+
+    key = (STORE.generation, agg.signature, agg.watermark(conn), ref_path.stat().st_mtime_ns)
+    cached = MULTIVARIATE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    columns = [c for c in sample if c != SCORE_FEATURE]
+    production = np.column_stack([sample[c] for c in columns])
+    result = run_with_budget(
+        domain_classifier_drift,
+        (str(ref_path), columns, production, int(os.getenv("DRIFT_MV_MAX_ROWS", "2000"))),
+        time_budget=float(os.getenv("DRIFT_MV_TIME_BUDGET", "60")),
+    )
+    result = {
+        **{k: _json_safe_number(v) if isinstance(v, float) else v for k, v in result.items()},
+        "guideline": {"no_drift": "<0.60", "moderate": "0.60-0.75", "significant": ">0.75"},
+    }
+    MULTIVARIATE_CACHE.set(key, result)
+    return result
+
 
-    results: Dict[str, Any] = {}
-    for col, bins in bins_map.items():
-        if col not in prod.columns or col not in ref.columns:
-            continue
-        b = np.array(bins, dtype=float)
-        exp = pd.to_numeric(ref[col], errors="coerce").to_numpy()
-        act = pd.to_numeric(prod[col], errors="coerce").to_numpy()
-        results[col] = _json_safe_number(compute_psi(exp, act, b))
+_mv_scheduler: Optional[DriftScheduler] = None
+
+
+def start_multivariate_scheduler() -> Optional[DriftScheduler]:
+    """Roda o drift multivariado a cada DRIFT_MV_INTERVAL_SECONDS (0 desliga)."""
+    global _mv_scheduler
+    interval = float(os.getenv("DRIFT_MV_INTERVAL_SECONDS", "900"))
+    if interval <= 0:
+        return None
+    with _drift_scheduler_lock:
+        if _mv_scheduler is None:
+            _mv_scheduler = DriftScheduler(
+                compute_multivariate_drift,
+                interval=interval,
+                publish=publish_multivariate_gauges,
+                name="drift_multivariate",
+                initial_delay=float(os.getenv("DRIFT_MV_INITIAL_DELAY_SECONDS", "30")),
+                ready=_ready,
+            )
+    return _mv_scheduler
+
+
+def shutdown_multivariate_scheduler() -> None:
+    global _mv_scheduler
+    with _drift_scheduler_lock:
+        if _mv_scheduler is not None:
+            _mv_scheduler.close()
+            _mv_scheduler = None
+
+
+@router.get("/drift/multivariate")
+def drift_multivariate():
+    """
+    Drift multivariado (mudanças correlacionadas, ex: IEG e IDA juntos): AUC de um
+    classificador treino vs produção e as features que mais os separam.
+    """
+    scheduler = _mv_scheduler
+    if scheduler is not None and scheduler.latest is not None:
+        return scheduler.latest
+    try:
+        return compute_multivariate_drift()
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+DRIFT_HISTORY_MAX_DAYS = int(os.getenv("DRIFT_HISTORY_MAX_DAYS", "365"))
+
+
+@router.get("/drift/history")
+def drift_history(granularity: str = "day", days: int = 90):
+    """
+    PSI por feature em janelas consecutivas (hora/dia, UTC) dos últimos `days` dias.
+    Lê só os rollups por janela (drift_window_hist), sem reprocessar o payload.
+    """
+    if granularity not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"granularity deve ser um de {sorted(WINDOWS)}.")
+    # mesmo contrato do /drift?days: fora do intervalo é 400, não um corte silencioso
+    if not 1 <= days <= DRIFT_HISTORY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days deve estar entre 1 e {DRIFT_HISTORY_MAX_DAYS}.")
 
-    worst = sorted(
-        [(k, v) for k, v in results.items() if v is not None],
-        key=lambda x: x[1],
-        reverse=True,
-    )[:10] if results else []
+    _, meta = load_artifacts()
+
+    if not DB_PATH.exists():
+        return {"message": "Nenhum dado de produção registrado ainda."}
+
+    ref_counts = _reference_counts(meta)
+    if ref_counts is None:
+        return {"message": "Referência de treinamento não encontrada (data/train_reference.csv). Execute novamente o treinamento."}
+
+    size = WINDOWS[granularity]
+    now = int(time.time())
+    since = now - now % size - (days * 86400 // size - 1) * size
+    agg = _drift_aggregator(meta)
+    windows = agg.history(_db(), granularity, since)
 
     return {
-        "n_production_samples": int(len(prod)),
-        "psi": results,
-        "top_drift": [{"feature": k, "psi": v} for k, v in worst],
+        "granularity": granularity,
+        "days": days,
+        "since": since,
+        "windows": [
+            {
+                "window_start": start,
+                "window_end": start + size,
+                "n_samples": int(n_rows),
+                "psi": _psi_by_feature(ref_counts, counts),
+                "categorical_psi": _categorical_drift(agg, counts, detail=False),
+            }
+            for start, n_rows, counts in windows
+        ],
         "guideline": {"no_drift": "<0.10", "moderate": "0.10-0.25", "significant": ">0.25"},
     }
 
 
-@router.get("/explain")
-def explain(student_id: str, limit: int = 10):
-    """Return prediction history + latest explanation for a given student_id."""
+@router.get("/analytics/features")
+def analytics_features(days: Optional[int] = None, top: int = 20):
+    """
+    Resumo das features de produção (médias, nulos, histogramas de drift e contagens
+    por categoria) agregado direto no SQLite sobre prediction_features, sem json.loads.
+    """
+    if not 1 <= top <= 1000:
+        raise HTTPException(status_code=400, detail="top deve estar entre 1 e 1000.")
+    _, meta = load_artifacts()
+
     if not DB_PATH.exists():
-        return {"message": "No prediction history yet. Call /predict first."}
+        return {"message": "Nenhum dado de produção registrado ainda."}
 
+    plan = _feature_plan(meta)
+    since = int(time.time()) - int(days) * 86400 if days else None
     conn = _db()
-    rows = conn.execute(
-        """SELECT ts, risk_score, risk_class, model_version, top_factors, payload
-           FROM predictions
-           WHERE student_id = ?
-           ORDER BY ts DESC
-           LIMIT ?""",
-        (student_id, int(limit)),
-    ).fetchall()
-    conn.close()
+    numeric = [c for c in plan.feature_order if c not in plan.categorical]
+    out = feature_summary(conn, numeric, since)
+    out["histograms"] = {
+        col: {"bins": bins, "counts": feature_histogram(conn, col, bins, since)}
+        for col, bins in meta.get("drift_bins", {}).items()
+    }
+    out["categorical"] = {col: category_counts(conn, col, since, top) for col in plan.categorical}
+    return out
+
+
+def _cohort_stats(n: int, total: float, high: int) -> Dict[str, Any]:
+    return {
+        "n": int(n),
+        "mean_risk_score": total / n if n else None,
+        "high_risk_share": high / n if n else None,
+    }
+
+
+@router.get("/analytics/cohorts")
+def analytics_cohorts(
+    dimension: Optional[str] = None, granularity: str = "week", days: Optional[int] = 90, top: int = 50
+):
+    """
+    Por coorte (FASE_TURMA, PEDRA, INSTITUICAO): n, risk_score médio e fração de alto
+    risco no período e em cada bucket (dia/semana). Lê só a tabela cohort_rollup,
+    atualizada a cada predição gravada.
+    """
+    dimensions = [dimension] if dimension else list(COHORT_DIMENSIONS)
+    if any(d not in COHORT_DIMENSIONS for d in dimensions):
+        raise HTTPException(status_code=400, detail=f"dimension deve ser uma de {list(COHORT_DIMENSIONS)}")
+    if granularity not in COHORT_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"granularity deve ser uma de {sorted(COHORT_BUCKETS)}")
+    if not 1 <= top <= 1000:
+        raise HTTPException(status_code=400, detail="top deve estar entre 1 e 1000.")
+
+    since = int(time.time()) - int(days) * 86400 if days else None
+    conn = _db()
+    out: Dict[str, Any] = {"granularity": granularity, "since": since, "dimensions": {}}
+    for dim in dimensions:
+        cohorts: Dict[str, Dict[str, Any]] = {}
+        for cohort, start, n, total, high in cohort_rollups(conn, dim, granularity, since):
+            c = cohorts.setdefault(cohort, {"cohort": cohort, "n": 0, "sum": 0.0, "high": 0, "buckets": []})
+            c["n"] += n
+            c["sum"] += total
+            c["high"] += high
+            c["buckets"].append({"start": int(start), **_cohort_stats(n, total, high)})
+        ranked = sorted(cohorts.values(), key=lambda c: (-c["n"], c["cohort"]))[:top]
+        out["dimensions"][dim] = [
+            {"cohort": c["cohort"], **_cohort_stats(c["n"], c["sum"], c["high"]), "buckets": c["buckets"]}
+            for c in ranked
+        ]
+    return out
+
+
+_ARCHIVE_ITEM_COLUMNS = ("ts", "risk_score", "risk_class", "model_version", "top_factors", "payload", "rowid")
+
+
+def _archive_dir() -> Path:
+    return Path(os.getenv("PREDICTION_ARCHIVE_DIR", str(DEFAULT_ARCHIVE_DIR)))
+
+
+def run_retention() -> Dict[str, Any]:
+    return archive_old_predictions(
+        _db(),
+        _archive_dir(),
+        float(os.getenv("RETENTION_DAYS", "90")),
+        os.getenv("PREDICTION_ARCHIVE_FORMAT", "ndjson"),
+    )
+
+
+_retention_worker: Optional[RetentionWorker] = None
+
+
+def start_retention_worker() -> Optional[RetentionWorker]:
+    """Opt-in: RETENTION_ENABLED=1 arquiva as linhas antigas a cada RETENTION_INTERVAL_SECONDS."""
+    global _retention_worker
+    if os.getenv("RETENTION_ENABLED", "0") != "1":
+        return None
+    with _drift_scheduler_lock:
+        if _retention_worker is None:
+            _retention_worker = RetentionWorker(run_retention, float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600")))
+    return _retention_worker
+
+
+def shutdown_retention_worker() -> None:
+    global _retention_worker
+    with _drift_scheduler_lock:
+        if _retention_worker is not None:
+            _retention_worker.close()
+            _retention_worker = None
+
+
+def _parse_top_factors(top_factors) -> tuple:
+    """(fatores, explain_status): linhas com explicação adiada ainda não calculada ficam "pending"."""
+    if top_factors == PENDING_FACTORS:
+        return [], "pending"
+    try:
+        return (json.loads(top_factors) if top_factors else []), "ready"
+    except Exception:
+        return [], "ready"
+
+
+def _prediction_row_to_item(r) -> Dict[str, Any]:
+    ts, score, cls, ver, top_factors, payload = r[:6]
+    top, status = _parse_top_factors(top_factors)
+    try:
+        pay = json.loads(payload) if payload else {}
+    except Exception:
+        pay = {}
+    return {
+        "ts": int(ts),
+        "risk_score": _json_safe_number(score),
+        "risk_class": int(cls),
+        "risk_level": "alto" if int(cls) == 1 else "baixo",
+        "model_version": ver,
+        "explain_status": status,
+        "top_risk_factors": top,
+        "payload": pay,
+    }
+
+
+def _parse_cursor(cursor: str):
+    """Cursor opaco "ts:rowid" (posição do último item da página anterior)."""
+    try:
+        ts, rowid = cursor.split(":", 1)
+        return int(ts), int(rowid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido; use o next_cursor retornado pela página anterior.")
+
+
+@router.get("/explain")
+def explain(student_id: str, limit: int = 10, cursor: Optional[str] = None, include_archive: bool = False):
+    """
+    Return prediction history + latest explanation for a given student_id.
+
+    Keyset pagination: pass the `next_cursor` of a page as `cursor` to get the
+    next (older) page. Read through the configured prediction backend (SQLite uses
+    the (student_id, ts) index). With include_archive=true, pages continue into the rows moved out by retention.
+    """
+    backend = _prediction_backend()
+    if backend.kind == "sqlite" and not DB_PATH.exists():
+        return {"message": "No prediction history yet. Call /predict first."}
+
+    rows = backend.history(student_id, int(limit), before=_parse_cursor(cursor) if cursor else None)
+
+    if include_archive and len(rows) < int(limit):
+        before = (int(rows[-1][0]), int(rows[-1][6])) if rows else (_parse_cursor(cursor) if cursor else None)
+        archived = archived_history(_archive_dir(), student_id, int(limit) - len(rows), before=before)
+        rows = list(rows) + [tuple(rec[c] for c in _ARCHIVE_ITEM_COLUMNS) for rec in archived]
 
     if not rows:
         return {"message": "No predictions found for this student_id.", "student_id": student_id}
 
-    def _row_to_item(r):
-        ts, score, cls, ver, top_factors, payload = r
-        try:
-            top = json.loads(top_factors) if top_factors else []
-        except Exception:
-            top = []
-        try:
-            pay = json.loads(payload) if payload else {}
-        except Exception:
-            pay = {}
-        return {
-            "ts": int(ts),
-            "risk_score": _json_safe_number(score),
-            "risk_class": int(cls),
-            "risk_level": "alto" if int(cls) == 1 else "baixo",
-            "model_version": ver,
-            "top_risk_factors": top,
-            "payload": pay,
-        }
+    items = [_prediction_row_to_item(r) for r in rows]
+    missing = [r[6] for r in rows if not r[5]]
+    if missing:
+        # payload JSON não gravado (PREDICTION_PAYLOAD_JSON=0): usa as colunas tipadas
+        typed = load_features(_db(), missing)
+        for item, r in zip(items, rows):
+            if not r[5]:
+                item["payload"] = typed.get(int(r[6]), {})
+    last = rows[-1]
+    out: Dict[str, Any] = {
+        "student_id": student_id,
+        "count": len(items),
+    }
+    if cursor is None:
+        out["latest"] = items[0]
+    out["history"] = items
+    out["next_cursor"] = f"{int(last[0])}:{int(last[6])}" if len(rows) == int(limit) else None
+    return out
+
+
+EXPLAIN_FIELDS = (
+    "ts", "risk_score", "risk_class", "risk_level", "model_version", "explain_status", "top_risk_factors", "payload",
+)
+
 
-    items = [_row_to_item(r) for r in rows]
+@router.post("/explain/batch")
+def explain_batch(body: ExplainBatchRequest):
+    """
+    /explain para uma lista de alunos: um SELECT com ROW_NUMBER() por aluno (no
+    backend sqlite) em vez de uma chamada por aluno. Resultados na ordem da entrada.
+    """
+    max_ids = int(os.getenv("EXPLAIN_BATCH_MAX_IDS", "1000"))
+    student_ids = list(dict.fromkeys(body.student_ids))
+    if len(student_ids) > max_ids:
+        raise HTTPException(status_code=413, detail=f"Lote excede o limite de {max_ids} alunos.")
+    fields = list(dict.fromkeys(body.fields)) if body.fields else list(EXPLAIN_FIELDS)
+    unknown = sorted(set(fields) - set(EXPLAIN_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconhecidos: {unknown}; use {list(EXPLAIN_FIELDS)}")
+
+    backend = _prediction_backend()
+    if backend.kind == "sqlite" and not DB_PATH.exists():
+        return {"message": "No prediction history yet. Call /predict first."}
+
+    with_payload = "payload" in fields
+    by_student = backend.history_many(student_ids, body.limit, payload=with_payload)
+
+    typed: Dict[int, Dict[str, Any]] = {}
+    if with_payload and backend.kind == "sqlite":
+        missing = [r[6] for rows in by_student.values() for r in rows if not r[5]]
+        if missing:
+            typed = load_features(_db(), missing)
+
+    results = []
+    for sid in student_ids:
+        history = []
+        for r in by_student.get(sid, []):
+            item = _prediction_row_to_item(r)
+            if with_payload and not r[5]:
+                item["payload"] = typed.get(int(r[6]), {})
+            history.append({k: item[k] for k in fields})
+        results.append({"student_id": sid, "count": len(history), "history": history})
+    return {
+        "count": len(results),
+        "n_found": sum(1 for r in results if r["count"]),
+        "results": results,
+    }
+
+
+def _latest_to_item(r) -> Dict[str, Any]:
+    sid, ts, score, cls, ver, top_factors, _ = r
+    top, status = _parse_top_factors(top_factors)
+    return {
+        "student_id": sid,
+        "ts": int(ts),
+        "risk_score": _json_safe_number(score),
+        "risk_class": int(cls),
+        "risk_level": "alto" if int(cls) == 1 else "baixo",
+        "model_version": ver,
+        "explain_status": status,
+        "top_risk_factors": top,
+    }
+
+
+@router.get("/students/high-risk")
+def students_high_risk(min_score: float = 0.0, limit: int = 50, cursor: Optional[str] = None):
+    """
+    Alunos cuja predição mais recente é de risco alto, do maior risk_score para o menor.
+    Lê a tabela student_latest (uma linha por aluno); `next_cursor` pagina por keyset.
+    """
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit deve estar entre 1 e 1000.")
+    after = None
+    if cursor is not None:
+        try:
+            score, sid = cursor.split(":", 1)
+            after = (float(score), sid)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido; use o next_cursor retornado pela página anterior.")
+
+    rows = _prediction_backend().high_risk(limit, min_score=min_score, after=after)
+    items = [_latest_to_item(r) for r in rows]
+    last = rows[-1] if rows else None
     return {
-        "student_id": student_id,
         "count": len(items),
-        "latest": items[0],
-        "history": items,
+        "students": items,
+        "next_cursor": f"{float(last[2])!r}:{last[0]}" if last is not None and len(rows) == limit else None,
     }
+
+
+@router.get("/students/{student_id}/latest")
+def student_latest(student_id: str):
+    """Risco atual de um aluno: uma leitura por chave em student_latest, sem decodificar o histórico."""
+    row = _prediction_backend().latest(student_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="No predictions found for this student_id.")
+    return _latest_to_item(row)
@@ -0,0 +1,508 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.explanations import PENDING_FACTORS
+from src.utils import logger
+
+
+def _migration_1_base_schema(conn: sqlite3.Connection) -> None:
+    # Base table (newest schema)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS predictions (
+            ts INTEGER NOT NULL,
+            student_id TEXT,
+            payload TEXT NOT NULL,
+            risk_score REAL NOT NULL,
+            risk_class INTEGER NOT NULL,
+            model_version TEXT NOT NULL,
+            top_factors TEXT
+        )"""
+    )
+
+    # Backward compatible migrations (if table was created with older schema)
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(predictions)").fetchall()}
+    if "student_id" not in cols:
+        conn.execute("ALTER TABLE predictions ADD COLUMN student_id TEXT")
+    if "top_factors" not in cols:
+        conn.execute("ALTER TABLE predictions ADD COLUMN top_factors TEXT")
+
+
+def _migration_2_indexes(conn: sqlite3.Connection) -> None:
+    # /explain filtra por student_id e ordena por ts; /drift ordena por ts
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_student_ts ON predictions(student_id, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_ts ON predictions(ts)")
+
+
+def _migration_3_drift_histograms(conn: sqlite3.Connection) -> None:
+    # contagens por bin de drift; `signature` identifica o conjunto de drift_bins do modelo
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS drift_hist (
+            signature TEXT NOT NULL,
+            feature TEXT NOT NULL,
+            bin INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (signature, feature, bin)
+        ) WITHOUT ROWID"""
+    )
+    # n_rows contabilizadas e maior rowid de predictions já incluído nos histogramas
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS drift_state (
+            signature TEXT PRIMARY KEY,
+            n_rows INTEGER NOT NULL,
+            last_rowid INTEGER NOT NULL
+        )"""
+    )
+
+
+def _migration_4_drift_windows(conn: sqlite3.Connection) -> None:
+    # rollups por janela de tempo (hora/dia, UTC) para o /drift/history
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS drift_window_hist (
+            signature TEXT NOT NULL,
+            granularity TEXT NOT NULL,
+            window_start INTEGER NOT NULL,
+            feature TEXT NOT NULL,
+            bin INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (signature, granularity, window_start, feature, bin)
+        ) WITHOUT ROWID"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS drift_window_rows (
+            signature TEXT NOT NULL,
+            granularity TEXT NOT NULL,
+            window_start INTEGER NOT NULL,
+            n_rows INTEGER NOT NULL,
+            PRIMARY KEY (signature, granularity, window_start)
+        ) WITHOUT ROWID"""
+    )
+    # zera o estado para o catch-up reconstruir totais e janelas de forma coerente
+    conn.execute("DELETE FROM drift_hist")
+    conn.execute("DELETE FROM drift_state")
+
+
+def _migration_5_drift_reservoir(conn: sqlite3.Connection) -> None:
+    # amostra (reservoir) com decaimento temporal dos vetores de features de produção
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS drift_reservoir (
+            signature TEXT NOT NULL,
+            priority REAL NOT NULL,
+            ts INTEGER NOT NULL,
+            vec TEXT NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_drift_reservoir_priority ON drift_reservoir(signature, priority)")
+    # reprocessa o histórico para popular a amostra junto com os histogramas
+    conn.execute("DELETE FROM drift_hist")
+    conn.execute("DELETE FROM drift_window_hist")
+    conn.execute("DELETE FROM drift_window_rows")
+    conn.execute("DELETE FROM drift_state")
+
+
+def _migration_6_prediction_features(conn: sqlite3.Connection) -> None:
+    # features tipadas por predição (colunas criadas sob demanda a partir do feature_order)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS prediction_features (
+            pred_rowid INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prediction_features_ts ON prediction_features(ts)")
+
+
+_UPSERT_LATEST = """INSERT INTO student_latest(student_id, ts, pred_rowid, risk_score, risk_class, model_version, top_factors)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(student_id) DO UPDATE SET
+        ts = excluded.ts, pred_rowid = excluded.pred_rowid, risk_score = excluded.risk_score,
+        risk_class = excluded.risk_class, model_version = excluded.model_version, top_factors = excluded.top_factors
+    WHERE excluded.ts > student_latest.ts
+       OR (excluded.ts = student_latest.ts AND excluded.pred_rowid > student_latest.pred_rowid)"""
+
+
+def _migration_7_student_latest(conn: sqlite3.Connection) -> None:
+    # última predição de cada aluno, mantida a cada INSERT (cópia: sobrevive à retenção)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS student_latest (
+            student_id TEXT PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            pred_rowid INTEGER NOT NULL,
+            risk_score REAL NOT NULL,
+            risk_class INTEGER NOT NULL,
+            model_version TEXT NOT NULL,
+            top_factors TEXT
+        ) WITHOUT ROWID"""
+    )
+    # /students/high-risk: filtra risk_class e pagina por (risk_score DESC, student_id)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_student_latest_risk ON student_latest(risk_class, risk_score DESC, student_id)"
+    )
+    conn.execute(
+        """INSERT OR REPLACE INTO student_latest
+           SELECT student_id, ts, rowid, risk_score, risk_class, model_version, top_factors FROM (
+               SELECT student_id, ts, rowid, risk_score, risk_class, model_version, top_factors,
+                      ROW_NUMBER() OVER (PARTITION BY student_id ORDER BY ts DESC, rowid DESC) AS rn
+               FROM predictions WHERE student_id IS NOT NULL
+           ) WHERE rn = 1"""
+    )
+
+
+def _migration_8_cohort_rollups(conn: sqlite3.Connection) -> None:
+    # contagem, soma de risk_score e alto risco por coorte (FASE_TURMA, PEDRA, ...) e período
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS cohort_rollup (
+            dimension TEXT NOT NULL,
+            granularity TEXT NOT NULL,
+            bucket_start INTEGER NOT NULL,
+            cohort TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            sum_score REAL NOT NULL,
+            n_high INTEGER NOT NULL,
+            PRIMARY KEY (dimension, granularity, bucket_start, cohort)
+        ) WITHOUT ROWID"""
+    )
+    # histórico já gravado: reconstruído do zero (payload JSON; linhas sem JSON viram __missing__).
+    # O DELETE torna o backfill idempotente: rodar de novo não soma as mesmas linhas duas vezes.
+    conn.execute("DELETE FROM cohort_rollup")
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT rowid, ts, payload, risk_score, risk_class FROM predictions WHERE rowid > ? ORDER BY rowid LIMIT 5000",
+            (last,),
+        ).fetchall()
+        if not rows:
+            break
+        items = []
+        for _, ts, payload, score, cls in rows:
+            try:
+                values = cohort_values(json.loads(payload) if payload else {})
+            except ValueError:
+                values = cohort_values({})
+            items.append((ts, score, cls, values))
+        update_cohorts(conn, items)
+        last = rows[-1][0]
+
+
+def _migration_9_pending_explanations(conn: sqlite3.Connection) -> None:
+    # índice parcial: só linhas com explicação adiada pendente, para a varredura do startup
+    # (SQLiteBackend.resolve_pending) não ler a tabela inteira; o WHERE das consultas
+    # precisa repetir o literal para o planner usar o índice
+    conn.execute(
+        f"""CREATE INDEX IF NOT EXISTS idx_predictions_pending ON predictions(ts)
+            WHERE top_factors = '{PENDING_FACTORS}'"""
+    )
+
+
+# Ordem importa: a posição (1-based) é a versão gravada em PRAGMA user_version.
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migration_1_base_schema,
+    _migration_2_indexes,
+    _migration_3_drift_histograms,
+    _migration_4_drift_windows,
+    _migration_5_drift_reservoir,
+    _migration_6_prediction_features,
+    _migration_7_student_latest,
+    _migration_8_cohort_rollups,
+    _migration_9_pending_explanations,
+]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Aplica as migrações pendentes (controladas por PRAGMA user_version). Retorna a versão final.
+
+    Cada passo roda sob BEGIN IMMEDIATE e relê a versão já com o lock de escrita: com vários
+    workers abrindo o mesmo arquivo, só um aplica cada passo e os outros o pulam.
+    """
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, step in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version <= current:
+                continue
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        logger.info("sqlite_migration_applied", extra={"version": version})
+    return max(current, len(MIGRATIONS))
+
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _column(name: str) -> str:
+    """Nome de feature como identificador SQL (só letras, dígitos e _)."""
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Nome de coluna inválido para prediction_features: {name!r}")
+    return f'"{name}"'
+
+
+def _sql_value(v: Any) -> Any:
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    return v
+
+
+def feature_columns(conn: sqlite3.Connection) -> List[str]:
+    """Colunas de features existentes em prediction_features."""
+    return [r[1] for r in conn.execute("PRAGMA table_info(prediction_features)") if r[1] not in ("pred_rowid", "ts")]
+
+
+def ensure_feature_columns(conn: sqlite3.Connection, columns: Sequence[str], categorical: Collection[str]) -> None:
+    """Adiciona as colunas que faltam (REAL para numéricas, TEXT para categóricas)."""
+    existing = set(feature_columns(conn))
+    for col in columns:
+        if col not in existing:
+            conn.execute(f"ALTER TABLE prediction_features ADD COLUMN {_column(col)} {'TEXT' if col in categorical else 'REAL'}")
+
+
+def insert_features(
+    conn: sqlite3.Connection,
+    first_rowid: int,
+    ts: Sequence[int],
+    columns: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+) -> None:
+    """Grava as linhas tipadas (FeaturePlan.row) das predições first_rowid, first_rowid + 1, ..."""
+    names = ", ".join(_column(c) for c in columns)
+    marks = ", ".join("?" * (len(columns) + 2))
+    conn.executemany(
+        f"INSERT OR REPLACE INTO prediction_features(pred_rowid, ts, {names}) VALUES ({marks})",
+        [(first_rowid + i, int(t), *[_sql_value(v) for v in row]) for i, (t, row) in enumerate(zip(ts, rows))],
+    )
+
+
+def load_features(conn: sqlite3.Connection, rowids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """{rowid: {feature: valor}} (sem os NULLs) para reconstruir o payload sem JSON."""
+    rowids = [int(r) for r in rowids]
+    if not rowids:
+        return {}
+    cols = feature_columns(conn)
+    names = ", ".join(_column(c) for c in cols)
+    marks = ", ".join("?" * len(rowids))
+    out: Dict[int, Dict[str, Any]] = {}
+    for r in conn.execute(f"SELECT pred_rowid, {names} FROM prediction_features WHERE pred_rowid IN ({marks})", rowids):
+        out[r[0]] = {c: v for c, v in zip(cols, r[1:]) if v is not None}
+    return out
+
+
+def upsert_latest(conn: sqlite3.Connection, first_rowid: int, rows: Sequence[tuple]) -> None:
+    """Atualiza student_latest com um lote recém inserido (rowids contíguos a partir de first_rowid)."""
+    conn.executemany(
+        _UPSERT_LATEST,
+        [
+            (r[1], r[0], first_rowid + i, r[3], r[4], r[5], r[6])
+            for i, r in enumerate(rows)
+            if r[1] is not None
+        ],
+    )
+
+
+COHORT_DIMENSIONS = ("FASE_TURMA", "PEDRA", "INSTITUICAO")
+# semanas começam na segunda-feira 00:00 UTC (o epoch caiu numa quinta)
+COHORT_BUCKETS = {"day": (86400, 0), "week": (7 * 86400, 4 * 86400)}
+MISSING_COHORT = "__missing__"
+
+
+def cohort_bucket(ts: int, granularity: str) -> int:
+    size, offset = COHORT_BUCKETS[granularity]
+    return (int(ts) - offset) // size * size + offset
+
+
+def cohort_values(payload: Dict[str, Any]) -> Dict[str, str]:
+    """Valor de cada dimensão de coorte no payload (ausente/vazio -> __missing__)."""
+    out = {}
+    for dim in COHORT_DIMENSIONS:
+        v = payload.get(dim)
+        if isinstance(v, float) and math.isnan(v):
+            v = None
+        v = "" if v is None else str(v).strip()[:100]
+        out[dim] = v or MISSING_COHORT
+    return out
+
+
+def update_cohorts(conn: sqlite3.Connection, items: Iterable[Tuple[int, float, int, Dict[str, str]]]) -> None:
+    """Soma `items` = (ts, risk_score, risk_class, {dimensão: coorte}) em cohort_rollup."""
+    acc: Dict[Tuple[str, str, int, str], List[float]] = {}
+    for ts, score, cls, values in items:
+        for granularity in COHORT_BUCKETS:
+            start = cohort_bucket(ts, granularity)
+            for dim, cohort in values.items():
+                a = acc.setdefault((dim, granularity, start, cohort), [0, 0.0, 0])
+                a[0] += 1
+                a[1] += float(score)
+                a[2] += int(int(cls) == 1)
+    conn.executemany(
+        """INSERT INTO cohort_rollup(dimension, granularity, bucket_start, cohort, n, sum_score, n_high)
+           VALUES (?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT(dimension, granularity, bucket_start, cohort) DO UPDATE SET
+               n = n + excluded.n, sum_score = sum_score + excluded.sum_score, n_high = n_high + excluded.n_high""",
+        [(*key, n, total, high) for key, (n, total, high) in acc.items()],
+    )
+
+
+def cohort_rollups(
+    conn: sqlite3.Connection, dimension: str, granularity: str, since: Optional[int] = None
+) -> List[Tuple[str, int, int, float, int]]:
+    """[(coorte, bucket_start, n, soma de risk_score, n alto risco)] dos períodos >= since."""
+    where, params = "dimension = ? AND granularity = ?", [dimension, granularity]
+    if since is not None:
+        where += " AND bucket_start >= ?"
+        params.append(cohort_bucket(since, granularity))
+    return conn.execute(
+        f"""SELECT cohort, bucket_start, n, sum_score, n_high FROM cohort_rollup
+           WHERE {where} ORDER BY bucket_start, cohort""",
+        params,
+    ).fetchall()
+
+
+def _since_clause(since: Optional[int]) -> Tuple[str, tuple]:
+    return ("WHERE ts >= ?", (int(since),)) if since is not None else ("", ())
+
+
+def feature_summary(conn: sqlite3.Connection, numeric: Sequence[str], since: Optional[int] = None) -> Dict[str, Any]:
+    """Contagem, nulos, média, mínimo e máximo por feature numérica, calculados no SQLite."""
+    present = set(feature_columns(conn))
+    numeric = [c for c in numeric if c in present]
+    where, params = _since_clause(since)
+    exprs = ["COUNT(*)"]
+    for c in numeric:
+        q = _column(c)
+        exprs += [f"COUNT({q})", f"AVG({q})", f"MIN({q})", f"MAX({q})"]
+    r = conn.execute(f"SELECT {', '.join(exprs)} FROM prediction_features {where}", params).fetchone()
+    n = int(r[0])
+    stats = {}
+    for i, c in enumerate(numeric):
+        count, mean, lo, hi = r[1 + 4 * i: 5 + 4 * i]
+        stats[c] = {"count": int(count), "missing": n - int(count), "mean": mean, "min": lo, "max": hi}
+    return {"n_rows": n, "numeric": stats}
+
+
+def category_counts(conn: sqlite3.Connection, column: str, since: Optional[int] = None, limit: int = 20) -> Dict[str, int]:
+    """Contagem por categoria (GROUP BY no SQLite), da mais frequente para a menos."""
+    if column not in feature_columns(conn):
+        return {}
+    q = _column(column)
+    where, params = _since_clause(since)
+    rows = conn.execute(
+        f"SELECT COALESCE({q}, 'nan'), COUNT(*) FROM prediction_features {where} GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT ?",
+        (*params, int(limit)),
+    ).fetchall()
+    return {k: int(c) for k, c in rows}
+
+
+def feature_histogram(
+    conn: sqlite3.Connection, column: str, edges: Sequence[float], since: Optional[int] = None
+) -> List[int]:
+    """
+    Histograma com a mesma semântica do np.histogram (último bin fechado), calculado
+    no SQLite: o índice do bin é o número de bordas internas <= valor.
+    """
+    edges = [float(e) for e in edges]
+    counts = [0] * (len(edges) - 1)
+    if column not in feature_columns(conn) or not counts:
+        return counts
+    q = _column(column)
+    index = " + ".join(f"({q} >= ?)" for _ in edges[1:-1]) or "0"
+    where, params = _since_clause(since)
+    where = (where + " AND" if where else "WHERE") + f" {q} >= ? AND {q} <= ?"
+    for b, c in conn.execute(
+        f"SELECT {index} AS b, COUNT(*) FROM prediction_features {where} GROUP BY b",
+        (*edges[1:-1], *params, edges[0], edges[-1]),
+    ):
+        counts[int(b)] = int(c)
+    return counts
+
+
+class SQLiteStore:
+    """
+    Conexões SQLite persistentes (uma por thread) com WAL.
+
+    - migrações rodam uma única vez por arquivo de banco, não a cada request;
+    - journal_mode=WAL + synchronous=NORMAL: leitores (/drift, /explain) não bloqueiam o writer;
+    - busy_timeout evita "database is locked" entre workers do uvicorn;
+    - se o arquivo for removido/substituído, todas as conexões são recriadas.
+    """
+
+    def __init__(self, path: Path, busy_timeout_ms: int = 5000):
+        self.path = Path(path)
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._identity: Optional[Tuple[int, int]] = None
+        self._generation = 0
+        self._connections: List[sqlite3.Connection] = []
+
+    def _file_identity(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _open(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+        # só vale para bancos novos; os antigos são convertidos pela retenção (app/retention.py)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _reset_locked(self) -> None:
+        for conn in self._connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._connections = []
+        self._generation += 1
+
+    def connection(self) -> sqlite3.Connection:
+        """Conexão da thread atual (criada e migrada sob demanda)."""
+        identity = self._file_identity()
+        cached = getattr(self._local, "conn", None)
+        if cached is not None and identity is not None and identity == self._identity \
+                and self._local.generation == self._generation:
+            return cached
+
+        with self._lock:
+            # relê sob o lock: outra thread pode ter acabado de criar/migrar o banco, e
+            # resetar com uma identidade velha fecharia conexões que ainda estão em uso
+            identity = self._file_identity()
+            if identity is None or identity != self._identity:
+                # banco novo, removido ou substituído: descarta conexões antigas e migra de novo
+                self._reset_locked()
+                conn = self._open()
+                migrate(conn)
+                self._identity = self._file_identity()
+            else:
+                conn = self._open()
+            self._connections.append(conn)
+            self._local.conn = conn
+            self._local.generation = self._generation
+            return conn
+
+    @property
+    def generation(self) -> int:
+        """Muda sempre que as conexões são recriadas (ex: arquivo do banco substituído)."""
+        return self._generation
+
+    def ensure_schema(self) -> None:
+        """Chamado no startup: cria o banco e aplica migrações antes do primeiro request."""
+        self.connection()
+
+    def close(self) -> None:
+        with self._lock:
+            self._reset_locked()
+            self._identity = None
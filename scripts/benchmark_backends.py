@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Benchmark dos backends do log de predições (app/backends.py): vazão de escrita em
+lotes e latência do histórico por aluno (/explain), com a mesma carga para todos.
+
+Uso:
+    python scripts/benchmark_backends.py [--rows 200000] [--batch 500] [--students 20000]
+                                         [--backends sqlite,segmented,memory]
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.backends import BACKENDS, open_backend  # noqa: E402
+from app.store import SQLiteStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos backends do log de predições.")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--students", type=int, default=20_000)
+    parser.add_argument("--repeats", type=int, default=500)
+    parser.add_argument("--backends", type=str, default=",".join(BACKENDS))
+    args = parser.parse_args()
+
+    payload = json.dumps({"IDADE": 13, "INDE": 6.7, "IEG": 7.1, "IDA": 6.2, "PONTO_VIRADA": 0})
+    top = json.dumps([{"feature": "INDE", "impact": -0.3}])
+    t0 = int(time.time()) - args.rows
+    random.seed(0)
+    batches = [
+        [
+            (t0 + i, f"RA-{random.randrange(args.students)}", payload, random.random(), random.randint(0, 1), "bench", top)
+            for i in range(start, min(start + args.batch, args.rows))
+        ]
+        for start in range(0, args.rows, args.batch)
+    ]
+
+    print(f"{'backend':>10} {'escrita (linhas/s)':>20} {'explain (ms)':>14} {'explain pág.2 (ms)':>20}")
+    for kind in args.backends.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SQLiteStore(Path(tmp) / "bench.sqlite")
+            backend = open_backend(kind, connect=store.connection, directory=Path(tmp) / "log", capacity=args.rows)
+
+            start = time.perf_counter()
+            for batch in batches:
+                backend.append(batch)
+            write_rate = args.rows / (time.perf_counter() - start)
+
+            def student():
+                return f"RA-{random.randrange(args.students)}"
+
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                backend.history(student(), 10)
+            explain_ms = (time.perf_counter() - start) / args.repeats * 1000
+
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                first = backend.history(student(), 10)
+                if first:
+                    backend.history(student(), 10, before=(first[-1][0], first[-1][6]))
+            page_ms = (time.perf_counter() - start) / args.repeats * 1000
+
+            print(f"{kind:>10} {write_rate:>20,.0f} {explain_ms:>14.3f} {page_ms:>20.3f}")
+            backend.close()
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
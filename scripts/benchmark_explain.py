@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Benchmark dos modos de explicação do /predict (explain=none|global|shap).
+
+Mede, para cada modo, vazão e latência (p50/p95) de requisições unitárias disparadas
+por várias threads ao mesmo tempo e o custo por linha quando o lote inteiro é
+pontuado numa única chamada (como no /predict/batch e no coalescer). Não grava
+nada no log de predições: chama o scoring direto.
+
+Uso:
+    python scripts/benchmark_explain.py [--requests 400] [--threads 8] [--batch 256]
+"""
+
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+
+from app.routes import EXPLAIN_MODES, _score_payloads, load_artifacts, load_shap_explainer  # noqa: E402
+
+
+def payload(i):
+    rnd = random.Random(i)
+    return {
+        "student_id": f"RA-{i}",
+        "IDADE": rnd.randint(8, 20),
+        "INDE": round(rnd.uniform(2, 10), 2),
+        "IEG": round(rnd.uniform(2, 10), 2),
+        "IDA": round(rnd.uniform(2, 10), 2),
+        "PONTO_VIRADA": rnd.randint(0, 1),
+        "FASE_TURMA": rnd.choice(["1A", "2B", "3A", "4C", "5G"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos modos de explicação do /predict.")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args()
+
+    model, meta = load_artifacts()
+    if load_shap_explainer() is None:
+        print("aviso: shap indisponível; o modo shap cai no fallback global")
+    payloads = [payload(i) for i in range(args.requests)]
+    batch = [payload(10_000 + i) for i in range(args.batch)]
+
+    print(f"{'modo':>8} {'req/s':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'lote (ms/linha)':>16}")
+    for mode in EXPLAIN_MODES:
+        _score_payloads(model, meta, payloads[:1], explain=mode)  # aquecimento
+
+        def one(p):
+            t0 = time.perf_counter()
+            _score_payloads(model, meta, [p], explain=mode)
+            return time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            latencies = np.array(list(pool.map(one, payloads)))
+        rate = len(payloads) / (time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        _score_payloads(model, meta, batch, explain=mode)
+        per_row = (time.perf_counter() - t0) / len(batch) * 1000
+
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+        print(f"{mode:>8} {rate:>10,.0f} {p50:>10.2f} {p95:>10.2f} {per_row:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
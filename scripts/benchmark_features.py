@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Benchmark da preparação de features para um único payload:
+caminho pandas (add_derived_features + enforce_types + reindex) vs FeaturePlan.
+
+Uso:
+    python scripts/benchmark_features.py [--iterations 2000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pandas as pd  # noqa: E402
+
+from src.feature_engineering import FeaturePlan, add_derived_features  # noqa: E402
+from src.preprocessing import enforce_types  # noqa: E402
+from src.utils import ARTIFACT_DIR, load_json  # noqa: E402
+
+DEFAULT_META = {
+    "feature_order": [
+        "IDADE", "ANOS_NA_PM", "PONTO_VIRADA", "INDE", "IAA", "IEG", "IPS", "IDA",
+        "IPP", "IPV", "IAN", "FASE_TURMA", "PEDRA", "INSTITUICAO", "ANOS_PM_POR_IDADE",
+    ],
+}
+
+PAYLOAD = {
+    "student_id": "RA-1",
+    "IDADE": 13,
+    "INDE": "6,7",
+    "IEG": 7.1,
+    "IDA": 6.2,
+    "PONTO_VIRADA": 0,
+    "FASE_TURMA": "3-A",
+    "PEDRA": "Ametista",
+    "INSTITUICAO": "Escola Estadual",
+}
+
+
+def pandas_path(payload, feature_order):
+    X = add_derived_features(pd.DataFrame([payload]))
+    X = enforce_types(X)
+    return X.reindex(columns=feature_order)
+
+
+def bench(label, fn, iterations):
+    fn()  # aquecimento
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call = (time.perf_counter() - t0) / iterations
+    print(f"  {label:<32} {per_call * 1e6:10.1f} µs/payload")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do FeaturePlan vs caminho pandas.")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    meta_path = ARTIFACT_DIR / "metadata.json"
+    meta = load_json(meta_path) if meta_path.exists() else DEFAULT_META
+    plan = FeaturePlan.from_metadata(meta)
+
+    print(f"Features: {len(plan.feature_order)} | iterações: {args.iterations}")
+    slow = bench("pandas (atual)", lambda: pandas_path(PAYLOAD, plan.feature_order), args.iterations)
+    fast = bench("FeaturePlan.row", lambda: plan.row(PAYLOAD), args.iterations)
+    framed = bench(
+        "FeaturePlan.row + DataFrame",
+        lambda: pd.DataFrame([plan.row(PAYLOAD)], columns=plan.feature_order),
+        args.iterations,
+    )
+    print()
+    print(f"Ganho (row):           {slow / fast:6.1f}x")
+    print(f"Ganho (row+DataFrame): {slow / framed:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
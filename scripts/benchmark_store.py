@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Benchmark das consultas do /explain e do /drift conforme a tabela predictions cresce.
+
+Popula um SQLite temporário (com as migrações/índices de app/store.py) em etapas e,
+a cada etapa, mede a latência das consultas. Com os índices a latência fica estável;
+use --no-indexes para comparar com o full scan + sort.
+
+Uso:
+    python scripts/benchmark_store.py [--rows 2000000] [--steps 5] [--students 50000]
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.store import SQLiteStore  # noqa: E402
+
+EXPLAIN_SQL = """SELECT ts, risk_score, risk_class, model_version, top_factors, payload, rowid
+                 FROM predictions WHERE student_id = ?
+                 ORDER BY ts DESC, rowid DESC LIMIT 10"""
+EXPLAIN_PAGE_SQL = """SELECT ts, risk_score, risk_class, model_version, top_factors, payload, rowid
+                      FROM predictions WHERE student_id = ? AND (ts < ? OR (ts = ? AND rowid < ?))
+                      ORDER BY ts DESC, rowid DESC LIMIT 10"""
+DRIFT_SQL = "SELECT payload FROM predictions ORDER BY ts DESC LIMIT 1000"
+
+
+def fill(conn, start, n, n_students, t0):
+    payload = json.dumps({"IDADE": 13, "INDE": 6.7, "IEG": 7.1, "IDA": 6.2, "PONTO_VIRADA": 0})
+    top = json.dumps([{"feature": "INDE", "impact": -0.3}])
+    chunk = 50_000
+    for offset in range(start, start + n, chunk):
+        size = min(chunk, start + n - offset)
+        rows = [
+            (t0 + i, f"RA-{random.randrange(n_students)}", payload, random.random(), random.randint(0, 1), "bench", top)
+            for i in range(offset, offset + size)
+        ]
+        with conn:
+            conn.executemany("INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def timed(conn, sql, params_fn, repeats):
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        conn.execute(sql, params_fn()).fetchall()
+    return (time.perf_counter() - t0) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latência das consultas do prediction store.")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--students", type=int, default=50_000)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--no-indexes", action="store_true", help="Remove os índices para comparação")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStore(Path(tmp) / "bench.sqlite")
+        conn = store.connection()
+        if args.no_indexes:
+            conn.execute("DROP INDEX IF EXISTS idx_predictions_student_ts")
+            conn.execute("DROP INDEX IF EXISTS idx_predictions_ts")
+
+        t0 = int(time.time()) - args.rows
+        per_step = args.rows // args.steps
+        total = 0
+        print(f"{'linhas':>12} {'explain (ms)':>14} {'explain pág.2 (ms)':>20} {'drift (ms)':>12}")
+        for _ in range(args.steps):
+            fill(conn, total, per_step, args.students, t0)
+            total += per_step
+
+            def student():
+                return (f"RA-{random.randrange(args.students)}",)
+
+            def page2():
+                sid = student()[0]
+                first = conn.execute(EXPLAIN_SQL, (sid,)).fetchall()
+                last = first[-1] if first else (0, 0, 0, 0, 0, 0, 0)
+                return sid, last[0], last[0], last[6]
+
+            e = timed(conn, EXPLAIN_SQL, student, args.repeats)
+            p = timed(conn, EXPLAIN_PAGE_SQL, page2, args.repeats)
+            d = timed(conn, DRIFT_SQL, tuple, max(1, args.repeats // 10))
+            print(f"{total:>12,} {e:>14.3f} {p:>20.3f} {d:>12.3f}")
+
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
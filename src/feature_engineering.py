@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+from typing import Any, Dict, Iterable, List
+
 import numpy as np
 import pandas as pd
 
+from .preprocessing import CATEGORICAL_COLUMNS
+
 
 def add_derived_features(X: pd.DataFrame) -> pd.DataFrame:
     """
@@ -36,3 +40,91 @@ def add_derived_features(X: pd.DataFrame) -> pd.DataFrame:
         X["ANOS_PM_POR_IDADE"] = np.nan
 
     return X
+
+
+_ALIASES = (
+    ("IDADE", ("IDADE_ALUNO_2020",)),
+    ("ANOS_NA_PM", ("ANOS_NA_PM_2020", "ANOS_PM_2020")),
+    ("PONTO_VIRADA", ("PONTO_VIRADA_2020",)),
+)
+
+
+def _to_float(v: Any, comma_decimal: bool) -> float:
+    """Scalar equivalent of pd.to_numeric(errors="coerce") (optionally after ',' -> '.')."""
+    if v is None:
+        return np.nan
+    if isinstance(v, (bool, int, float, np.number)):
+        return float(v)
+    if isinstance(v, str):
+        s = v.replace(",", ".") if comma_decimal else v
+        # float() aceita "1_000" e dígitos não-ASCII; o parser do pandas não
+        if "_" in s or not s.isascii():
+            return np.nan
+        try:
+            return float(s)
+        except ValueError:
+            return np.nan
+    if comma_decimal:
+        return _to_float(str(v), comma_decimal)
+    return np.nan
+
+
+class FeaturePlan:
+    """
+    Plano compilado a partir do metadata.json: payload (dict) -> linha de entrada do modelo.
+
+    Reproduz add_derived_features + enforce_types + _ensure_expected_columns para
+    um único payload, sem criar objetos pandas:
+      - aliases legados (_2020) por presença de chave;
+      - ANOS_PM_POR_IDADE = ANOS_NA_PM / IDADE (idade 0 -> NaN);
+      - numéricas com vírgula decimal -> float (lixo vira NaN);
+      - categóricas -> str; colunas ausentes -> NaN.
+    """
+
+    def __init__(self, feature_order: List[str], categorical: Iterable[str]):
+        self.feature_order = list(feature_order)
+        categorical = set(categorical)
+        self.categorical = [col for col in self.feature_order if col in categorical]
+        self._steps = [(col, col in categorical) for col in self.feature_order]
+
+    @classmethod
+    def from_metadata(cls, meta: Dict[str, Any]) -> "FeaturePlan":
+        feature_order = meta.get("feature_order") or []
+        if not feature_order:
+            feat_cfg = meta.get("features", {})
+            feature_order = list(
+                dict.fromkeys(
+                    (feat_cfg.get("numeric", []) + feat_cfg.get("categorical", []) + feat_cfg.get("derived", []))
+                )
+            )
+        # enforce_types decide categórica vs numérica pela lista fixa
+        return cls(feature_order, CATEGORICAL_COLUMNS)
+
+    def row(self, payload: Dict[str, Any]) -> List[Any]:
+        values = dict(payload)
+        for target, sources in _ALIASES:
+            if target not in values:
+                for src in sources:
+                    if src in values:
+                        values[target] = values[src]
+                        break
+
+        if "IDADE" in values and "ANOS_NA_PM" in values:
+            age = _to_float(values["IDADE"], comma_decimal=False)
+            yrs = _to_float(values["ANOS_NA_PM"], comma_decimal=False)
+            values["ANOS_PM_POR_IDADE"] = yrs / age if age != 0 else np.nan
+        else:
+            values["ANOS_PM_POR_IDADE"] = np.nan
+
+        out: List[Any] = []
+        for col, is_cat in self._steps:
+            if col not in values:
+                out.append(np.nan)
+            elif is_cat:
+                out.append(str(values[col]))
+            else:
+                out.append(_to_float(values[col], comma_decimal=True))
+        return out
+
+    def rows(self, payloads: Iterable[Dict[str, Any]]) -> List[List[Any]]:
+        return [self.row(p) for p in payloads]
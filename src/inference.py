@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+
+class _NumericBlock:
+    """SimpleImputer(median/mean/constant) + StandardScaler exportados como vetores."""
+
+    def __init__(self, columns: List[str], steps: Sequence[Any]):
+        self.columns = list(columns)
+        n = len(self.columns)
+        self.fill = np.full(n, np.nan)
+        self.keep = np.ones(n, dtype=bool)
+        mean = scale = None
+
+        for step in steps:
+            if isinstance(step, SimpleImputer):
+                self.fill = np.asarray(step.statistics_, dtype=float)
+                if not getattr(step, "keep_empty_features", False):
+                    # colunas 100% vazias no treino são descartadas pelo imputer
+                    self.keep = ~np.isnan(self.fill)
+            elif isinstance(step, StandardScaler):
+                if step.with_mean:
+                    mean = np.asarray(step.mean_, dtype=float)
+                if step.with_std:
+                    scale = np.asarray(step.scale_, dtype=float)
+            else:
+                raise ValueError(f"Etapa numérica não suportada: {type(step).__name__}")
+
+        self.n_out = int(self.keep.sum())
+        self.mean = mean if mean is not None else np.zeros(self.n_out)
+        self.scale = scale if scale is not None else np.ones(self.n_out)
+
+    def transform(self, values: np.ndarray) -> np.ndarray:
+        X = np.array(values, dtype=float)
+        X = np.where(np.isnan(X), self.fill, X)[:, self.keep]
+        X -= self.mean
+        X /= self.scale
+        return X
+
+
+class _CategoricalBlock:
+    """SimpleImputer(most_frequent) + OneHotEncoder(handle_unknown=ignore) como dicionários."""
+
+    def __init__(self, columns: List[str], steps: Sequence[Any]):
+        self.columns = list(columns)
+        self.fill: List[Any] = [None] * len(self.columns)
+        self.index: List[Dict[Any, int]] = []
+        self.offsets: List[int] = []
+
+        encoder = None
+        for step in steps:
+            if isinstance(step, SimpleImputer):
+                self.fill = list(step.statistics_)
+            elif isinstance(step, OneHotEncoder):
+                if step.drop is not None:
+                    raise ValueError("OneHotEncoder com drop não é suportado.")
+                encoder = step
+            else:
+                raise ValueError(f"Etapa categórica não suportada: {type(step).__name__}")
+        if encoder is None:
+            raise ValueError("Bloco categórico sem OneHotEncoder.")
+
+        offset = 0
+        for cats in encoder.categories_:
+            self.index.append({c: i for i, c in enumerate(cats)})
+            self.offsets.append(offset)
+            offset += len(cats)
+        self.n_out = offset
+
+    def transform(self, values: np.ndarray) -> np.ndarray:
+        out = np.zeros((values.shape[0], self.n_out), dtype=float)
+        for j, (lookup, offset, fill) in enumerate(zip(self.index, self.offsets, self.fill)):
+            for i, v in enumerate(values[:, j]):
+                if isinstance(v, float) and v != v:
+                    v = fill
+                k = lookup.get(v)
+                if k is not None:
+                    out[i, offset + k] = 1.0
+        return out
+
+
+class NativeForestPipeline:
+    """
+    Pipeline(preprocessor, RandomForestClassifier) achatado em arrays NumPy contíguos.
+
+    Todas as árvores viram vetores únicos (filhos, feature, threshold, probas das folhas)
+    e a travessia é feita para todas as linhas x árvores de uma vez, sem a validação
+    por chamada e o despacho joblib do sklearn. `named_steps` aponta para o pipeline
+    original, então SHAP e importâncias globais continuam funcionando.
+    """
+
+    def __init__(self, pipeline: Pipeline):
+        pre = pipeline.named_steps["preprocessor"]
+        forest = pipeline.named_steps["model"]
+        if not isinstance(pre, ColumnTransformer) or not isinstance(forest, RandomForestClassifier):
+            raise ValueError("Esperado Pipeline(ColumnTransformer, RandomForestClassifier).")
+
+        self.named_steps = pipeline.named_steps
+        self.classes_ = forest.classes_
+        self.feature_names_in_ = list(getattr(pre, "feature_names_in_", []))
+        self.blocks = self._export_preprocessor(pre)
+        self._export_forest(forest)
+
+    @classmethod
+    def from_pipeline(cls, pipeline: Pipeline) -> "NativeForestPipeline":
+        return cls(pipeline)
+
+    @staticmethod
+    def _export_preprocessor(pre: ColumnTransformer) -> List[Any]:
+        blocks: List[Any] = []
+        for name, trans, cols in pre.transformers_:
+            if trans == "drop" or len(cols) == 0:
+                continue
+            if trans == "passthrough":
+                raise ValueError("remainder='passthrough' não é suportado.")
+            steps = [s for _, s in trans.steps] if isinstance(trans, Pipeline) else [trans]
+            if any(isinstance(s, OneHotEncoder) for s in steps):
+                blocks.append(_CategoricalBlock(list(cols), steps))
+            else:
+                blocks.append(_NumericBlock(list(cols), steps))
+        return blocks
+
+    def _export_forest(self, forest: RandomForestClassifier) -> None:
+        left, right, feature, threshold, value, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for est in forest.estimators_:
+            t = est.tree_
+            cl = t.children_left.astype(np.int64)
+            cr = t.children_right.astype(np.int64)
+            is_leaf = cl == -1
+            # folhas apontam para si mesmas: a travessia converge sem ramificar
+            own = np.arange(t.node_count, dtype=np.int64) + offset
+            left.append(np.where(is_leaf, own, cl + offset))
+            right.append(np.where(is_leaf, own, cr + offset))
+            feature.append(np.where(is_leaf, 0, t.feature).astype(np.int64))
+            threshold.append(t.threshold.astype(float))
+
+            v = t.value[:, 0, :].astype(float)
+            norm = v.sum(axis=1, keepdims=True)
+            norm[norm == 0.0] = 1.0
+            value.append(v / norm)
+
+            roots.append(offset)
+            offset += t.node_count
+            max_depth = max(max_depth, int(t.max_depth))
+
+        self.left = np.ascontiguousarray(np.concatenate(left))
+        self.right = np.ascontiguousarray(np.concatenate(right))
+        self.feature = np.ascontiguousarray(np.concatenate(feature))
+        self.threshold = np.ascontiguousarray(np.concatenate(threshold))
+        self.value = np.ascontiguousarray(np.concatenate(value))
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.max_depth = max_depth
+        self.n_estimators = len(roots)
+
+    def _columns(self, X: Any, columns: List[str], dtype: Any) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            return X[columns].to_numpy(dtype=dtype)
+        idx = [self.feature_names_in_.index(c) for c in columns]
+        return np.asarray([[row[i] for i in idx] for row in X], dtype=dtype)
+
+    def transform(self, X: Any) -> np.ndarray:
+        """DataFrame (ou linhas na ordem de feature_names_in_) -> matriz do modelo."""
+        parts = []
+        for block in self.blocks:
+            dtype = object if isinstance(block, _CategoricalBlock) else float
+            parts.append(block.transform(self._columns(X, block.columns, dtype)))
+        return np.hstack(parts) if parts else np.empty((len(X), 0))
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        # o sklearn compara em float32 (DTYPE das árvores)
+        Xt = self.transform(X).astype(np.float32).astype(float)
+        n = Xt.shape[0]
+        rows = np.arange(n)[:, None]
+        nodes = np.broadcast_to(self.roots, (n, self.n_estimators)).copy()
+        for _ in range(self.max_depth):
+            go_left = Xt[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes].sum(axis=1) / self.n_estimators
+
+    def predict(self, X: Any) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
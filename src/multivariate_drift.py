@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import math
+import multiprocessing
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+
+
+def _interpret_auc(auc: Optional[float]) -> str:
+    if auc is None:
+        return "amostras insuficientes"
+    if auc < 0.6:
+        return "sem drift multivariado relevante"
+    if auc < 0.75:
+        return "drift multivariado moderado"
+    return "drift multivariado significativo"
+
+
+def domain_classifier_drift(
+    reference_path: str,
+    columns: Sequence[str],
+    production: np.ndarray,
+    max_rows: int = 2000,
+    n_estimators: int = 50,
+    top_k: int = 5,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """
+    Drift multivariado: treina um classificador para separar linhas do train_reference
+    de linhas recentes de produção. AUC ~0.5 = distribuições indistinguíveis; quanto
+    maior, mais a combinação de features mudou (mesmo com PSI baixo por feature).
+    """
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(seed)
+
+    ref = pd.read_csv(reference_path)
+    keep = [i for i, c in enumerate(columns) if c in ref.columns]
+    columns = [columns[i] for i in keep]
+    if not columns:
+        return {"n_reference": int(len(ref)), "n_production": 0, "features": [], "auc": None,
+                "top_features": [], "interpretation": _interpret_auc(None)}
+    reference = np.column_stack([pd.to_numeric(ref[c], errors="coerce").to_numpy(dtype=float) for c in columns])
+    production = np.asarray(production, dtype=float)[:, keep]
+
+    def _subsample(X: np.ndarray) -> np.ndarray:
+        if X.shape[0] > max_rows:
+            return X[rng.choice(X.shape[0], size=max_rows, replace=False)]
+        return X
+
+    reference, production = _subsample(reference), _subsample(production)
+    n_ref, n_prod = reference.shape[0], production.shape[0]
+    result: Dict[str, Any] = {"n_reference": int(n_ref), "n_production": int(n_prod), "features": list(columns)}
+
+    if min(n_ref, n_prod) < 10:
+        result.update(auc=None, top_features=[], interpretation=_interpret_auc(None))
+        return result
+
+    # imputação pela mediana da referência (a mesma para os dois lados)
+    fill = np.zeros(len(columns))
+    for j in range(len(columns)):
+        observed = reference[:, j][~np.isnan(reference[:, j])]
+        if observed.size:
+            fill[j] = np.median(observed)
+    X = np.vstack([reference, production])
+    X = np.where(np.isnan(X), fill, X)
+    y = np.r_[np.zeros(n_ref, dtype=int), np.ones(n_prod, dtype=int)]
+
+    clf = RandomForestClassifier(
+        n_estimators=n_estimators,
+        max_depth=6,
+        min_samples_leaf=5,
+        class_weight="balanced",
+        random_state=seed,
+        n_jobs=1,
+    )
+    cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=seed)
+    proba = cross_val_predict(clf, X, y, cv=cv, method="predict_proba")[:, 1]
+    auc = float(roc_auc_score(y, proba))
+
+    clf.fit(X, y)
+    order = np.argsort(clf.feature_importances_)[::-1][:top_k]
+    result.update(
+        auc=auc,
+        top_features=[{"feature": columns[i], "importance": float(clf.feature_importances_[i])} for i in order],
+        interpretation=_interpret_auc(auc),
+        elapsed_seconds=time.perf_counter() - t0,
+    )
+    return result
+
+
+def _run_child(conn, cpu_seconds: int, fn: Callable[..., Any], args: tuple) -> None:
+    try:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    except (ImportError, ValueError, OSError):
+        pass
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+    try:
+        conn.send(("ok", fn(*args)))
+    except BaseException as e:  # noqa: BLE001 - o erro volta para o processo pai
+        conn.send(("error", repr(e)))
+    finally:
+        conn.close()
+
+
+def run_with_budget(fn: Callable[..., Any], args: tuple, time_budget: float) -> Any:
+    """
+    Executa `fn(*args)` num processo novo (spawn), com prioridade reduzida e limite de
+    CPU (RLIMIT_CPU) e de tempo de parede iguais a `time_budget` segundos. O processo
+    é encerrado se estourar o orçamento; erros viram RuntimeError/TimeoutError.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(
+        target=_run_child,
+        args=(child, max(1, int(math.ceil(time_budget))), fn, args),
+        name="drift-multivariate",
+        daemon=True,
+    )
+    proc.start()
+    child.close()
+    try:
+        if not parent.poll(time_budget):
+            raise TimeoutError(f"job de drift multivariado excedeu {time_budget:.0f}s")
+        try:
+            status, value = parent.recv()
+        except EOFError:
+            raise RuntimeError("processo do drift multivariado encerrado sem resultado (limite de CPU?)")
+    finally:
+        parent.close()
+        if proc.is_alive():
+            proc.terminate()
+        proc.join(timeout=5)
+    if status != "ok":
+        raise RuntimeError(value)
+    return value
+
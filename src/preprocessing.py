@@ -3,6 +3,8 @@ from __future__ import annotations
 from typing import Tuple
 import pandas as pd
 
+CATEGORICAL_COLUMNS = ("FASE_TURMA", "PEDRA", "INSTITUICAO")
+
 
 def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
@@ -153,8 +155,7 @@ def enforce_types(X: pd.DataFrame) -> pd.DataFrame:
     """
     X = X.copy()
 
-    categorical = ["FASE_TURMA", "PEDRA", "INSTITUICAO"]
-    categorical = [c for c in categorical if c in X.columns]
+    categorical = [c for c in CATEGORICAL_COLUMNS if c in X.columns]
     numeric = [c for c in X.columns if c not in categorical]
 
     for col in numeric:
@@ -19,7 +19,7 @@ from sklearn.ensemble import RandomForestClassifier
 from .preprocessing import split_X_y
 from .feature_engineering import add_derived_features
 from .data_loader import load_all_training_data
-from .utils import ARTIFACT_DIR, DATA_DIR, DEFAULT_MODEL_VERSION, logger, make_bins, save_json
+from .utils import ARTIFACT_DIR, DATA_DIR, DEFAULT_MODEL_VERSION, build_drift_reference, logger, make_bins, save_json
 from .preprocessing import split_X_y, enforce_types
 
 def build_preprocessor(numeric_cols: List[str], categorical_cols: List[str]) -> ColumnTransformer:
@@ -103,6 +103,16 @@ def train(df: pd.DataFrame, model_version: str, save_reference: bool = True) ->
         except Exception:
             continue
 
+    # distribuições esperadas pré-computadas: o /drift não precisa reler o X_train
+    drift_reference = build_drift_reference(
+        {col: pd.to_numeric(X_train[col], errors="coerce").to_numpy() for col in drift_bins},
+        drift_bins,
+        {col: X_train[col].tolist() for col in categorical},
+        top_k=int(os.getenv("DRIFT_TOP_K", "30")),
+        # distribuição do risk_score fora da amostra de treino (validação)
+        risk_scores=proba,
+    )
+
     feature_order = list(X_train.columns)
 
     if save_reference:
@@ -122,6 +132,7 @@ def train(df: pd.DataFrame, model_version: str, save_reference: bool = True) ->
         "metrics": metrics,
         "threshold": THRESHOLD,
         "drift_bins": drift_bins,
+        "drift_reference": drift_reference,
     }
 
     ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
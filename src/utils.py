@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
 
 import numpy as np
 
@@ -13,6 +14,13 @@ ARTIFACT_DIR = Path("app") / "model"
 
 DEFAULT_MODEL_VERSION = "local"
 
+# Categorical drift buckets: top-K categories + these two
+OTHER_BUCKET = "__other__"
+UNSEEN_BUCKET = "__unseen__"
+
+# Fixed deciles for the predicted risk_score distribution (probabilities in [0, 1])
+RISK_SCORE_BINS = np.linspace(0.0, 1.0, 11)
+
 logger = logging.getLogger("pede-mlops")
 if not logger.handlers:
     handler = logging.StreamHandler()
@@ -48,18 +56,18 @@ def make_bins(s, n_bins: int = 10) -> np.ndarray:
     return edges
 
 
-def compute_psi(expected: np.ndarray, actual: np.ndarray, bins: np.ndarray) -> float:
-    """Population Stability Index between expected and actual distributions."""
-    expected = np.asarray(expected, dtype=float)
-    actual = np.asarray(actual, dtype=float)
+def histogram_counts(values, bins: np.ndarray) -> np.ndarray:
+    """np.histogram counts ignoring NaN (values outside the edges are not counted)."""
+    arr = np.asarray(values, dtype=float)
+    arr = arr[~np.isnan(arr)]
+    counts, _ = np.histogram(arr, bins=np.asarray(bins, dtype=float))
+    return counts
 
-    expected = expected[~np.isnan(expected)]
-    actual = actual[~np.isnan(actual)]
-    if expected.size == 0 or actual.size == 0:
-        return float("nan")
 
-    exp_counts, _ = np.histogram(expected, bins=bins)
-    act_counts, _ = np.histogram(actual, bins=bins)
+def psi_from_counts(expected_counts: np.ndarray, actual_counts: np.ndarray) -> float:
+    """PSI from per-bin counts (same smoothing as compute_psi)."""
+    exp_counts = np.asarray(expected_counts, dtype=float)
+    act_counts = np.asarray(actual_counts, dtype=float)
 
     exp_pct = exp_counts / max(exp_counts.sum(), 1)
     act_pct = act_counts / max(act_counts.sum(), 1)
@@ -71,3 +79,177 @@ def compute_psi(expected: np.ndarray, actual: np.ndarray, bins: np.ndarray) -> f
 
     psi = np.sum((act_pct - exp_pct) * np.log(act_pct / exp_pct))
     return float(psi)
+
+
+def compute_psi(expected: np.ndarray, actual: np.ndarray, bins: np.ndarray) -> float:
+    """Population Stability Index between expected and actual distributions."""
+    expected = np.asarray(expected, dtype=float)
+    actual = np.asarray(actual, dtype=float)
+
+    expected = expected[~np.isnan(expected)]
+    actual = actual[~np.isnan(actual)]
+    if expected.size == 0 or actual.size == 0:
+        return float("nan")
+
+    return psi_from_counts(histogram_counts(expected, bins), histogram_counts(actual, bins))
+
+
+def category_frequencies(values: Iterable[Any]) -> Dict[str, int]:
+    """Frequency table of categorical values (as strings, like enforce_types)."""
+    freq: Dict[str, int] = {}
+    for v in values:
+        k = str(v)
+        freq[k] = freq.get(k, 0) + 1
+    return freq
+
+
+def category_hash(value: Any, n_buckets: int) -> int:
+    """Stable (cross-process) hash bucket of a category, as a string."""
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % int(n_buckets)
+
+
+def build_category_vocab(freq: Mapping[str, int], top_k: int = 30, n_hash_buckets: int = 1024) -> Dict[str, Any]:
+    """
+    Bounded drift vocabulary for a categorical column.
+
+    The top-K categories keep their own bucket; the remaining training categories are
+    folded into OTHER_BUCKET and remembered only by hash bucket (`tail_hashes`), so
+    values never seen in training land in UNSEEN_BUCKET (up to hash collisions).
+    `counts` follows `categories + [OTHER_BUCKET, UNSEEN_BUCKET]`.
+    """
+    ranked = sorted(freq.items(), key=lambda kv: (-kv[1], kv[0]))
+    top = ranked[: max(0, int(top_k))]
+    tail = ranked[len(top):]
+    return {
+        "categories": [k for k, _ in top],
+        "counts": [int(c) for _, c in top] + [int(sum(c for _, c in tail)), 0],
+        "tail_hashes": sorted({category_hash(k, n_hash_buckets) for k, _ in tail}),
+        "hash_buckets": int(n_hash_buckets),
+    }
+
+
+def chi_square_from_counts(expected_counts: np.ndarray, actual_counts: np.ndarray) -> Tuple[float, Optional[float]]:
+    """
+    Chi-square goodness of fit of actual counts against the expected proportions
+    (same eps smoothing as psi_from_counts). Returns (statistic, p-value).
+    """
+    from scipy.stats import chi2
+
+    exp_counts = np.asarray(expected_counts, dtype=float)
+    act_counts = np.asarray(actual_counts, dtype=float)
+    n = act_counts.sum()
+    if n == 0 or exp_counts.size < 2:
+        return 0.0, None
+
+    exp_pct = np.clip(exp_counts / max(exp_counts.sum(), 1), 1e-6, 1)
+    expected = exp_pct / exp_pct.sum() * n
+    stat = float(np.sum((act_counts - expected) ** 2 / expected))
+    return stat, float(chi2.sf(stat, exp_counts.size - 1))
+
+
+def ks_2samp(reference: np.ndarray, sample: np.ndarray) -> Tuple[float, float]:
+    """Two-sample Kolmogorov-Smirnov statistic and asymptotic p-value (NumPy, sorted ECDFs)."""
+    from scipy.stats import kstwo
+
+    a = np.sort(np.asarray(reference, dtype=float))
+    b = np.sort(np.asarray(sample, dtype=float))
+    grid = np.concatenate([a, b])
+    cdf_a = np.searchsorted(a, grid, side="right") / a.size
+    cdf_b = np.searchsorted(b, grid, side="right") / b.size
+    d = float(np.max(np.abs(cdf_a - cdf_b)))
+    en = a.size * b.size / (a.size + b.size)
+    return d, float(kstwo.sf(d, max(1, int(round(en)))))
+
+
+def wasserstein_1d(reference: np.ndarray, sample: np.ndarray) -> float:
+    """Earth mover's distance between two 1-D samples (area between the ECDFs)."""
+    a = np.sort(np.asarray(reference, dtype=float))
+    b = np.sort(np.asarray(sample, dtype=float))
+    grid = np.sort(np.concatenate([a, b]))
+    deltas = np.diff(grid)
+    cdf_a = np.searchsorted(a, grid[:-1], side="right") / a.size
+    cdf_b = np.searchsorted(b, grid[:-1], side="right") / b.size
+    return float(np.sum(np.abs(cdf_a - cdf_b) * deltas))
+
+
+def distribution_tests(
+    reference: Mapping[str, np.ndarray],
+    sample: Mapping[str, np.ndarray],
+) -> Dict[str, Optional[Dict[str, float]]]:
+    """
+    KS, Wasserstein and mean shift per feature between a reference sample and a
+    production sample (NaN ignored). Pure function so it can run in a process pool.
+    """
+    out: Dict[str, Optional[Dict[str, float]]] = {}
+    for col, act in sample.items():
+        if col not in reference:
+            continue
+        exp = np.asarray(reference[col], dtype=float)
+        act = np.asarray(act, dtype=float)
+        exp = exp[~np.isnan(exp)]
+        act = act[~np.isnan(act)]
+        if exp.size == 0 or act.size == 0:
+            out[col] = None
+            continue
+        d, p_value = ks_2samp(exp, act)
+        mean_exp, mean_act = float(exp.mean()), float(act.mean())
+        std_exp = float(exp.std())
+        out[col] = {
+            "ks": d,
+            "ks_p_value": p_value,
+            "wasserstein": wasserstein_1d(exp, act),
+            "mean_reference": mean_exp,
+            "mean_production": mean_act,
+            "mean_shift_std": (mean_act - mean_exp) / std_exp if std_exp > 0 else 0.0,
+        }
+    return out
+
+
+def build_drift_reference(
+    numeric: Mapping[str, Any],
+    bins_map: Mapping[str, Any],
+    categorical: Mapping[str, Iterable[Any]],
+    top_k: int = 30,
+    n_hash_buckets: int = 1024,
+    risk_scores: Optional[Iterable[float]] = None,
+    sample_size: int = 2000,
+) -> Dict[str, Any]:
+    """
+    Compact training reference for drift: expected counts per drift bin (numeric),
+    bounded category vocabularies (categorical, see build_category_vocab), a random
+    subsample of up to `sample_size` values per numeric column for KS/Wasserstein
+    and, when given, the predicted risk_score histogram over RISK_SCORE_BINS. Stored
+    in metadata.json so serving does not need the full train_reference.csv.
+    """
+    rng = np.random.default_rng(42)
+
+    def _subsample(values) -> list:
+        arr = np.asarray(values, dtype=float)
+        arr = arr[~np.isnan(arr)]
+        if arr.size > sample_size:
+            arr = rng.choice(arr, size=sample_size, replace=False)
+        return [round(float(v), 6) for v in arr]
+
+    n_rows = 0
+    hist: Dict[str, list] = {}
+    for col, bins in bins_map.items():
+        if col not in numeric:
+            continue
+        values = np.asarray(numeric[col], dtype=float)
+        n_rows = max(n_rows, int(values.size))
+        hist[col] = histogram_counts(values, np.asarray(bins, dtype=float)).astype(int).tolist()
+    reference: Dict[str, Any] = {
+        "n_rows": n_rows,
+        "numeric": hist,
+        "categorical": {
+            col: build_category_vocab(category_frequencies(vals), top_k, n_hash_buckets)
+            for col, vals in categorical.items()
+        },
+        "sample": {col: _subsample(numeric[col]) for col in hist},
+    }
+    if risk_scores is not None:
+        scores = list(risk_scores)
+        reference["risk_score"] = histogram_counts(scores, RISK_SCORE_BINS).astype(int).tolist()
+        reference["sample"]["risk_score"] = _subsample(scores)
+    return reference
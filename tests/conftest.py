@@ -5,3 +5,14 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _flush_prediction_log():
+    """Garante que o log write-behind de um teste não vaze para o próximo."""
+    yield
+    from app.routes import flush_prediction_log
+
+    flush_prediction_log()
@@ -232,4 +232,213 @@ def test_explain_with_history():
         assert len(data["latest"]["top_risk_factors"]) == 1
 
     # Limpa o cache novamente para não interferir em outros testes
-    load_artifacts.cache_clear()
\ No newline at end of file
+    load_artifacts.cache_clear()
+
+def test_predict_batch_preserva_ordem_e_erros():
+    """Garante que o lote devolve resultados e erros na mesma ordem da entrada."""
+    items = [
+        {"student_id": "RA-1", "IDADE": 15, "INDE": 5.5, "IEG": 6.0, "IDA": 4.0},
+        {"student_id": "RA-2", "IDADE": "quinze"},
+        {"student_id": "RA-3", "IDADE": 12, "INDE": 8.0, "IEG": 8.5, "IDA": 9.0},
+    ]
+    r = client.post("/predict/batch", json={"items": items})
+    assert r.status_code == 200
+    data = r.json()
+
+    assert data["count"] == 3
+    assert data["n_errors"] == 1
+    assert [it["index"] for it in data["results"]] == [0, 1, 2]
+    assert data["results"][0]["student_id"] == "RA-1"
+    assert "error" in data["results"][1]
+    assert data["results"][2]["student_id"] == "RA-3"
+
+
+def test_predict_batch_item_que_nao_e_objeto_erra_so_no_indice():
+    items = [None, {"student_id": "RA-1", "IDADE": 15}, 5, "x", [1], {"student_id": "RA-2", "INDE": 7.0}]
+    r = client.post("/predict/batch", json={"items": items})
+    assert r.status_code == 200
+    data = r.json()
+    assert [it["index"] for it in data["results"]] == list(range(6))
+    assert data["n_errors"] == 4
+    assert [i for i, it in enumerate(data["results"]) if "error" in it] == [0, 2, 3, 4]
+    assert data["results"][2]["error"][0]["type"] == "dict_type"
+    assert [data["results"][i]["student_id"] for i in (1, 5)] == ["RA-1", "RA-2"]
+
+
+def test_predict_batch_igual_ao_predict_unitario():
+    """O scoring em lote deve produzir o mesmo risk_score do /predict."""
+    payload = {"student_id": "RA-42", "IDADE": 14, "INDE": 6.1, "IEG": 5.0, "IDA": 6.3, "FASE_TURMA": "3A"}
+    single = client.post("/predict", json=payload).json()
+    batch = client.post("/predict/batch", json={"items": [payload, payload]}).json()
+
+    for item in batch["results"]:
+        assert item["risk_score"] == pytest.approx(single["risk_score"])
+        assert item["risk_class"] == single["risk_class"]
+
+
+def test_predict_batch_limite(monkeypatch):
+    monkeypatch.setenv("PREDICT_BATCH_MAX", "1")
+    r = client.post("/predict/batch", json={"items": [{"IDADE": 10}, {"IDADE": 11}]})
+    assert r.status_code == 413
+
+
+def test_prepare_features_mesma_predicao_do_caminho_pandas():
+    """O FeaturePlan deve gerar exatamente o mesmo predict_proba do caminho pandas."""
+    from app import routes
+    from src.feature_engineering import add_derived_features
+    from src.preprocessing import enforce_types
+
+    model, meta = load_artifacts()
+    payloads = [
+        {"IDADE": 15, "INDE": 6.0, "IEG": 7.0, "IDA": 6.0, "PONTO_VIRADA": 0, "FASE_TURMA": None},
+        {"IDADE": 11, "INDE": "8,5", "IEG": "lixo", "FASE_TURMA": "2A", "INSTITUICAO": "B"},
+        {"IDADE": 0, "ANOS_NA_PM": 3, "IPS": 6.1, "FASE_TURMA": "desconhecida"},
+    ]
+    for payload in payloads:
+        X_old = add_derived_features(pd.DataFrame([payload]))
+        X_old = routes._ensure_expected_columns(enforce_types(X_old), meta)
+        X_new = routes._prepare_features([payload], meta)
+        assert model.predict_proba(X_new)[0, 1] == model.predict_proba(X_old)[0, 1]
+
+
+def test_predict_modos_de_explicacao():
+    """explain=none|global|shap muda só os fatores; o score é o mesmo."""
+    payload = {"student_id": "RA-EXP", "IDADE": 14, "INDE": 4.1, "IEG": 5.0, "IDA": 4.3}
+    out = {mode: client.post("/predict", params={"explain": mode}, json=payload).json() for mode in ("none", "global", "shap")}
+
+    assert {o["risk_score"] for o in out.values()} == {out["shap"]["risk_score"]}
+    assert out["none"]["top_risk_factors"] == []
+    assert out["none"]["explain"] == "none"
+    assert all("importance" in f for f in out["global"]["top_risk_factors"])
+    assert len(out["global"]["top_risk_factors"]) == 5
+
+    batch = client.post("/predict/batch", params={"explain": "none"}, json={"items": [payload]}).json()
+    assert batch["results"][0]["top_risk_factors"] == []
+    assert client.post("/predict", params={"explain": "lime"}, json=payload).status_code == 400
+
+
+def test_shap_em_lote_igual_ao_unitario_e_nomes_em_cache():
+    from app import routes
+
+    model, meta = load_artifacts()
+    if routes.load_shap_explainer() is None:
+        pytest.skip("shap indisponível")
+    payloads = [{"IDADE": 10 + i, "INDE": 3.0 + i, "IEG": 6.0} for i in range(4)]
+    X = routes._prepare_features(payloads, meta)
+    batch = routes._top_factors_shap_batch(model, X)
+    names = routes._feature_names_cache[1]
+    for i in range(len(payloads)):
+        assert routes._top_factors_shap(model, X.iloc[[i]]) == batch[i]
+    # a lista de nomes é resolvida uma vez por preprocessor
+    assert routes._feature_names_cache[1] is names
+
+
+def test_cache_shap_por_vetor_quantizado(monkeypatch):
+    """Repetidos (e quase repetidos, com SHAP_CACHE_DECIMALS) não chamam o explainer de novo."""
+    from app import routes
+
+    model, meta = load_artifacts()
+    explainer = routes.load_shap_explainer()
+    if explainer is None:
+        pytest.skip("shap indisponível")
+    routes.SHAP_CACHE.clear()
+    version = meta.get("model_version")
+    payloads = [{"IDADE": 11, "INDE": 5.0, "IEG": 6.0}, {"IDADE": 15, "INDE": 7.5, "IEG": 3.0}]
+    X = routes._prepare_features(payloads, meta)
+    expected = routes._top_factors_shap_batch(model, X, model_version=version)
+    assert len(routes.SHAP_CACHE) == 2
+
+    calls = []
+    real = explainer.shap_values
+    monkeypatch.setattr(explainer, "shap_values", lambda Xt: calls.append(len(Xt)) or real(Xt))
+    assert routes._top_factors_shap_batch(model, X, model_version=version) == expected
+    assert calls == []
+
+    # só a linha nova passa pelo explainer
+    X3 = routes._prepare_features(payloads + [{"IDADE": 9, "INDE": 2.0, "IEG": 8.0}], meta)
+    assert routes._top_factors_shap_batch(model, X3, model_version=version)[:2] == expected
+    assert calls == [1]
+
+    # perfil quase idêntico: cai na mesma chave quando o vetor é arredondado
+    near = routes._prepare_features([{"IDADE": 11, "INDE": 5.0001, "IEG": 6.0}], meta)
+    monkeypatch.setenv("SHAP_CACHE_DECIMALS", "2")
+    routes.SHAP_CACHE.clear()
+    routes._top_factors_shap_batch(model, X.iloc[[0]], model_version=version)
+    routes._top_factors_shap_batch(model, near, model_version=version)
+    assert calls == [1, 1]
+
+    # outra versão de modelo não reaproveita a entrada
+    routes._top_factors_shap_batch(model, near, model_version="outra")
+    assert calls == [1, 1, 1]
+    routes.SHAP_CACHE.clear()
+
+    text = client.get("/metrics").text
+    assert 'app_cache_hits_total{cache="shap"}' in text
+    assert 'app_cache_entries{cache="shap"}' in text
+
+
+def test_load_artifacts_carrega_uma_vez_com_chamadas_simultaneas():
+    import threading
+    import time
+    from app import routes
+
+    real_load, loads = routes.joblib.load, []
+
+    def slow_load(path):
+        loads.append(threading.current_thread().name)
+        time.sleep(0.2)
+        return real_load(path)
+
+    load_artifacts.cache_clear()
+    try:
+        with patch("app.routes.joblib.load", side_effect=slow_load):
+            threads = [threading.Thread(target=load_artifacts, name=f"t{i}") for i in range(2)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        assert len(loads) == 1
+    finally:
+        load_artifacts.cache_clear()
+
+
+def test_startup_aquece_e_libera_ready(monkeypatch):
+    """STARTUP_WARMUP=sync: /ready só 200 depois do warm-up, sem gravar predições sintéticas."""
+    from app import routes
+    from app.main import create_app
+
+    monkeypatch.setenv("STARTUP_WARMUP", "sync")
+    with TestClient(create_app()) as c:
+        r = c.get("/ready")
+        assert r.status_code == 200
+        assert r.json()["status"] == "pronto"
+        text = c.get("/metrics").text
+        assert 'startup_stage_seconds{stage="warmup"}' in text
+        assert 'startup_stage_seconds{stage="total"}' in text
+        assert "app_ready 1.0" in text
+        routes.flush_prediction_log()
+        assert routes._prediction_backend().history("warmup-0", 10) == []
+        assert len(routes.SHAP_CACHE) == 0
+    # shutdown volta a marcar como não pronto
+    assert not routes._ready.is_set()
+
+
+def test_ready_503_se_warmup_falha_e_tenta_de_novo(monkeypatch):
+    from app import routes
+    from app.main import create_app
+
+    real = routes.load_artifacts
+    monkeypatch.setenv("STARTUP_WARMUP", "sync")
+    monkeypatch.setattr(routes, "load_artifacts", lambda: (_ for _ in ()).throw(RuntimeError("hub fora do ar")))
+    with TestClient(create_app()) as c:
+        assert c.get("/health").json()["status"] == "ativo"
+        r = c.get("/ready")
+        assert r.status_code == 503
+        assert r.json() == {"status": "falhou", "error": "hub fora do ar"}
+
+        # o probe seguinte dispara uma nova tentativa em background
+        routes._warmup_thread.join()
+        monkeypatch.setattr(routes, "load_artifacts", real)
+        c.get("/ready")
+        routes._warmup_thread.join()
+        assert c.get("/ready").status_code == 200
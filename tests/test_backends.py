@@ -0,0 +1,241 @@
+import json
+import threading
+
+import pytest
+
+from app.backends import RingBufferBackend, SegmentedLogBackend, SQLiteBackend, open_backend
+from app.explanations import PENDING_FACTORS
+from app.store import SQLiteStore
+
+
+def _row(ts, sid, score=0.5):
+    return (ts, sid, json.dumps({"IDADE": 12}), score, int(score >= 0.5), "t", "[]")
+
+
+@pytest.fixture(params=["sqlite", "segmented", "memory"])
+def backend(request, tmp_path):
+    store = None
+    if request.param == "sqlite":
+        store = SQLiteStore(tmp_path / "p.sqlite")
+        b = SQLiteBackend(store.connection)
+    elif request.param == "segmented":
+        b = SegmentedLogBackend(tmp_path / "log", segment_bytes=1024)
+    else:
+        b = RingBufferBackend(capacity=10_000)
+    yield b
+    b.close()
+    if store is not None:
+        store.close()
+
+
+def test_conformidade_append_e_historico(backend):
+    first = backend.append([_row(100, "A", 0.1), _row(100, "B"), _row(101, "A", 0.9)])
+    second = backend.append([_row(99, "A", 0.3)])
+    assert second == first + 3
+    assert backend.count() == 4
+
+    rows = backend.history("A", 10)
+    # ordem (ts, rowid) decrescente, colunas iguais às do SELECT do /explain
+    assert [(r[0], r[1], r[6]) for r in rows] == [(101, 0.9, first + 2), (100, 0.1, first), (99, 0.3, second)]
+    assert rows[0][2:6] == (1, "t", "[]", json.dumps({"IDADE": 12}))
+    assert backend.history("Z", 10) == []
+
+
+def test_conformidade_cursor(backend):
+    first = backend.append([_row(100, "A") for _ in range(5)])
+    page = backend.history("A", 2)
+    assert [r[6] for r in page] == [first + 4, first + 3]
+    nxt = backend.history("A", 10, before=(page[-1][0], page[-1][6]))
+    assert [r[6] for r in nxt] == [first + 2, first + 1, first]
+
+
+def test_conformidade_historico_em_lote(backend):
+    backend.append([_row(100 + i, sid, 0.1 * i) for i in range(4) for sid in ("A", "B")])
+    many = backend.history_many(["B", "A", "Z"], 2)
+    assert list(many) == ["B", "A", "Z"]
+    assert many["A"] == backend.history("A", 2)
+    assert many["B"] == backend.history("B", 2)
+    assert many["Z"] == []
+
+    slim = backend.history_many(["A"], 2, payload=False)["A"]
+    assert [r[5] for r in slim] == [None, None]
+    assert [r[:5] + r[6:] for r in slim] == [r[:5] + r[6:] for r in many["A"]]
+
+
+def test_conformidade_ultima_predicao_e_alto_risco(backend):
+    backend.append([_row(100, "A", 0.9), _row(100, "B", 0.8), _row(100, "C", 0.2), _row(100, "D", 0.8)])
+    backend.append([_row(200, "A", 0.3), _row(150, "B", 0.7)])
+    backend.append([_row(90, "C", 0.99)])  # mais antiga que a atual: não substitui
+
+    latest = backend.latest("A")
+    assert (latest[0], latest[1], latest[2], latest[3]) == ("A", 200, 0.3, 0)
+    assert backend.latest("C")[2] == 0.2
+    assert backend.latest("Z") is None
+
+    page = backend.high_risk(2)
+    assert [(r[0], r[2]) for r in page] == [("D", 0.8), ("B", 0.7)]
+    assert backend.high_risk(2, after=(page[-1][2], page[-1][0])) == []
+    assert [r[0] for r in backend.high_risk(10, min_score=0.75)] == ["D"]
+
+
+def test_conformidade_top_factors_adiados(backend):
+    first = backend.append([_row(100, "A"), _row(101, "A")])
+    backend.set_top_factors([(first + 1, "A", '[{"feature": "INDE"}]'), (first, "A", '["old"]')])
+    assert [r[4] for r in backend.history("A", 10)] == ['[{"feature": "INDE"}]', '["old"]']
+    assert backend.latest("A")[5] == '[{"feature": "INDE"}]'
+
+
+def test_conformidade_escrita_concorrente(backend):
+    def write(sid):
+        for i in range(20):
+            backend.append([_row(i, sid)])
+
+    threads = [threading.Thread(target=write, args=(f"S{k}",)) for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert backend.count() == 80
+    ids = [r[6] for k in range(4) for r in backend.history(f"S{k}", 100)]
+    assert len(set(ids)) == 80
+
+
+
+def test_conformidade_alto_risco_paginado_igual_a_ordenacao(backend):
+    import random
+
+    rnd = random.Random(7)
+    backend.append([_row(100 + i % 5, f"S{i % 60}", round(rnd.random(), 2)) for i in range(300)])
+    expected = sorted(
+        (r for r in (backend.latest(f"S{k}") for k in range(60)) if r[3] == 1 and r[2] >= 0.6),
+        key=lambda r: (-r[2], r[0]),
+    )
+    pages, after = [], None
+    while True:
+        page = backend.high_risk(7, min_score=0.6, after=after)
+        if not page:
+            break
+        pages += page
+        after = (page[-1][2], page[-1][0])
+    assert [r[0] for r in pages] == [r[0] for r in expected]
+
+def test_segmentado_reabre_e_descarta_linha_incompleta(tmp_path):
+    b = SegmentedLogBackend(tmp_path / "log", segment_bytes=1024)
+    for i in range(30):
+        b.append([_row(i, "A")])
+    b.close()
+    segments = sorted((tmp_path / "log").glob("segment-*.ndjson"))
+    assert len(segments) > 1
+    with open(segments[-1], "ab") as f:
+        f.write(b'{"rowid": 99, "ts"')  # queda no meio da escrita
+
+    b = SegmentedLogBackend(tmp_path / "log", segment_bytes=1024)
+    assert b.count() == 30
+    b.set_top_factors([(30, "A", '["novo"]')])
+    b.close()
+
+    b = SegmentedLogBackend(tmp_path / "log", segment_bytes=1024)
+    assert b.count() == 30
+    assert b.history("A", 1)[0][4] == '["novo"]'
+    assert b.latest("A")[5] == '["novo"]'
+    assert b.append([_row(50, "A")]) == 31
+    assert [r[6] for r in b.history("A", 2)] == [31, 30]
+    b.close()
+
+
+
+def test_segmentado_rotacao_apaga_segmentos_e_amends(tmp_path):
+    b = SegmentedLogBackend(tmp_path / "log", segment_bytes=1024, max_segments=2)
+    b.append([_row(1, "OLD", 0.9)])
+    b.set_top_factors([(1, "OLD", '["velho"]')])
+    for i in range(40):
+        b.append([_row(10 + i, "A", 0.7)])
+    b.set_top_factors([(41, "A", '["novo"]')])
+
+    assert len(list((tmp_path / "log").glob("segment-*.ndjson"))) == 2
+    assert b.latest("OLD") is None and b.history("OLD", 10) == []
+    assert [r[0] for r in b.high_risk(10)] == ["A"]
+    assert min(b._amended) > 1 and b._amended[41] == '["novo"]'
+    assert b.count() == len(b.history("A", 100))
+    assert b.history("A", 1)[0][4] == '["novo"]'
+    b.close()
+
+    b = SegmentedLogBackend(tmp_path / "log", segment_bytes=1024, max_segments=2)
+    assert b.count() == len(b.history("A", 100)) and 1 not in b._amended
+    assert b.history("A", 1)[0][4] == '["novo"]'
+    b.close()
+
+@pytest.mark.parametrize("kind", ["sqlite", "segmented"])
+def test_pendentes_de_processo_anterior_resolvidos_na_reabertura(kind, tmp_path):
+    def open_(kind):
+        if kind == "sqlite":
+            store = SQLiteStore(tmp_path / "p.sqlite")
+            return SQLiteBackend(store.connection), store
+        return SegmentedLogBackend(tmp_path / "log", segment_bytes=1024), None
+
+    def pending(ts, sid="A"):
+        return (*_row(ts, sid)[:6], PENDING_FACTORS)
+
+    b, store = open_(kind)
+    first = b.append([pending(100), pending(100), _row(102, "B"), pending(500, "C")])
+    b.set_top_factors([(first, "A", '["shap"]')])
+    b.close()
+    if store is not None:
+        store.close()
+
+    b, store = open_(kind)
+    # C (ts 500) é recente: pode estar na fila de outro worker vivo
+    assert b.resolve_pending(lambda: '["global"]', before_ts=200) == 1
+    assert [r[4] for r in b.history("A", 10)] == ['["global"]', '["shap"]']
+    assert b.latest("A")[5] == '["global"]'
+    assert b.history("B", 1)[0][4] == "[]"
+    assert b.latest("C")[5] == PENDING_FACTORS
+    # nada mais pendente antes do corte: o fallback nem é calculado
+    assert b.resolve_pending(lambda: pytest.fail("fallback sem pendentes"), before_ts=200) == 0
+    if store is not None:
+        plan = store.connection().execute(
+            f"EXPLAIN QUERY PLAN SELECT rowid FROM predictions WHERE top_factors = '{PENDING_FACTORS}' AND ts < 200"
+        ).fetchall()
+        assert "idx_predictions_pending" in str(plan)
+    b.close()
+    if store is not None:
+        store.close()
+
+
+def test_anel_descarta_os_mais_antigos():
+    b = RingBufferBackend(capacity=3)
+    b.append([_row(1, "A"), _row(2, "B"), _row(3, "A"), _row(4, "A")])
+    assert b.count() == 3
+    assert [r[0] for r in b.history("A", 10)] == [4, 3]
+    b.append([_row(5, "C")])
+    assert b.history("B", 10) == []
+
+
+def test_backend_invalido():
+    with pytest.raises(ValueError):
+        open_backend("redis")
+
+
+def test_api_com_backend_em_memoria(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+
+    monkeypatch.setenv("PREDICTION_STORE_BACKEND", "memory")
+    monkeypatch.setenv("PREDICTION_PAYLOAD_JSON", "0")
+    routes.shutdown_prediction_backend()
+    try:
+        with TestClient(create_app()) as client:
+            sid = "RA-MEM"
+            for _ in range(3):
+                assert client.post("/predict", json={"student_id": sid, "IDADE": 12}).status_code == 200
+            routes.flush_prediction_log()
+            assert routes._prediction_backend().kind == "memory"
+            body = client.get("/explain", params={"student_id": sid, "limit": 2}).json()
+            assert body["count"] == 2
+            # sem prediction_features, o payload JSON é mantido mesmo com PREDICTION_PAYLOAD_JSON=0
+            assert body["latest"]["payload"]["IDADE"] == 12
+            more = client.get("/explain", params={"student_id": sid, "cursor": body["next_cursor"]}).json()
+            assert more["count"] == 1
+    finally:
+        routes.shutdown_prediction_backend()
@@ -0,0 +1,125 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.batching import MicroBatcher
+
+
+def test_microbatcher_agrupa_chamadas_concorrentes():
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def fn(items):
+        calls.append(len(items))
+        return [x * 10 for x in items]
+
+    mb = MicroBatcher(fn, max_batch=8, window_ms=200)
+
+    def worker(x):
+        barrier.wait()
+        return mb.submit(x, timeout=5)
+
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        results = list(ex.map(worker, range(8)))
+    mb.close()
+
+    # cada chamador recebe o próprio resultado
+    assert results == [x * 10 for x in range(8)]
+    assert sum(calls) == 8
+    assert len(calls) < 8
+
+
+def test_microbatcher_isola_item_com_erro():
+    def fn(items):
+        if any(x < 0 for x in items):
+            raise ValueError("negativo")
+        return items
+
+    mb = MicroBatcher(fn, max_batch=4, window_ms=1)
+    assert mb.submit(3, timeout=5) == 3
+    with pytest.raises(ValueError):
+        mb.submit(-1, timeout=5)
+    mb.close()
+    with pytest.raises(RuntimeError):
+        mb.submit(1)
+
+
+
+def test_microbatcher_falha_lote_com_resultados_a_menos():
+    mb = MicroBatcher(lambda items: items[:-1], max_batch=4, window_ms=1)
+    with pytest.raises(RuntimeError, match="resultados"):
+        mb.submit(1, timeout=5)
+    mb.close()
+
+
+def test_microbatcher_close_falha_pendentes():
+    """Itens ainda na fila quando o close expira recebem erro em vez de esperar para sempre."""
+    started, release = threading.Event(), threading.Event()
+
+    def fn(items):
+        started.set()
+        release.wait(10)
+        return items
+
+    mb = MicroBatcher(fn, max_batch=1, window_ms=0)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        first = ex.submit(mb.submit, 1, 10)
+        assert started.wait(5)  # o worker pegou o primeiro e está preso em fn
+        second = ex.submit(mb.submit, 2, 10)
+        while not mb._queue.qsize():
+            pass
+        mb._thread.join = lambda timeout=None: None  # simula o timeout do join
+        mb.close()
+        with pytest.raises(RuntimeError):
+            second.result(timeout=5)
+        release.set()
+        assert first.result(timeout=5) == 1
+    with pytest.raises(RuntimeError):
+        mb.submit(3)
+
+def test_microbatcher_excecao_por_item():
+    mb = MicroBatcher(lambda items: [ValueError("ruim") if x < 0 else x for x in items], max_batch=4, window_ms=1)
+    assert mb.submit(2, timeout=5) == 2
+    with pytest.raises(ValueError, match="ruim"):
+        mb.submit(-1, timeout=5)
+    mb.close()
+
+
+def test_coalescido_nao_grava_de_novo_grupo_que_deu_certo(monkeypatch):
+    from app import routes
+
+    logged = []
+
+    def score_and_log(payloads, explain="shap"):
+        if explain == "shap" and (len(payloads) > 1 or payloads[0]["x"] < 0):
+            raise ValueError("shap falhou")
+        logged.extend(p["x"] for p in payloads)
+        return [{"x": p["x"]} for p in payloads]
+
+    monkeypatch.setattr(routes, "_score_and_log", score_and_log)
+    items = [({"x": 1}, "none"), ({"x": 2}, "shap"), ({"x": -3}, "shap"), ({"x": 4}, "none")]
+    out = routes._score_and_log_coalesced(items)
+    assert [o["x"] for o in out if isinstance(o, dict)] == [1, 2, 4]
+    assert isinstance(out[2], ValueError)
+    # o grupo "none" foi gravado uma única vez
+    assert sorted(logged) == [1, 2, 4]
+
+
+def test_predict_com_coalescer(monkeypatch):
+    from app import routes
+    from app.main import create_app
+
+    monkeypatch.setenv("PREDICT_COALESCE_MS", "5")
+    monkeypatch.setenv("PREDICT_COALESCE_MAX", "16")
+    payload = {"student_id": "RA-77", "IDADE": 14, "INDE": 6.0, "IEG": 7.0, "IDA": 5.5}
+    with TestClient(create_app()) as client:
+        r = client.post("/predict", json=payload)
+        assert r.status_code == 200
+        assert r.json()["student_id"] == "RA-77"
+        assert routes._coalescer is not None
+        m = client.get("/metrics")
+        assert "predict_coalesce_batch_size" in m.text
+    # lifespan encerra o coalescer
+    assert routes._coalescer is None
@@ -0,0 +1,63 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.cache import TTLCache, canonical_hash
+
+
+def test_canonical_hash_estavel_e_independe_da_ordem():
+    a = {"IDADE": 15, "INDE": 6.5, "FASE_TURMA": "5G"}
+    b = {"FASE_TURMA": "5G", "INDE": 6.5, "IDADE": 15}
+    assert canonical_hash(a) == canonical_hash(b)
+    assert canonical_hash(a) != canonical_hash({**a, "INDE": 6.6})
+    # sha256 hex: determinístico entre processos
+    assert len(canonical_hash(a)) == 64
+
+
+def test_ttl_cache_lru_e_expiracao():
+    cache = TTLCache("teste", maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" vira o mais recente
+    cache.set("c", 3)  # despeja "b"
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_generation_invalida():
+    cache = TTLCache("teste", maxsize=10, ttl=60)
+    cache.ensure_generation(("v1", object))
+    cache.set("k", "v")
+    cache.ensure_generation(("v1", object))
+    assert cache.get("k") == "v"
+    cache.ensure_generation(("v2", object))
+    assert cache.get("k") is None
+
+
+def test_ttl_cache_desligado():
+    cache = TTLCache("teste", maxsize=0)
+    cache.set("k", "v")
+    assert cache.get("k") is None
+
+
+def test_predict_usa_cache_e_invalida_com_novos_artefatos():
+    from app import routes
+    from app.main import app
+
+    client = TestClient(app)
+    payload = {"student_id": "RA-CACHE", "IDADE": 13, "INDE": 6.7, "IEG": 7.1, "IDA": 6.2}
+    routes.PREDICTION_CACHE.clear()
+
+    first = client.post("/predict", json=payload).json()
+    assert len(routes.PREDICTION_CACHE) == 1
+    second = client.post("/predict", json=payload).json()
+    assert second == first
+    assert "app_cache_hits_total" in client.get("/metrics").text
+
+    # recarregar os artefatos troca o objeto do modelo e esvazia o cache
+    routes.load_artifacts.cache_clear()
+    client.post("/predict", json={**payload, "IDADE": 14})
+    assert len(routes.PREDICTION_CACHE) == 1
@@ -83,3 +83,144 @@ def test_explain_endpoint(tmp_path):
     r2 = client.get("/explain", params={"student_id": "unknown"})
     assert r2.status_code == 200
     assert "No predictions" in r2.json().get("message", "")
+
+
+def test_explain_paginacao_por_cursor():
+    db = DATA_DIR / "predictions.sqlite"
+    if db.exists():
+        db.unlink()
+    conn = sqlite3.connect(db)
+    conn.execute(
+        "CREATE TABLE predictions (ts INTEGER, student_id TEXT, payload TEXT, risk_score REAL, risk_class INTEGER, model_version TEXT, top_factors TEXT)"
+    )
+    # dois registros com o mesmo ts: o cursor desempata pelo rowid
+    for ts in (100, 200, 200, 300, 400):
+        conn.execute("INSERT INTO predictions VALUES (?,?,?,?,?,?,?)", (ts, "stu9", "{}", ts / 1000, 0, "v", "[]"))
+    conn.commit()
+    conn.close()
+
+    client = TestClient(create_app())
+    seen = []
+    cursor = None
+    while True:
+        params = {"student_id": "stu9", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/explain", params=params).json()
+        if "history" not in body:
+            break
+        seen.extend(item["ts"] for item in body["history"])
+        assert ("latest" in body) == (cursor is None)
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [400, 300, 200, 200, 100]
+
+    r = client.get("/explain", params={"student_id": "stu9", "cursor": "lixo"})
+    assert r.status_code == 400
+
+
+def test_explain_em_lote_com_projecao():
+    db = DATA_DIR / "predictions.sqlite"
+    if db.exists():
+        db.unlink()
+    conn = sqlite3.connect(db)
+    conn.execute(
+        "CREATE TABLE predictions (ts INTEGER, student_id TEXT, payload TEXT, risk_score REAL, risk_class INTEGER, model_version TEXT, top_factors TEXT)"
+    )
+    for sid in ("stuA", "stuB"):
+        for ts in (100, 200, 300):
+            conn.execute(
+                "INSERT INTO predictions VALUES (?,?,?,?,?,?,?)", (ts, sid, json.dumps({"IDADE": ts}), 0.7, 1, "v", "[]")
+            )
+    conn.commit()
+    conn.close()
+
+    client = TestClient(create_app())
+    body = client.post(
+        "/explain/batch", json={"student_ids": ["stuB", "stuA", "stuB", "nobody"], "limit": 2}
+    ).json()
+    assert [r["student_id"] for r in body["results"]] == ["stuB", "stuA", "nobody"]
+    assert body["n_found"] == 2
+    assert [h["ts"] for h in body["results"][0]["history"]] == [300, 200]
+    assert body["results"][0]["history"][0]["payload"] == {"IDADE": 300}
+    assert body["results"][2]["count"] == 0
+
+    slim = client.post(
+        "/explain/batch", json={"student_ids": ["stuA"], "limit": 1, "fields": ["ts", "risk_level"]}
+    ).json()
+    assert slim["results"][0]["history"] == [{"ts": 300, "risk_level": "alto"}]
+
+    r = client.post("/explain/batch", json={"student_ids": ["stuA"], "fields": ["senha"]})
+    assert r.status_code == 400
+
+
+def test_alunos_alto_risco_e_ultima_predicao():
+    db = DATA_DIR / "predictions.sqlite"
+    if db.exists():
+        db.unlink()
+
+    client = TestClient(create_app())
+    for sid, inde in (("hr1", 2.0), ("hr2", 2.5), ("hr3", 9.5)):
+        assert client.post("/predict", json={"student_id": sid, "IDADE": 16, "INDE": inde}).status_code == 200
+    from app import routes
+
+    routes.flush_prediction_log()
+    latest = client.get("/students/hr1/latest").json()
+    assert latest["student_id"] == "hr1"
+    assert client.get("/students/ninguem/latest").status_code == 404
+
+    high = {
+        r["student_id"]: r["risk_score"] for r in client.get("/students/high-risk", params={"limit": 1000}).json()["students"]
+    }
+    for sid in ("hr1", "hr2", "hr3"):
+        item = client.get(f"/students/{sid}/latest").json()
+        assert (sid in high) == (item["risk_class"] == 1)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/students/high-risk", params=params).json()
+        seen.extend(r["student_id"] for r in body["students"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(high)
+    assert client.get("/students/high-risk", params={"cursor": "lixo"}).status_code == 400
+
+
+def test_analytics_coortes():
+    db = DATA_DIR / "predictions.sqlite"
+    if db.exists():
+        db.unlink()
+
+    client = TestClient(create_app())
+    payloads = [
+        {"student_id": "c1", "IDADE": 16, "INDE": 2.0, "FASE_TURMA": "3-A", "PEDRA": "Quartzo"},
+        {"student_id": "c2", "IDADE": 11, "INDE": 9.0, "FASE_TURMA": "3-A", "PEDRA": "Topázio"},
+        {"student_id": "c3", "IDADE": 12, "INDE": 7.0, "FASE_TURMA": "5-B"},
+    ]
+    r = client.post("/predict/batch", json={"items": payloads})
+    assert r.status_code == 200
+    scores = {x["student_id"]: (x["risk_score"], x["risk_class"]) for x in r.json()["results"]}
+    from app import routes
+
+    routes.flush_prediction_log()
+    body = client.get("/analytics/cohorts", params={"granularity": "day", "days": 7}).json()
+    fase = {c["cohort"]: c for c in body["dimensions"]["FASE_TURMA"]}
+    assert fase["3-A"]["n"] == 2
+    assert abs(fase["3-A"]["mean_risk_score"] - (scores["c1"][0] + scores["c2"][0]) / 2) < 1e-9
+    assert fase["3-A"]["high_risk_share"] == (scores["c1"][1] + scores["c2"][1]) / 2
+    assert len(fase["3-A"]["buckets"]) == 1
+    pedra = {c["cohort"]: c["n"] for c in body["dimensions"]["PEDRA"]}
+    assert pedra == {"Quartzo": 1, "Topázio": 1, "__missing__": 1}
+
+    only = client.get("/analytics/cohorts", params={"dimension": "INSTITUICAO"}).json()
+    assert list(only["dimensions"]) == ["INSTITUICAO"]
+    assert client.get("/analytics/cohorts", params={"dimension": "NOME"}).status_code == 400
+    assert client.get("/analytics/cohorts", params={"granularity": "year"}).status_code == 400
+    for top in (0, -1, 1001):
+        assert client.get("/analytics/cohorts", params={"top": top}).status_code == 400
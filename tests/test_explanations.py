@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.explanations import PENDING_FACTORS, ExplanationPool
+
+
+def test_pool_calcula_em_lote_e_grava():
+    written, batches = [], []
+
+    def explain(rows):
+        batches.append(len(rows))
+        return [json.dumps([{"feature": "x", "impact": r[0]}]) for r in rows]
+
+    pool = ExplanationPool(explain, written.extend, workers=2, maxsize=100, batch_size=8)
+    assert pool.submit([(i, f"s{i}", [float(i)]) for i in range(20)]) == []
+    pool.flush()
+    pool.close()
+    assert sorted(w[0] for w in written) == list(range(20))
+    assert all(json.loads(top)[0]["impact"] == rowid for rowid, _, top in written)
+    assert max(batches) <= 8
+
+
+def test_pool_recusa_com_fila_cheia():
+    gate = threading.Event()
+
+    def explain(rows):
+        gate.wait(5)
+        return ["[]"] * len(rows)
+
+    pool = ExplanationPool(explain, lambda updates: None, workers=1, maxsize=2, batch_size=1)
+    pool.submit([(0, None, [])])
+    time.sleep(0.1)  # o worker pega o primeiro job e fica preso no gate
+    rejected = pool.submit([(i, None, []) for i in range(1, 5)])
+    assert [job[0] for job in rejected] == [3, 4]
+    gate.set()
+    pool.flush()
+    pool.close()
+    assert pool.submit([(9, None, [])]) == [(9, None, [])]
+
+
+def test_pool_grava_fallback_quando_o_shap_falha():
+    written = []
+
+    def explain(rows):
+        raise RuntimeError("shap quebrou")
+
+    pool = ExplanationPool(explain, written.extend, workers=1, maxsize=10, batch_size=4, fallback=lambda: '["global"]')
+    pool.submit([(i, f"s{i}", []) for i in range(3)])
+    pool.flush()
+    pool.close()
+    assert sorted(written) == [(i, f"s{i}", '["global"]') for i in range(3)]
+
+
+def test_pool_close_grava_fallback_dos_jobs_na_fila(monkeypatch):
+    written, gate = [], threading.Event()
+
+    def explain(rows):
+        gate.wait(5)
+        return ['["shap"]'] * len(rows)
+
+    pool = ExplanationPool(explain, written.extend, workers=1, maxsize=10, batch_size=1, fallback=lambda: '["global"]')
+    pool.submit([(0, None, [])])
+    time.sleep(0.1)  # o worker fica preso no primeiro job
+    pool.submit([(1, None, []), (2, None, [])])
+    monkeypatch.setattr(pool._threads[0], "join", lambda timeout=None: None)  # close expira
+    pool.close()
+    assert written == [(1, None, '["global"]'), (2, None, '["global"]')]
+    gate.set()
+
+
+def test_predict_adiado_fica_pronto_no_explain():
+    from app import routes
+    from app.main import create_app
+
+    with TestClient(create_app()) as client:
+        sid = "RA-DEFER"
+        out = client.post("/predict", params={"explain": "deferred"}, json={"student_id": sid, "IDADE": 15, "INDE": 3.0})
+        body = out.json()
+        assert body["explain_status"] == "pending"
+        assert body["top_risk_factors"] == []
+
+        routes.flush_prediction_log()
+        routes.flush_explanations()
+        latest = client.get("/explain", params={"student_id": sid, "limit": 1}).json()["latest"]
+        assert latest["explain_status"] == "ready"
+        assert len(latest["top_risk_factors"]) == 5
+        assert client.get(f"/students/{sid}/latest").json()["top_risk_factors"] == latest["top_risk_factors"]
+
+
+def test_linha_pendente_aparece_como_pending():
+    from app import routes
+
+    item = routes._prediction_row_to_item((1, 0.5, 1, "v", PENDING_FACTORS, "{}", 1))
+    assert item["explain_status"] == "pending"
+    assert item["top_risk_factors"] == []
+
+
+def test_varredura_de_pendentes_espera_a_carencia(monkeypatch):
+    from app import routes
+
+    calls = []
+    monkeypatch.setattr(routes, "resolve_pending_explanations", calls.append)
+    monkeypatch.setenv("EXPLAIN_PENDING_GRACE_SECONDS", "0.2")
+    t0 = int(time.time())
+    routes.start_pending_explanations_sweep()
+    assert calls == []
+    deadline = time.time() + 2
+    while not calls and time.time() < deadline:
+        time.sleep(0.02)
+    routes.shutdown_pending_explanations_sweep()
+    # corte no instante do startup: linhas gravadas depois ficam com os workers vivos
+    assert calls == [t0] or calls == [t0 + 1]
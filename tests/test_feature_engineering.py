@@ -35,3 +35,54 @@ def test_add_derived_missing():
     out = add_derived_features(df)
     assert "ANOS_PM_POR_IDADE" in out.columns
     assert out.empty
+
+
+from src.feature_engineering import FeaturePlan
+from src.preprocessing import enforce_types
+
+META = {
+    "feature_order": [
+        "IDADE", "ANOS_NA_PM", "PONTO_VIRADA", "INDE", "IEG", "IDA",
+        "FASE_TURMA", "PEDRA", "INSTITUICAO", "ANOS_PM_POR_IDADE",
+    ],
+}
+
+PAYLOADS = [
+    {"IDADE": 15, "INDE": 6.0, "IEG": 7.0, "IDA": 6.0, "PONTO_VIRADA": 0},
+    {"IDADE": None, "FASE_TURMA": None, "INDE": "8,5", "IEG": "lixo", "PEDRA": "Ametista"},
+    {"IDADE_ALUNO_2020": 12, "ANOS_PM_2020": 3, "PONTO_VIRADA_2020": True, "FASE_TURMA": "5G"},
+    {"IDADE": 0, "ANOS_NA_PM": 2, "INDE": "6825-05-01", "INSTITUICAO": 7},
+    {"IDADE": "14", "ANOS_NA_PM": "2,0", "IDA": " 7.25 ", "IEG": "1_000"},
+    {"ANOS_NA_PM": 4, "ANOS_NA_PM_2020": 9, "INDE": 5.5, "IDA": float("nan")},
+    {},
+]
+
+
+def _pandas_path(payload, feature_order):
+    X = add_derived_features(pd.DataFrame([payload]))
+    X = enforce_types(X)
+    return X.reindex(columns=feature_order).iloc[0].tolist()
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_feature_plan_igual_ao_caminho_pandas(payload):
+    plan = FeaturePlan.from_metadata(META)
+    expected = _pandas_path(payload, META["feature_order"])
+    got = plan.row(payload)
+
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        if isinstance(e, str):
+            assert g == e
+        elif pd.isna(e):
+            assert isinstance(g, float) and np.isnan(g)
+        else:
+            assert float(g) == float(e)
+
+
+def test_feature_plan_fallback_sem_feature_order():
+    meta = {"features": {"numeric": ["IDADE"], "categorical": ["PEDRA"], "derived": ["ANOS_PM_POR_IDADE"]}}
+    plan = FeaturePlan.from_metadata(meta)
+    assert plan.feature_order == ["IDADE", "PEDRA", "ANOS_PM_POR_IDADE"]
+    row = plan.row({"IDADE": 10, "ANOS_NA_PM": 5, "PEDRA": "Quartzo"})
+    assert row[0] == 10.0 and row[1] == "Quartzo" and row[2] == pytest.approx(0.5)
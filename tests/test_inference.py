@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+from src.inference import NativeForestPipeline
+from src.train import build_preprocessor
+
+
+@pytest.fixture(scope="module")
+def pipeline_and_data():
+    rng = np.random.default_rng(0)
+    n = 300
+    X = pd.DataFrame({
+        "IDADE": rng.integers(8, 20, n).astype(float),
+        "INDE": rng.normal(6.5, 1.5, n),
+        "IEG": rng.normal(7.0, 2.0, n),
+        "VAZIA": np.nan,
+        "FASE_TURMA": rng.choice(["1A", "2B", "3C", "4D"], n),
+        "PEDRA": rng.choice(["Quartzo", "Ágata", "Ametista", "Topázio"], n),
+    })
+    X.loc[rng.choice(n, 30, replace=False), "INDE"] = np.nan
+    y = ((X["INDE"].fillna(6.5) + rng.normal(0, 1, n)) < 6.5).astype(int)
+
+    numeric = ["IDADE", "INDE", "IEG", "VAZIA"]
+    categorical = ["FASE_TURMA", "PEDRA"]
+    clf = Pipeline(steps=[
+        ("preprocessor", build_preprocessor(numeric, categorical)),
+        ("model", RandomForestClassifier(n_estimators=25, min_samples_leaf=2, random_state=0)),
+    ])
+    clf.fit(X, y)
+
+    test = X.sample(80, random_state=1).reset_index(drop=True)
+    test.loc[0, "FASE_TURMA"] = "categoria-nova"
+    test.loc[1, "IEG"] = np.nan
+    test.loc[2, "PEDRA"] = np.nan
+    return clf, test
+
+
+def test_native_forest_paridade_com_sklearn(pipeline_and_data):
+    clf, test = pipeline_and_data
+    native = NativeForestPipeline.from_pipeline(clf)
+
+    expected = clf.predict_proba(test)
+    got = native.predict_proba(test)
+    assert got.shape == expected.shape
+    np.testing.assert_allclose(got, expected, rtol=0, atol=1e-12)
+    assert (native.predict(test) == clf.predict(test)).all()
+
+
+def test_native_forest_transform_igual_preprocessor(pipeline_and_data):
+    clf, test = pipeline_and_data
+    native = NativeForestPipeline.from_pipeline(clf)
+    expected = clf.named_steps["preprocessor"].transform(test)
+    if hasattr(expected, "toarray"):
+        expected = expected.toarray()
+    np.testing.assert_allclose(native.transform(test), expected, rtol=0, atol=1e-12)
+
+
+def test_native_forest_aceita_linhas(pipeline_and_data):
+    clf, test = pipeline_and_data
+    native = NativeForestPipeline.from_pipeline(clf)
+    rows = test[native.feature_names_in_].values.tolist()
+    np.testing.assert_allclose(native.predict_proba(rows), clf.predict_proba(test), atol=1e-12)
+
+
+def test_load_artifacts_backend_native(monkeypatch):
+    from app import routes
+
+    monkeypatch.setenv("INFERENCE_BACKEND", "native")
+    routes.load_artifacts.cache_clear()
+    try:
+        model, _ = routes.load_artifacts()
+        assert isinstance(model, NativeForestPipeline)
+    finally:
+        routes.load_artifacts.cache_clear()
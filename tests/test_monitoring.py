@@ -0,0 +1,444 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.monitoring import DriftAggregator
+from app.store import SQLiteStore
+from src.feature_engineering import FeaturePlan
+from src.utils import compute_psi, psi_from_counts
+
+META = {
+    "model_version": "t",
+    "feature_order": ["IDADE", "INDE", "FASE_TURMA", "ANOS_PM_POR_IDADE"],
+    "drift_bins": {"IDADE": [8, 11, 14, 20], "INDE": [0, 5, 7, 10]},
+}
+
+PAYLOADS = [
+    {"IDADE": 9, "INDE": 4.0},
+    {"IDADE": 12, "INDE": "6,5"},
+    {"IDADE": 15, "INDE": 9.0},
+    {"IDADE": 20, "INDE": None},
+    {"IDADE": 30, "INDE": 7.0},
+]
+
+
+@pytest.fixture()
+def store(tmp_path):
+    s = SQLiteStore(tmp_path / "p.sqlite")
+    yield s
+    s.close()
+
+
+def _insert(conn, agg, payloads, with_features=True):
+    rows = [
+        (i, f"s{i}", json.dumps(p), 0.1, 0, "t", "[]") + ((agg.features(p),) if with_features else ())
+        for i, p in enumerate(payloads)
+    ]
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        agg.catch_up(conn)
+        conn.executemany("INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)", [r[:7] for r in rows])
+        agg.observe_logged(conn, rows)
+
+
+def test_histograma_incremental_igual_ao_np_histogram(store):
+    agg = DriftAggregator(META, FeaturePlan.from_metadata(META))
+    conn = store.connection()
+    _insert(conn, agg, PAYLOADS[:2])
+    _insert(conn, agg, PAYLOADS[2:])
+
+    n, counts = agg.snapshot(conn)
+    assert n == len(PAYLOADS)
+    # mesma semântica do np.histogram: 20 cai no último bin, 30 fica de fora; NaN é ignorado
+    assert counts["IDADE"].tolist() == [1, 1, 2]
+    assert counts["INDE"].tolist() == [1, 1, 2]
+
+
+def test_catch_up_conta_linhas_inseridas_por_fora(store):
+    agg = DriftAggregator(META, FeaturePlan.from_metadata(META))
+    conn = store.connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(i, "x", json.dumps(p), 0.1, 0, "antigo", "[]") for i, p in enumerate(PAYLOADS)],
+        )
+    n, counts = agg.snapshot(conn)
+    assert n == len(PAYLOADS)
+    assert counts["IDADE"].sum() == 4
+
+    # linhas já contabilizadas não são contadas de novo
+    _insert(conn, agg, PAYLOADS[:1], with_features=False)
+    n, counts = agg.snapshot(conn)
+    assert n == len(PAYLOADS) + 1
+    assert counts["IDADE"].sum() == 5
+
+
+def test_catch_up_comita_a_cada_bloco(store, tmp_path):
+    import sqlite3
+
+    agg = DriftAggregator(META, FeaturePlan.from_metadata(META))
+    conn = store.connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(i, "x", json.dumps(p), 0.1, 0, "antigo", "[]") for i, p in enumerate(PAYLOADS)],
+        )
+    other = sqlite3.connect(tmp_path / "p.sqlite")
+    seen, real = [], agg.catch_up
+
+    def spy(c, **kw):
+        # outra conexão enxerga o watermark do bloco anterior já comitado
+        row = other.execute("SELECT last_rowid FROM drift_state WHERE signature = ?", (agg.signature,)).fetchone()
+        seen.append(row[0] if row else 0)
+        return real(c, **kw)
+
+    agg.catch_up = spy
+    agg.ensure_caught_up(conn, chunk=2)
+    other.close()
+    assert seen == [0, 2, 4]
+    assert agg.snapshot(conn)[0] == len(PAYLOADS)
+
+
+def test_rollups_por_janela_somam_o_total(store):
+    agg = DriftAggregator(META, FeaturePlan.from_metadata(META))
+    conn = store.connection()
+    day = 86400
+    rows = [(i * 3600, f"s{i}", json.dumps(p), 0.1, 0, "t", "[]") for i, p in enumerate(PAYLOADS * 8)]
+    with conn:
+        conn.executemany("INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    n, total = agg.snapshot(conn)
+    daily = agg.history(conn, "day", 0)
+    hourly = agg.history(conn, "hour", 0)
+
+    assert [w[0] for w in daily] == [0, day]
+    assert sum(w[1] for w in daily) == sum(w[1] for w in hourly) == n == 40
+    for col in META["drift_bins"]:
+        assert sum(w[2][col] for w in daily).tolist() == total[col].tolist()
+        assert sum(w[2][col] for w in hourly).tolist() == total[col].tolist()
+    # janela inicial filtra pelo início
+    assert [w[0] for w in agg.history(conn, "day", day)] == [day]
+    with pytest.raises(ValueError):
+        agg.history(conn, "week", 0)
+
+
+def test_drift_categorico_com_buckets_limitados(store):
+    from src.utils import build_category_vocab
+
+    freq = {"A": 50, "B": 30, "C": 2, "D": 1}
+    meta = {
+        **META,
+        "drift_reference": {"categorical": {"FASE_TURMA": build_category_vocab(freq, top_k=2, n_hash_buckets=4096)}},
+    }
+    agg = DriftAggregator(meta, FeaturePlan.from_metadata(meta))
+    assert agg.bucket_labels("FASE_TURMA") == ["A", "B", "__other__", "__unseen__"]
+
+    conn = store.connection()
+    payloads = [{"FASE_TURMA": v} for v in ["A", "A", "B", "C", "D", "NOVA", "OUTRA"]] + [{"IDADE": 9}]
+    _insert(conn, agg, payloads)
+
+    _, counts = agg.snapshot(conn)
+    # C e D eram da cauda do treino (__other__); NOVA/OUTRA nunca vistas; ausente -> "nan" (não visto)
+    assert counts["FASE_TURMA"].tolist() == [2, 1, 2, 3]
+    assert agg.reference_categorical()["FASE_TURMA"].tolist() == [50, 30, 3, 0]
+
+
+def test_reservoir_limitado_persistente_e_com_decaimento(tmp_path):
+    from app.monitoring import ReservoirSample
+
+    path = tmp_path / "r.sqlite"
+    store = SQLiteStore(path)
+    conn = store.connection()
+    res = ReservoirSample("sig", ["IDADE", "INDE"], size=200, half_life=3600)
+    # 10 lotes, um por hora: os mais recentes devem dominar a amostra
+    for hour in range(10):
+        items = [(hour * 3600, {"IDADE": float(hour), "INDE": np.nan}) for _ in range(200)]
+        with conn:
+            res.offer(conn, items)
+    store.close()
+
+    # reabre: a amostra persiste no SQLite
+    store = SQLiteStore(path)
+    n, sample = ReservoirSample("sig", ["IDADE", "INDE"], size=200).load(store.connection())
+    store.close()
+    assert n == 200
+    assert np.isnan(sample["INDE"]).all()
+    recent = (sample["IDADE"] >= 7).mean()
+    assert recent > 0.7
+    assert sample["IDADE"].min() < 9  # ainda mistura janelas anteriores
+
+
+def test_psi_por_contagens_igual_compute_psi():
+    rng = np.random.default_rng(1)
+    exp = rng.normal(6, 1, 500)
+    act = rng.normal(6.5, 1.2, 300)
+    bins = np.quantile(exp, np.linspace(0, 1, 11))
+    e, _ = np.histogram(exp, bins)
+    a, _ = np.histogram(act, bins)
+    assert psi_from_counts(e, a) == pytest.approx(compute_psi(exp, act, bins))
+
+
+def test_drift_usa_histogramas_do_log():
+    import pandas as pd
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+    from src.utils import DATA_DIR
+
+    pd.DataFrame({"IDADE": [10, 11, 12, 13, 14, 15], "INDE": [5, 6, 7, 5, 6, 7]}).to_csv(
+        DATA_DIR / "train_reference.csv", index=False
+    )
+    client = TestClient(create_app())
+    before = client.get("/drift").json().get("n_production_samples", 0)
+    for idade in (10, 12, 14):
+        assert client.post("/predict", json={"student_id": f"RA-D{idade}", "IDADE": idade, "INDE": 6.0}).status_code == 200
+    routes.flush_prediction_log()
+
+    body = client.get("/drift").json()
+    assert body["n_production_samples"] == before + 3
+    assert "IDADE" in body["psi"]
+    assert "categorical" in body
+
+
+
+def test_drift_janela_recente_e_acumulado():
+    """O /drift padrão olha só os últimos DRIFT_WINDOW_DAYS; days=0 usa todo o histórico."""
+    import json
+    import time
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+
+    client = TestClient(create_app())
+    assert client.post("/predict", json={"student_id": "RA-JAN", "IDADE": 12, "INDE": 6.0}).status_code == 200
+    routes.flush_prediction_log()
+    recent = client.get("/drift").json()
+    total = client.get("/drift", params={"days": 0}).json()
+    quarter = client.get("/drift", params={"days": 90}).json()
+    assert recent["window_days"] == 7 and total["window_days"] == 0
+
+    # predição antiga (ex: importada de outro banco): conta no acumulado, não na janela
+    with routes._db() as conn:
+        conn.execute(
+            "INSERT INTO predictions(ts, student_id, payload, risk_score, risk_class, model_version) VALUES (?, ?, ?, 0.5, 1, 'v')",
+            (int(time.time()) - 60 * 86400, "RA-ANTIGO", json.dumps({"IDADE": 12})),
+        )
+    assert client.get("/drift").json()["n_production_samples"] == recent["n_production_samples"]
+    assert client.get("/drift", params={"days": 0}).json()["n_production_samples"] == total["n_production_samples"] + 1
+    assert client.get("/drift", params={"days": 90}).json()["n_production_samples"] == quarter["n_production_samples"] + 1
+    assert client.get("/drift", params={"days": -1}).status_code == 400
+
+def test_drift_usa_referencia_do_metadata_sem_csv(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+    from src.utils import DATA_DIR
+
+    model, meta = routes.load_artifacts()
+    bins = {"IDADE": [8.0, 11.0, 14.0, 20.0]}
+    meta2 = {**meta, "drift_bins": bins, "drift_reference": {"n_rows": 6, "numeric": {"IDADE": [2, 2, 2]}}}
+    monkeypatch.setattr(routes, "load_artifacts", lambda: (model, meta2))
+
+    ref_csv = DATA_DIR / "train_reference.csv"
+    if ref_csv.exists():
+        ref_csv.unlink()
+
+    client = TestClient(create_app())
+    client.post("/predict", json={"student_id": "RA-REF", "IDADE": 12, "INDE": 6.0})
+    routes.flush_prediction_log()
+
+    body = client.get("/drift").json()
+    assert body["psi"]["IDADE"] is not None
+
+
+def test_drift_history_por_janela():
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+
+    client = TestClient(create_app())
+    assert client.post("/predict", json={"student_id": "RA-HIST", "IDADE": 12, "INDE": 6.0}).status_code == 200
+    routes.flush_prediction_log()
+
+    body = client.get("/drift/history", params={"granularity": "hour", "days": 1}).json()
+    assert body["granularity"] == "hour" and body["days"] == 1
+    last = body["windows"][-1]
+    assert last["n_samples"] >= 1
+    assert last["window_end"] - last["window_start"] == 3600
+    assert set(last["psi"]) <= set(routes.load_artifacts()[1].get("drift_bins", {}))
+
+    assert client.get("/drift/history", params={"granularity": "week"}).status_code == 400
+    for days in (0, -1, routes.DRIFT_HISTORY_MAX_DAYS + 1):
+        assert client.get("/drift/history", params={"days": days}).status_code == 400
+
+
+def test_drift_categorico_no_endpoint(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+    from src.utils import build_category_vocab
+
+    model, meta = routes.load_artifacts()
+    vocab = build_category_vocab({"Escola Pública": 60, "Rede Decisão": 30, "Outra": 10}, top_k=3)
+    meta2 = {
+        **meta,
+        "drift_bins": {"IDADE": [8.0, 11.0, 14.0, 20.0]},
+        "drift_reference": {"n_rows": 100, "numeric": {"IDADE": [2, 2, 2]}, "categorical": {"INSTITUICAO": vocab}},
+    }
+    monkeypatch.setattr(routes, "load_artifacts", lambda: (model, meta2))
+
+    client = TestClient(create_app())
+    for i in range(5):
+        client.post("/predict", json={"student_id": f"RA-CAT{i}", "IDADE": 12, "INDE": 6.0, "INSTITUICAO": "Escola Nova"})
+    routes.flush_prediction_log()
+
+    inst = client.get("/drift").json()["categorical"]["INSTITUICAO"]
+    assert inst["unseen_rate"] > 0
+    assert inst["psi"] > 0.25
+    assert inst["p_value"] < 0.01
+    assert inst["production"]["__unseen__"] >= 5
+
+
+def test_scheduler_publica_gauges():
+    import time
+    from prometheus_client import REGISTRY
+    from app.monitoring import DriftScheduler
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {
+            "n_production_samples": 7,
+            "psi": {"IDADE": 0.3, "INDE": None},
+            "categorical": {"PEDRA": {"psi": 0.05}},
+            "risk_score_psi": 0.12,
+        }
+
+    sched = DriftScheduler(compute, interval=0.05)
+    try:
+        deadline = time.time() + 2
+        while len(calls) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        sched.close()
+
+    assert len(calls) >= 2
+    assert sched.latest["computed_at"] > 0
+    value = REGISTRY.get_sample_value
+    assert value("drift_psi", {"feature": "IDADE", "kind": "numeric"}) == pytest.approx(0.3)
+    assert value("drift_psi", {"feature": "PEDRA", "kind": "categorical"}) == pytest.approx(0.05)
+    assert value("drift_psi", {"feature": "risk_score", "kind": "prediction"}) == pytest.approx(0.12)
+    assert value("drift_production_samples") == 7
+
+
+def test_scheduler_espera_o_ready():
+    import threading
+    import time
+    from app.monitoring import DriftScheduler
+
+    ready, calls = threading.Event(), []
+    sched = DriftScheduler(lambda: calls.append(1) or {}, interval=0.05, publish=lambda r: None, ready=ready)
+    try:
+        time.sleep(0.2)
+        assert calls == []
+        ready.set()
+        deadline = time.time() + 2
+        while not calls and time.time() < deadline:
+            time.sleep(0.01)
+        assert calls
+    finally:
+        sched.close()
+
+
+def test_drift_em_background_no_lifespan(monkeypatch):
+    import time
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+
+    monkeypatch.setenv("DRIFT_REFRESH_SECONDS", "0.05")
+    with TestClient(create_app()) as client:
+        assert client.post("/predict", json={"student_id": "RA-SCHED", "IDADE": 12, "INDE": 6.0}).status_code == 200
+        routes.flush_prediction_log()
+        deadline = time.time() + 3
+        body = client.get("/drift").json()
+        while "computed_at" not in body and time.time() < deadline:
+            time.sleep(0.05)
+            body = client.get("/drift").json()
+
+        assert "computed_at" in body
+        assert "risk_score_psi" in body
+        assert "drift_psi" in client.get("/metrics").text
+    assert routes._drift_scheduler is None
+
+
+@pytest.mark.parametrize("executor", ["inline", "process"])
+def test_drift_distribution(monkeypatch, executor):
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+
+    monkeypatch.setenv("DRIFT_TESTS_EXECUTOR", executor)
+    client = TestClient(create_app())
+    for i in range(5):
+        client.post("/predict", json={"student_id": f"RA-KS{i}", "IDADE": 10 + i, "INDE": 6.0})
+    routes.flush_prediction_log()
+
+    try:
+        body = client.get("/drift/distribution").json()
+    finally:
+        routes.shutdown_drift_pool()
+    assert body["n_reservoir"] >= 5
+    idade = body["features"]["IDADE"]
+    assert 0 <= idade["ks"] <= 1
+    assert idade["wasserstein"] >= 0
+    assert "mean_production" in idade
+
+
+def test_payload_tipado_sem_json(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+
+    monkeypatch.setenv("PREDICTION_PAYLOAD_JSON", "0")
+    client = TestClient(create_app())
+    assert client.post("/predict", json={"student_id": "RA-TYPED", "IDADE": 13, "INDE": 6.5, "FASE_TURMA": "3A"}).status_code == 200
+    routes.flush_prediction_log()
+
+    conn = routes._db()
+    assert conn.execute("SELECT payload FROM predictions WHERE student_id = 'RA-TYPED'").fetchone()[0] == ""
+    latest = client.get("/explain", params={"student_id": "RA-TYPED"}).json()["latest"]
+    assert latest["payload"]["IDADE"] == 13.0
+    assert latest["payload"]["INDE"] == 6.5
+    assert latest["payload"]["FASE_TURMA"] == "3A"
+
+    body = client.get("/analytics/features").json()
+    assert body["numeric"]["IDADE"]["count"] >= 1
+    assert body["categorical"]["FASE_TURMA"]["3A"] >= 1
+    assert sum(body["histograms"]["IDADE"]["counts"]) >= 1
+    assert len(client.get("/analytics/features", params={"top": 1}).json()["categorical"]["FASE_TURMA"]) <= 1
+    for top in (0, -1, 1001):
+        assert client.get("/analytics/features", params={"top": top}).status_code == 400
+
+
+def test_catch_up_usa_colunas_tipadas(store):
+    from app.store import ensure_feature_columns, insert_features
+
+    plan = FeaturePlan.from_metadata(META)
+    agg = DriftAggregator(META, plan)
+    conn = store.connection()
+    with conn:
+        # payload JSON vazio: só as colunas tipadas têm os valores
+        conn.executemany(
+            "INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(i, "x", "", 0.1, 0, "t", "[]") for i in range(len(PAYLOADS))],
+        )
+        ensure_feature_columns(conn, plan.feature_order, plan.categorical)
+        insert_features(conn, 1, list(range(len(PAYLOADS))), plan.feature_order, plan.rows(PAYLOADS))
+
+    n, counts = agg.snapshot(conn)
+    assert n == len(PAYLOADS)
+    assert counts["IDADE"].tolist() == [1, 1, 2]
+    assert counts["INDE"].tolist() == [1, 1, 2]
@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app.prediction_log import PredictionLogWriter
+
+
+def _row(i):
+    return (i, f"s{i}", "{}", 0.5, 0, "v", "[]")
+
+
+def test_writer_grava_em_lote_e_flush():
+    batches = []
+    writer = PredictionLogWriter(batches.append, batch_size=50)
+    writer.submit([_row(i) for i in range(120)])
+    writer.flush()
+    assert sum(len(b) for b in batches) == 120
+    assert max(len(b) for b in batches) <= 50
+    writer.close()
+
+
+def _slow_writer(tmp_path, overflow):
+    gate = threading.Event()
+    written = []
+
+    def sink(rows):
+        gate.wait(5)
+        written.extend(rows)
+
+    writer = PredictionLogWriter(sink, maxsize=2, batch_size=1, overflow=overflow, spill_path=tmp_path / "spill.ndjson")
+    return writer, gate, written
+
+
+def test_writer_drop_descarta_excedente(tmp_path):
+    writer, gate, written = _slow_writer(tmp_path, "drop")
+    writer.submit([_row(i) for i in range(10)])
+    gate.set()
+    writer.close()
+    assert 0 < len(written) < 10
+
+
+def test_writer_spill_nao_perde_linhas(tmp_path):
+    writer, gate, written = _slow_writer(tmp_path, "spill")
+    writer.submit([_row(i) for i in range(10)])
+    assert (tmp_path / "spill.ndjson").exists()
+    gate.set()
+    writer.close()
+    assert sorted(r[0] for r in written) == list(range(10))
+    assert not (tmp_path / "spill.ndjson").exists()
+
+
+def test_writer_repete_lote_com_banco_travado(tmp_path):
+    written, calls = [], []
+
+    def sink(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        written.extend(rows)
+
+    writer = PredictionLogWriter(sink, batch_size=50, retry_backoff=0.01, spill_path=tmp_path / "spill.ndjson")
+    writer.submit([_row(i) for i in range(5)])
+    writer.flush()
+    writer.close()
+    assert len(calls) == 2
+    assert sorted(r[0] for r in written) == list(range(5))
+    assert not (tmp_path / "spill.ndjson").exists()
+
+
+def test_writer_manda_para_o_spill_quando_as_tentativas_acabam(tmp_path):
+    written, locked = [], threading.Event()
+    locked.set()
+
+    def sink(rows):
+        if locked.is_set():
+            raise sqlite3.OperationalError("database is locked")
+        written.extend(rows)
+
+    writer = PredictionLogWriter(sink, batch_size=50, retries=1, retry_backoff=0.01, spill_path=tmp_path / "spill.ndjson")
+    writer.submit([_row(i) for i in range(5)])
+    writer._queue.join()
+    assert (tmp_path / "spill.ndjson").exists() and written == []
+
+    locked.clear()
+    writer.flush()
+    writer.close()
+    assert sorted(r[0] for r in written) == list(range(5))
+    assert not (tmp_path / "spill.ndjson").exists()
+
+
+def test_writer_politica_invalida():
+    with pytest.raises(ValueError):
+        PredictionLogWriter(lambda rows: None, overflow="ignorar")
+
+
+def test_predict_grava_log_em_background():
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+
+    with TestClient(create_app()) as client:
+        r = client.post("/predict", json={"student_id": "RA-LOG-1", "IDADE": 12, "INDE": 7.0})
+        assert r.status_code == 200
+        routes.flush_prediction_log()
+        conn = sqlite3.connect(routes.DB_PATH)
+        n = conn.execute("SELECT COUNT(*) FROM predictions WHERE student_id = 'RA-LOG-1'").fetchone()[0]
+        conn.close()
+        assert n >= 1
+        assert "prediction_log_queue_depth" in client.get("/metrics").text
+    # lifespan encerra e drena o writer
+    assert routes._log_writer is None
@@ -0,0 +1,159 @@
+import gzip
+import json
+
+import pytest
+
+from app.retention import archive_old_predictions, archived_history, iter_archived
+from app.store import SQLiteStore, ensure_feature_columns, insert_features
+
+DAY = 86400
+NOW = 100 * DAY
+
+
+@pytest.fixture()
+def store(tmp_path):
+    s = SQLiteStore(tmp_path / "p.sqlite")
+    yield s
+    s.close()
+
+
+def _fill(conn, n_days=10, per_day=3):
+    rows = [
+        (NOW - d * DAY - i, f"RA-{i}", json.dumps({"IDADE": 10 + i}), 0.1 * i, i % 2, "t", "[]")
+        for d in range(n_days)
+        for i in range(per_day)
+    ]
+    with conn:
+        conn.executemany("INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        ensure_feature_columns(conn, ["IDADE"], set())
+        insert_features(conn, 1, [r[0] for r in rows], ["IDADE"], [[10.0 + int(r[1][3:])] for r in rows])
+    return rows
+
+
+def test_arquiva_particiona_e_remove(store, tmp_path):
+    conn = store.connection()
+    _fill(conn)
+    archive = tmp_path / "archive"
+
+    stats = archive_old_predictions(conn, archive, max_age_days=5, now=NOW, chunk=4)
+    # dias 0..4 (ts > NOW - 5 dias) ficam; 6..9 e o dia 5 (ts < cutoff) vão para o arquivo
+    remaining = conn.execute("SELECT COUNT(*), MIN(ts) FROM predictions").fetchone()
+    assert remaining[1] >= NOW - 5 * DAY
+    assert stats["archived_rows"] + remaining[0] == 30
+    assert conn.execute("SELECT COUNT(*) FROM prediction_features").fetchone()[0] == remaining[0]
+
+    parts = sorted(archive.glob("date=*/part-*.ndjson.gz"))
+    assert parts and all(p.parent.name.startswith("date=") for p in parts)
+    with gzip.open(parts[0], "rt") as f:
+        rec = json.loads(f.readline())
+    assert set(rec) == {"ts", "student_id", "payload", "risk_score", "risk_class", "model_version", "top_factors", "rowid"}
+
+    archived = list(iter_archived(archive))
+    assert len(archived) == stats["archived_rows"]
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    # rodar de novo não arquiva nada
+    assert archive_old_predictions(conn, archive, max_age_days=5, now=NOW)["archived_rows"] == 0
+
+
+def test_historico_arquivado_por_aluno_com_cursor(store, tmp_path):
+    conn = store.connection()
+    _fill(conn)
+    archive = tmp_path / "archive"
+    archive_old_predictions(conn, archive, max_age_days=5, now=NOW)
+
+    page = archived_history(archive, "RA-1", limit=2)
+    assert [r["student_id"] for r in page] == ["RA-1", "RA-1"]
+    assert page[0]["ts"] > page[1]["ts"]
+    older = archived_history(archive, "RA-1", limit=10, before=(page[-1]["ts"], page[-1]["rowid"]))
+    assert all(r["ts"] < page[-1]["ts"] for r in older)
+    assert len(page) + len(older) == len([r for r in iter_archived(archive) if r["student_id"] == "RA-1"])
+
+
+
+def test_historico_arquivado_para_de_ler_particoes_antigas(store, tmp_path, monkeypatch):
+    from app import retention
+
+    conn = store.connection()
+    _fill(conn)
+    archive = tmp_path / "archive"
+    archive_old_predictions(conn, archive, max_age_days=1, now=NOW)
+    expected = sorted(
+        (r for r in iter_archived(archive) if r["student_id"] == "RA-1"),
+        key=lambda r: (r["ts"], r["rowid"]),
+        reverse=True,
+    )
+
+    read = []
+    real = retention._read_partition
+    monkeypatch.setattr(retention, "_read_partition", lambda path: read.append(path) or real(path))
+    page = archived_history(archive, "RA-1", limit=2)
+    assert page == expected[:2]
+    # um registro do aluno por dia: só as partições dos dois dias mais recentes são lidas
+    assert len(read) == 2 < len(list(archive.glob("date=*/part-*")))
+
+
+def test_conversao_de_vacuum_so_pela_cli(tmp_path):
+    import sqlite3
+
+    db = tmp_path / "old.sqlite"
+    raw = sqlite3.connect(db)  # banco antigo: criado sem auto_vacuum=INCREMENTAL
+    raw.execute("CREATE TABLE predictions (ts INTEGER, payload TEXT, risk_score REAL, risk_class INTEGER, model_version TEXT)")
+    raw.commit()
+    raw.close()
+    old = SQLiteStore(db)
+    try:
+        conn = old.connection()
+        _fill(conn)
+        stats = archive_old_predictions(conn, tmp_path / "a", max_age_days=5, now=NOW)
+        assert stats["archived_rows"] and not stats["vacuum_converted"]
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+
+        stats = archive_old_predictions(conn, tmp_path / "a", max_age_days=5, now=NOW, convert_vacuum=True)
+        assert stats["vacuum_converted"]
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    finally:
+        old.close()
+
+def test_formato_invalido(store, tmp_path):
+    with pytest.raises(ValueError):
+        archive_old_predictions(store.connection(), tmp_path, 1, fmt="csv")
+
+
+def test_parquet(store, tmp_path):
+    pytest.importorskip("pyarrow")
+    conn = store.connection()
+    _fill(conn)
+    stats = archive_old_predictions(conn, tmp_path / "a", max_age_days=5, fmt="parquet", now=NOW)
+    assert stats["format"] == "parquet"
+    assert len(list(iter_archived(tmp_path / "a"))) == stats["archived_rows"]
+
+
+def test_explain_continua_no_arquivo(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    from app import routes
+    from app.main import create_app
+
+    archive = tmp_path / "archive"
+    monkeypatch.setenv("PREDICTION_ARCHIVE_DIR", str(archive))
+    client = TestClient(create_app())
+    sid = "RA-ARCH"
+    conn = routes._db()
+    with conn:
+        conn.executemany(
+            "INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(1000 + i, sid, json.dumps({"IDADE": 12}), 0.5, 1, "t", "[]") for i in range(3)],
+        )
+    routes.flush_prediction_log()
+    archive_old_predictions(conn, archive, max_age_days=1)  # arquiva as linhas com ts antigo
+    assert client.post("/predict", json={"student_id": sid, "IDADE": 12}).status_code == 200
+    routes.flush_prediction_log()
+
+    hot = client.get("/explain", params={"student_id": sid, "limit": 10}).json()
+    assert hot["count"] == 1
+    full = client.get("/explain", params={"student_id": sid, "limit": 2, "include_archive": True}).json()
+    assert full["count"] == 2
+    nxt = client.get(
+        "/explain", params={"student_id": sid, "limit": 10, "include_archive": True, "cursor": full["next_cursor"]}
+    ).json()
+    assert [h["ts"] for h in nxt["history"]] == [1001, 1000]
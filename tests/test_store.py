@@ -0,0 +1,237 @@
+import sqlite3
+import threading
+
+from app.store import (
+    MIGRATIONS,
+    SQLiteStore,
+    _migration_8_cohort_rollups,
+    cohort_bucket,
+    cohort_rollups,
+    update_cohorts,
+)
+
+
+def test_store_wal_e_conexao_persistente(tmp_path):
+    store = SQLiteStore(tmp_path / "p.sqlite", busy_timeout_ms=1234)
+    conn = store.connection()
+    assert store.connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    store.close()
+
+
+def test_store_conexao_por_thread(tmp_path):
+    store = SQLiteStore(tmp_path / "p.sqlite")
+    main_conn = store.connection()
+    other = []
+    t = threading.Thread(target=lambda: other.append(store.connection()))
+    t.start()
+    t.join()
+    assert other[0] is not main_conn
+    store.close()
+
+
+def test_store_migra_schema_antigo(tmp_path):
+    db = tmp_path / "old.sqlite"
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE predictions (ts INTEGER, payload TEXT, risk_score REAL, risk_class INTEGER, model_version TEXT)")
+    conn.commit()
+    conn.close()
+
+    store = SQLiteStore(db)
+    cols = {r[1] for r in store.connection().execute("PRAGMA table_info(predictions)")}
+    assert {"student_id", "top_factors"} <= cols
+    store.close()
+
+
+
+def test_migracao_concorrente_aplica_cada_passo_uma_vez(tmp_path, monkeypatch):
+    """Dois workers migrando o mesmo arquivo: o segundo espera o lock e pula o passo já aplicado."""
+    import time
+
+    from app import store as store_mod
+
+    db = tmp_path / "p.sqlite"
+    conn = sqlite3.connect(db)
+    store_mod.migrate(conn)
+    conn.executemany(
+        "INSERT INTO predictions(ts, student_id, payload, risk_score, risk_class, model_version) VALUES (?, ?, ?, ?, ?, 'v')",
+        [(100, f"A{i}", '{"PEDRA": "Ametista"}', 0.9, 1) for i in range(3)],
+    )
+    conn.execute("DELETE FROM cohort_rollup")
+    k = MIGRATIONS.index(store_mod._migration_8_cohort_rollups)
+    conn.execute(f"PRAGMA user_version = {k}")
+    conn.commit()
+    conn.close()
+
+    def slow(c):
+        time.sleep(0.2)
+        store_mod._migration_8_cohort_rollups(c)
+
+    monkeypatch.setattr(store_mod, "MIGRATIONS", MIGRATIONS[:k] + [slow] + MIGRATIONS[k + 1:])
+    errors = []
+
+    def worker():
+        c = sqlite3.connect(db, timeout=5)
+        try:
+            store_mod.migrate(c)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            c.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    conn = sqlite3.connect(db)
+    n = conn.execute(
+        "SELECT SUM(n) FROM cohort_rollup WHERE dimension = 'PEDRA' AND granularity = 'day'"
+    ).fetchone()[0]
+    conn.close()
+    assert n == 3
+
+def test_store_reconecta_quando_arquivo_e_substituido(tmp_path):
+    db = tmp_path / "p.sqlite"
+    store = SQLiteStore(db)
+    store.connection().execute(
+        "INSERT INTO predictions VALUES (1, 's', '{}', 0.1, 0, 'v', '[]')"
+    )
+    store.connection().commit()
+
+    store.close()
+    db.unlink()
+    conn = store.connection()
+    assert conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] == 0
+    store.close()
+
+
+def test_store_indices_usados_pelas_consultas(tmp_path):
+    store = SQLiteStore(tmp_path / "p.sqlite")
+    conn = store.connection()
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_predictions_student_ts", "idx_predictions_ts"} <= names
+
+    plan = " ".join(str(r) for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT ts FROM predictions WHERE student_id = ? ORDER BY ts DESC, rowid DESC LIMIT 10",
+        ("s",),
+    ))
+    assert "idx_predictions_student_ts" in plan
+    assert "TEMP B-TREE" not in plan
+
+    plan = " ".join(str(r) for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT payload FROM predictions ORDER BY ts DESC LIMIT 10"
+    ))
+    assert "idx_predictions_ts" in plan
+    store.close()
+
+
+def test_prediction_features_tipadas_e_agregados_no_sql(tmp_path):
+    import numpy as np
+    import pytest
+    from app.store import (
+        category_counts,
+        ensure_feature_columns,
+        feature_histogram,
+        feature_summary,
+        insert_features,
+        load_features,
+    )
+
+    store = SQLiteStore(tmp_path / "p.sqlite")
+    conn = store.connection()
+    cols = ["IDADE", "INDE", "FASE_TURMA"]
+    rows = [[9.0, 4.0, "1A"], [12.0, float("nan"), "1A"], [20.0, 9.0, "2B"], [30.0, 7.0, float("nan")]]
+    with conn:
+        ensure_feature_columns(conn, cols, {"FASE_TURMA"})
+        ensure_feature_columns(conn, cols, {"FASE_TURMA"})  # idempotente
+        insert_features(conn, 1, [100, 100, 200, 300], cols, rows)
+
+    types = {r[1]: r[2] for r in conn.execute("PRAGMA table_info(prediction_features)")}
+    assert types["IDADE"] == "REAL" and types["FASE_TURMA"] == "TEXT"
+
+    summary = feature_summary(conn, ["IDADE", "INDE", "NAO_EXISTE"])
+    assert summary["n_rows"] == 4
+    assert summary["numeric"]["INDE"]["missing"] == 1
+    assert summary["numeric"]["IDADE"]["mean"] == pytest.approx(17.75)
+    assert "NAO_EXISTE" not in summary["numeric"]
+    assert feature_summary(conn, ["IDADE"], since=200)["n_rows"] == 2
+
+    assert category_counts(conn, "FASE_TURMA") == {"1A": 2, "2B": 1, "nan": 1}
+
+    edges = [8, 11, 14, 20]
+    expected, _ = np.histogram([9, 12, 20, 30], bins=edges)
+    assert feature_histogram(conn, "IDADE", edges) == expected.tolist()
+
+    assert load_features(conn, [2]) == {2: {"IDADE": 12.0, "FASE_TURMA": "1A"}}
+
+    with pytest.raises(ValueError):
+        ensure_feature_columns(conn, ['x"; DROP TABLE predictions; --'], set())
+    store.close()
+
+
+def test_student_latest_preenchido_na_migracao(tmp_path):
+    db = tmp_path / "old.sqlite"
+    conn = sqlite3.connect(db)
+    conn.execute(
+        "CREATE TABLE predictions (ts INTEGER, student_id TEXT, payload TEXT, risk_score REAL, risk_class INTEGER, model_version TEXT, top_factors TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO predictions VALUES (?, ?, '{}', ?, ?, 'v', '[]')",
+        [(1, "a", 0.9, 1), (2, "a", 0.4, 0), (2, "a", 0.6, 1), (1, "b", 0.7, 1), (5, None, 0.1, 0)],
+    )
+    conn.commit()
+    conn.close()
+
+    store = SQLiteStore(db)
+    rows = store.connection().execute(
+        "SELECT student_id, ts, pred_rowid, risk_score FROM student_latest ORDER BY student_id"
+    ).fetchall()
+    # empate de ts: vence o maior rowid
+    assert rows == [("a", 2, 3, 0.6), ("b", 1, 4, 0.7)]
+    plan = " ".join(
+        r[-1] for r in store.connection().execute(
+            "EXPLAIN QUERY PLAN SELECT student_id FROM student_latest WHERE risk_class = 1 AND risk_score >= 0 "
+            "ORDER BY risk_score DESC, student_id LIMIT 10"
+        )
+    )
+    assert "idx_student_latest_risk" in plan and "TEMP B-TREE" not in plan
+    store.close()
+
+
+def test_rollup_de_coortes_incremental_e_backfill(tmp_path):
+    db = tmp_path / "old.sqlite"
+    conn = sqlite3.connect(db)
+    conn.execute(
+        "CREATE TABLE predictions (ts INTEGER, student_id TEXT, payload TEXT, risk_score REAL, risk_class INTEGER, model_version TEXT, top_factors TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO predictions VALUES (?, 's', ?, ?, ?, 'v', '[]')",
+        [(10, '{"FASE_TURMA": "3-A"}', 0.8, 1), (20, '{"FASE_TURMA": "3-A"}', 0.2, 0), (30, "", 0.5, 1)],
+    )
+    conn.commit()
+    conn.close()
+
+    store = SQLiteStore(db)
+    conn = store.connection()
+    # segunda-feira 1970-01-05 00:00 UTC inicia a semana
+    assert cohort_bucket(4 * 86400 + 5, "week") == 4 * 86400
+    assert cohort_bucket(4 * 86400 - 5, "week") == -3 * 86400
+    assert cohort_rollups(conn, "FASE_TURMA", "day") == [("3-A", 0, 2, 1.0, 1), ("__missing__", 0, 1, 0.5, 1)]
+
+    with conn:
+        update_cohorts(conn, [(40, 0.6, 1, {"FASE_TURMA": "3-A", "PEDRA": "Ametista"})])
+    day = {r[0]: r[2:] for r in cohort_rollups(conn, "FASE_TURMA", "day")}
+    assert day["3-A"] == (3, 1.6, 2)
+    assert cohort_rollups(conn, "PEDRA", "week", since=86400 * 30) == []
+
+    # backfill reaplicado (ex: migração repetida): reconstrói, não soma de novo
+    with conn:
+        _migration_8_cohort_rollups(conn)
+    day = {r[0]: r[2:] for r in cohort_rollups(conn, "FASE_TURMA", "day")}
+    assert day["3-A"] == (2, 1.0, 1)
+    store.close()
@@ -42,6 +42,14 @@ def test_train_and_evaluate_end_to_end(tmp_path):
     assert (ARTIFACT_DIR / "metadata.json").exists()
     assert (DATA_DIR / "train_reference.csv").exists()
     assert "auc" in meta["metrics"]
+    ref = meta["drift_reference"]
+    assert set(ref["numeric"]) == set(meta["drift_bins"])
+    # make_bins cobre o intervalo todo do treino: todo valor não-nulo cai em algum bin
+    assert sum(ref["numeric"]["INDE"]) == meta["metrics"]["n_train"]
+    assert sum(ref["categorical"]["FASE_TURMA"]["counts"]) == meta["metrics"]["n_train"]
+    assert sum(ref["risk_score"]) == meta["metrics"]["n_val"]
+    assert len(ref["sample"]["risk_score"]) == meta["metrics"]["n_val"]
+    assert set(ref["sample"]) == set(meta["drift_bins"]) | {"risk_score"}
     xlsx = tmp_path / "mini.xlsx"
     df.to_excel(xlsx, index=False)
     out = evaluate(str(xlsx))
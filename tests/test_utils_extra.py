@@ -39,3 +39,62 @@ def test_compute_psi_normal():
     bins = np.array([0, 0.2, 0.4, 1])
     psi = compute_psi(exp, act, bins)
     assert psi >= 0
+
+
+def test_build_drift_reference():
+    from src.utils import build_drift_reference
+
+    ref = build_drift_reference(
+        {"INDE": [1.0, 2.0, np.nan, 3.0], "IDA": [5.0]},
+        {"INDE": [0.0, 1.5, 3.0], "SEM_DADOS": [0.0, 1.0]},
+        {"PEDRA": ["Ágata", "Ágata", None]},
+    )
+    assert ref["numeric"] == {"INDE": [1, 2]}
+    assert ref["categorical"]["PEDRA"]["categories"] == ["Ágata", "None"]
+    assert ref["categorical"]["PEDRA"]["counts"] == [2, 1, 0, 0]
+    assert ref["n_rows"] == 4
+
+
+def test_category_vocab_limitado():
+    from src.utils import build_category_vocab, category_hash
+
+    freq = {f"ESCOLA-{i}": 1000 - i for i in range(500)}
+    vocab = build_category_vocab(freq, top_k=5, n_hash_buckets=64)
+    assert vocab["categories"] == [f"ESCOLA-{i}" for i in range(5)]
+    assert len(vocab["counts"]) == 7
+    assert sum(vocab["counts"]) == sum(freq.values())
+    # a cauda vira um conjunto de buckets de hash (no máximo n_hash_buckets)
+    assert len(vocab["tail_hashes"]) <= 64
+    assert category_hash("ESCOLA-10", 64) in vocab["tail_hashes"]
+    assert category_hash("x", 64) == category_hash("x", 64)
+
+
+def test_chi_square_from_counts():
+    from src.utils import chi_square_from_counts
+
+    stat, p = chi_square_from_counts([50, 50], [50, 50])
+    assert stat == pytest.approx(0.0)
+    assert p == pytest.approx(1.0)
+    stat, p = chi_square_from_counts([50, 50, 0], [10, 10, 80])
+    assert stat > 100
+    assert p < 1e-6
+    assert chi_square_from_counts([1, 1], [0, 0]) == (0.0, None)
+
+
+def test_ks_e_wasserstein_iguais_ao_scipy():
+    from scipy import stats
+    from src.utils import distribution_tests, ks_2samp, wasserstein_1d
+
+    rng = np.random.default_rng(3)
+    a = rng.normal(0, 1, 700)
+    b = rng.normal(0.3, 1.5, 400)
+    d, p = ks_2samp(a, b)
+    ref = stats.ks_2samp(a, b, method="asymp")
+    assert d == pytest.approx(ref.statistic)
+    assert p == pytest.approx(ref.pvalue, rel=1e-3)
+    assert wasserstein_1d(a, b) == pytest.approx(stats.wasserstein_distance(a, b))
+
+    out = distribution_tests({"x": a, "y": a}, {"x": np.append(b, np.nan), "y": np.array([np.nan])})
+    assert out["x"]["ks"] == pytest.approx(ref.statistic)
+    assert out["x"]["mean_shift_std"] == pytest.approx((b.mean() - a.mean()) / a.std())
+    assert out["y"] is None